@@ -0,0 +1,43 @@
+import re
+
+
+# Whole-VND amount columns, stored as INTEGER, by table
+AMOUNT_COLUMNS = {'departments': 'budget', 'staff': 'basic_salary'}
+
+# Digits in groups of three with one kind of thousands separator:
+# "15.000.000", "15,000,000" or "15 000 000"
+GROUPED_DIGITS = re.compile(r"\d{1,3}([.,\s])\d{3}(?:\1\d{3})*")
+CURRENCY_SUFFIX = re.compile(r"\s*(?:vnđ|vnd|đ)$", re.IGNORECASE)
+
+
+def parse_amount(value):
+    """Return a VND amount typed or stored as text as an int, None if blank.
+
+    Accepts plain digits, thousands separators and a trailing currency
+    unit. A dot or comma followed by exactly three digits is read as a
+    thousands separator, as written in Vietnamese: "1.500" is 1500.
+    Raises ValueError for anything else, including negative or fractional
+    amounts; VND has no minor unit.
+    """
+    if value is None or isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        number = value
+    else:
+        text = CURRENCY_SUFFIX.sub('', str(value).strip())
+        if not text:
+            return None
+        if GROUPED_DIGITS.fullmatch(text):
+            return int(re.sub(r"\D", "", text))
+        try:
+            number = float(text)
+        except ValueError:
+            raise ValueError(f"Not an amount: {value!r}") from None
+    if number < 0 or not number.is_integer():
+        raise ValueError(f"Not a whole, non-negative amount: {value!r}")
+    return int(number)
+
+
+def format_amount(value):
+    """Format an amount with dot thousands separators: 15000000 -> "15.000.000" """
+    return f"{round(value or 0):,}".replace(',', '.')
@@ -0,0 +1,178 @@
+"""Time the application's hot paths against generated databases.
+
+    python benchmark.py --scales 10k 100k 1m --output benchmark.json
+
+Every path runs without Tk. The JSON report holds per-path min, median
+and max milliseconds for each scale, so runs of different versions can be
+compared.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from data_generator import SCALES, generate_database
+from database_manager import DatabaseManager
+from department_manager import department_rows
+from kpi_manager import kpi_rows
+from main_application import assignment_rows, results_rows
+from periods import parse_period, period_filter, period_text, recent_months
+from report_builder import ReportBuilder
+from result_entry import batch_rows
+from staff_manager import staff_rows
+
+
+def consume(rows):
+    """Drain a row iterator, returning how many rows it produced"""
+    return sum(1 for _ in rows)
+
+
+def hot_paths(db, workdir):
+    """Return (name, callable) pairs; each callable returns a row/byte count"""
+    builder = ReportBuilder(db)
+    dept_name = db.execute_query(
+        "SELECT dept_name FROM departments ORDER BY dept_code LIMIT 1")[0][0]
+    backup_path = os.path.join(workdir, 'backup.json')
+    kpi_id, target = db.execute_query(
+        "SELECT id, target_value FROM kpi ORDER BY kpi_code LIMIT 1")[0]
+    targets = [target * 2, target]
+
+    def backup():
+        with open(backup_path, 'w', encoding='utf-8') as f:
+            builder.write_backup(f)
+        return os.path.getsize(backup_path)
+
+    def restore():
+        with open(backup_path, 'r', encoding='utf-8') as f:
+            backup_data = json.load(f)
+        builder.restore_backup(backup_data)
+        return sum(len(rows) for table, rows in backup_data.items() if table != 'backup_date')
+
+    def retarget():
+        # Alternate between two targets so every run rewrites the results
+        targets.reverse()
+        return db.set_kpi_target(kpi_id, targets[0], parse_period('2000')).changed
+
+    return [
+        ('departments.refresh_list', lambda: consume(department_rows(db))),
+        ('departments.search', lambda: consume(department_rows(db, "kinh"))),
+        ('staff.refresh_list', lambda: consume(staff_rows(db))),
+        ('staff.filter', lambda: consume(staff_rows(db, "nguyễn", dept_name))),
+        ('staff.search', lambda: consume(staff_rows(db, "nguyen van an"))),
+        ('kpi.refresh_list', lambda: consume(kpi_rows(db))),
+        ('kpi.filter', lambda: consume(kpi_rows(db, "doanh", dept_name))),
+        ('assignments.refresh_list', lambda: consume(assignment_rows(db))),
+        ('results.refresh_list', lambda: consume(results_rows(db))),
+        ('results.first_page', lambda: consume(results_rows(db, limit=100))),
+        ('results.period_range',
+         lambda: consume(results_rows(db, *period_filter(recent_months(6))))),
+        ('results.batch_grid', lambda: consume(batch_rows(db, period_text(recent_months(1))))),
+        ('kpi.retarget', retarget),
+        ('results.recompute_all', lambda: db.recompute_achievements().changed),
+        ('reports.overview', lambda: len(builder.overview_report())),
+        ('reports.dept_kpi', lambda: len(builder.dept_kpi_report())),
+        ('reports.staff_performance', lambda: len(builder.staff_performance_report())),
+        ('reports.detailed_kpi', lambda: len(builder.detailed_kpi_report())),
+        ('export_all_data', lambda: len(builder.export_csv(workdir))),
+        ('backup', backup),
+        ('restore', restore)
+    ]
+
+
+def time_path(func, repeat):
+    """Run func repeat times and summarize the wall-clock timings"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'min_ms': min(timings),
+        'median_ms': statistics.median(timings),
+        'max_ms': max(timings),
+        'runs': repeat,
+        'result': result
+    }
+
+
+def run_scale(scale, workdir, repeat, profile, only=None):
+    """Generate a database at scale and time every hot path on it"""
+    db_path = os.path.join(workdir, f"benchmark_{scale}.db")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    started = time.perf_counter()
+    counts = generate_database(db_path, scale)
+    generate_ms = (time.perf_counter() - started) * 1000
+
+    db = DatabaseManager(db_path, profile=profile)
+    try:
+        timings = {}
+        for name, func in hot_paths(db, workdir):
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            timings[name] = time_path(func, repeat)
+            print(f"  {scale:>5} {name:<28} {timings[name]['median_ms']:10.1f} ms")
+        return {
+            'rows': counts,
+            'generate_ms': generate_ms,
+            'database_bytes': os.path.getsize(db_path),
+            'timings': timings
+        }
+    finally:
+        db.close()
+
+
+def git_revision():
+    """Current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', nargs='+', choices=sorted(SCALES),
+                        default=['10k', '100k', '1m'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--profile', default='balanced')
+    parser.add_argument('--only', nargs='+', metavar='PREFIX',
+                        help="time only paths whose name starts with PREFIX")
+    parser.add_argument('--workdir', help="where databases and exports go (default: temp dir)")
+    parser.add_argument('--output', default='benchmark.json')
+    args = parser.parse_args()
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'profile': args.profile,
+        'scales': {}
+    }
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = args.workdir or tmpdir
+        os.makedirs(workdir, exist_ok=True)
+        for scale in args.scales:
+            report['scales'][scale] = run_scale(
+                scale, workdir, args.repeat, args.profile, args.only)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import threading
+import traceback
+from collections import namedtuple
+
+
+# keys holds the affected primary keys, or None when they are not known
+# (raw SQL writes, bulk writes without ids, rows removed by a cascade)
+ChangeEvent = namedtuple('ChangeEvent', ['table', 'operation', 'keys'])
+
+OPERATIONS = {'INSERT': 'insert', 'REPLACE': 'insert',
+              'UPDATE': 'update', 'DELETE': 'delete'}
+
+
+def statement_operation(query):
+    """Return insert/update/delete for a write statement"""
+    return OPERATIONS.get(query.lstrip().split(None, 1)[0].upper())
+
+
+class EventBus:
+    """Delivers committed change events to subscribers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def subscribe(self, callback, tables=None):
+        """Call callback(event) for changes to tables (all tables if None)"""
+        with self._lock:
+            self._subscribers.append(
+                (callback, frozenset(tables) if tables else None))
+        return callback
+
+    def unsubscribe(self, callback):
+        """Stop delivering events to callback"""
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s[0] != callback]
+
+    def has_subscribers(self):
+        """Whether publishing would reach anyone"""
+        return bool(self._subscribers)
+
+    def publish(self, events):
+        """Deliver events in order; a failing subscriber does not stop others"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for event in events:
+            for callback, tables in subscribers:
+                if tables is None or event.table in tables:
+                    try:
+                        callback(event)
+                    except Exception:
+                        traceback.print_exc()
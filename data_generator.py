@@ -0,0 +1,254 @@
+"""Fill a database with synthetic departments, staff, KPIs and results.
+
+    python data_generator.py --db scale.db --scale 100k
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+from database_manager import DatabaseManager
+from result_entry import achievement_percentage
+
+
+# Row volumes per scale; the scale name is the number of KPI results
+SCALES = {
+    '10k': {'departments': 20, 'staff': 1000, 'kpis': 200,
+            'assignments_per_kpi': 3, 'results': 10000},
+    '100k': {'departments': 100, 'staff': 10000, 'kpis': 1000,
+             'assignments_per_kpi': 3, 'results': 100000},
+    '1m': {'departments': 300, 'staff': 30000, 'kpis': 10000,
+           'assignments_per_kpi': 3, 'results': 1000000}
+}
+
+FAMILY_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ",
+                "Võ", "Đặng", "Bùi", "Đỗ", "Hồ", "Ngô", "Dương", "Lý"]
+MIDDLE_NAMES = ["Văn", "Thị", "Hữu", "Đức", "Minh", "Thanh", "Ngọc", "Quang",
+                "Hoài", "Thu", "Xuân", "Kim", "Gia", "Bảo"]
+GIVEN_NAMES = ["An", "Bình", "Cường", "Dũng", "Giang", "Hà", "Hải", "Hạnh",
+               "Hiếu", "Hoa", "Hùng", "Hương", "Khánh", "Lan", "Linh", "Long",
+               "Mai", "Nam", "Ngân", "Nhung", "Phong", "Phúc", "Quân", "Quỳnh",
+               "Sơn", "Tâm", "Thảo", "Trang", "Tuấn", "Vân", "Việt", "Yến"]
+DEPARTMENT_NAMES = ["Tài Chính", "Kinh Doanh", "Nhân Sự", "Kế Toán", "Marketing",
+                    "Công Nghệ Thông Tin", "Chăm Sóc Khách Hàng", "Pháp Chế",
+                    "Hành Chính", "Kỹ Thuật", "Sản Xuất", "Kho Vận", "Mua Hàng",
+                    "Kiểm Soát Chất Lượng", "Nghiên Cứu Phát Triển", "Đào Tạo"]
+BRANCHES = ["Hà Nội", "Hồ Chí Minh", "Đà Nẵng", "Hải Phòng", "Cần Thơ", "Huế",
+            "Nha Trang", "Vinh", "Quy Nhơn", "Biên Hòa", "Buôn Ma Thuột",
+            "Thái Nguyên", "Nam Định", "Vũng Tàu", "Hạ Long", "Đà Lạt",
+            "Long Xuyên", "Rạch Giá", "Bắc Ninh"]
+STREETS = ["Lê Lợi", "Trần Hưng Đạo", "Nguyễn Huệ", "Hai Bà Trưng",
+           "Lý Thường Kiệt", "Điện Biên Phủ", "Võ Văn Tần", "Pasteur"]
+KPI_TEMPLATES = [
+    ("Doanh Thu", "VND", 100000000), ("Tỷ Lệ Hài Lòng Khách Hàng", "%", 90),
+    ("Số Hợp Đồng Mới", "Số lượng", 20), ("Chi Phí Vận Hành", "VND", 50000000),
+    ("Tỷ Lệ Giữ Chân Nhân Viên", "%", 95), ("Thời Gian Xử Lý Yêu Cầu", "Giờ", 24),
+    ("Tỷ Lệ Lỗi Sản Phẩm", "%", 2), ("Số Giờ Đào Tạo", "Giờ", 40),
+    ("Điểm Đánh Giá Chất Lượng", "Điểm", 8), ("Tỷ Lệ Hoàn Thành Dự Án", "%", 100)
+]
+CATEGORIES = [("Tài Chính", "KPI liên quan đến tài chính và ngân sách"),
+              ("Kinh Doanh", "KPI liên quan đến bán hàng và khách hàng"),
+              ("Nhân Sự", "KPI liên quan đến quản lý nhân sự"),
+              ("Chất Lượng", "KPI liên quan đến chất lượng sản phẩm/dịch vụ"),
+              ("Vận Hành", "KPI liên quan đến quy trình vận hành")]
+POSITIONS = ["Giám đốc", "Phó giám đốc", "Trưởng phòng", "Phó trưởng phòng",
+             "Chuyên viên chính", "Chuyên viên", "Nhân viên", "Thực tập sinh"]
+EDUCATION_LEVELS = ["Tiến sĩ", "Thạc sĩ", "Đại học", "Cao đẳng", "Trung cấp", "THPT"]
+ROLES = ["owner", "contributor", "reviewer"]
+
+
+def month_periods(count, end=None):
+    """Return count consecutive 'YYYY-MM' periods ending at end's month"""
+    end = end or date.today()
+    index = end.year * 12 + end.month - 1
+    return [f"{i // 12:04d}-{i % 12 + 1:02d}" for i in range(index - count + 1, index + 1)]
+
+
+def department_name(index):
+    """Unique department name: function, branch city, then a counter"""
+    branch, function = divmod(index, len(DEPARTMENT_NAMES))
+    name = f"Phòng {DEPARTMENT_NAMES[function]} - {BRANCHES[branch % len(BRANCHES)]}"
+    if branch >= len(BRANCHES):
+        name += f" {branch // len(BRANCHES) + 1}"
+    return name
+
+
+class DataGenerator:
+    """Deterministic synthetic data for load and benchmark runs"""
+
+    def __init__(self, db_manager, seed=42):
+        self.db = db_manager
+        self.rng = random.Random(seed)
+        self.now = datetime.now()
+        self._last_ids = {}
+
+    def new_id(self, table):
+        """Next integer id for table; the database is empty to begin with"""
+        self._last_ids[table] = self._last_ids.get(table, 0) + 1
+        return self._last_ids[table]
+
+    def new_uuid(self):
+        """Random but reproducible UUID4 string"""
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def random_date(self, start_year, end_year):
+        """ISO date between the start of start_year and the end of end_year"""
+        start = date(start_year, 1, 1)
+        return (start + timedelta(days=self.rng.randrange(
+            (date(end_year, 12, 31) - start).days))).isoformat()
+
+    def full_name(self):
+        """Vietnamese family, middle and given name"""
+        return " ".join((self.rng.choice(FAMILY_NAMES), self.rng.choice(MIDDLE_NAMES),
+                         self.rng.choice(GIVEN_NAMES)))
+
+    def generate(self, departments, staff, kpis, assignments_per_kpi, results):
+        """Insert the requested volumes and return the row count per table"""
+        rng = self.rng
+        created = self.now.isoformat()
+
+        category_ids = [self.new_id('kpi_categories') for _ in CATEGORIES]
+        self.db.insert_many('kpi_categories', ({
+            'id': category_id,
+            'uuid': self.new_uuid(),
+            'category_name': name,
+            'description': description,
+            'created_date': created
+        } for category_id, (name, description) in zip(category_ids, CATEGORIES)))
+
+        dept_ids = [self.new_id('departments') for _ in range(departments)]
+        self.db.insert_many('departments', ({
+            'id': dept_id,
+            'uuid': self.new_uuid(),
+            'dept_code': f"PB{i + 1:04d}",
+            'dept_name': department_name(i),
+            'description': f"Phòng ban số {i + 1}",
+            'manager': self.full_name(),
+            'phone': f"024-{rng.randrange(1000, 9999)}-{rng.randrange(1000, 9999)}",
+            'email': f"pb{i + 1:04d}@company.com",
+            'address': f"Tầng {rng.randrange(1, 30)}",
+            'budget': rng.randrange(100, 5000) * 1000000,
+            'max_staff': max(5, staff * 2 // departments),
+            'created_date': created,
+            'status': 'active'
+        } for i, dept_id in enumerate(dept_ids)))
+
+        staff_ids = [self.new_id('staff') for _ in range(staff)]
+        staff_departments = [dept_ids[i % departments] for i in range(staff)]
+        self.db.insert_many('staff', ({
+            'id': staff_id,
+            'uuid': self.new_uuid(),
+            'staff_code': f"NV{i + 1:06d}",
+            'full_name': self.full_name(),
+            'birth_date': self.random_date(1965, 2002),
+            'gender': rng.choice(["Nam", "Nữ"]),
+            'id_number': f"{rng.randrange(10 ** 11, 10 ** 12)}",
+            'phone': f"09{rng.randrange(10 ** 7, 10 ** 8)}",
+            'email': f"nv{i + 1:06d}@company.com",
+            'address': f"{rng.randrange(1, 500)} Đường {rng.choice(STREETS)}, {rng.choice(BRANCHES)}",
+            'department_id': staff_departments[i],
+            'position': rng.choice(POSITIONS),
+            'education': rng.choice(EDUCATION_LEVELS),
+            'basic_salary': rng.randrange(8, 60) * 1000000,
+            'start_date': self.random_date(2010, self.now.year),
+            'status': 'active' if rng.random() < 0.95 else 'inactive',
+            'created_date': created
+        } for i, staff_id in enumerate(staff_ids)))
+
+        staff_by_department = {}
+        for staff_id, dept_id in zip(staff_ids, staff_departments):
+            staff_by_department.setdefault(dept_id, []).append(staff_id)
+
+        kpi_rows = []
+        for i in range(kpis):
+            name, unit, target = KPI_TEMPLATES[i % len(KPI_TEMPLATES)]
+            kpi_rows.append({
+                'id': self.new_id('kpi'),
+                'uuid': self.new_uuid(),
+                'kpi_code': f"KPI{i + 1:06d}",
+                'kpi_name': f"{name} {i // len(KPI_TEMPLATES) + 1}",
+                'description': f"Chỉ tiêu {name.lower()}",
+                'category_id': rng.choice(category_ids),
+                'department_id': dept_ids[i % departments],
+                'unit': unit,
+                'target_value': target,
+                'weight': rng.choice([10, 15, 20, 25, 30]),
+                'measurement_frequency': "Hàng tháng",
+                'created_date': created,
+                'status': 'active'
+            })
+        self.db.insert_many('kpi', kpi_rows)
+
+        def assignments():
+            for kpi in kpi_rows:
+                members = staff_by_department.get(kpi['department_id'], [])
+                for staff_id in rng.sample(members, min(assignments_per_kpi, len(members))):
+                    yield {
+                        'id': self.new_id('kpi_assignments'),
+                        'uuid': self.new_uuid(),
+                        'kpi_id': kpi['id'],
+                        'staff_id': staff_id,
+                        'assigned_date': (self.now - timedelta(
+                            days=rng.randrange(1, 3650))).isoformat(),
+                        'role': rng.choice(ROLES)
+                    }
+        self.db.insert_many('kpi_assignments', assignments())
+
+        # One result per KPI per month, walking back as many years as needed
+        per_kpi, extra = divmod(results, kpis) if kpis else (0, 0)
+        periods = month_periods(per_kpi + (1 if extra else 0), self.now.date())
+
+        def kpi_results():
+            for i, kpi in enumerate(kpi_rows):
+                count = per_kpi + (1 if i < extra else 0)
+                for period in periods[len(periods) - count:]:
+                    # Rounded before the achievement is computed, as entered
+                    # values are, so recompute_achievements finds none stale
+                    actual = round(kpi['target_value'] * rng.uniform(0.5, 1.3), 2)
+                    yield {
+                        'id': self.new_id('kpi_results'),
+                        'uuid': self.new_uuid(),
+                        'kpi_id': kpi['id'],
+                        'period': period,
+                        'actual_value': actual,
+                        'achievement_percentage': achievement_percentage(actual, kpi['target_value']),
+                        'note': "",
+                        'recorded_by': 'Generator',
+                        'recorded_date': f"{period}-{rng.randrange(1, 29):02d}T09:00:00"
+                    }
+        self.db.insert_many('kpi_results', kpi_results())
+
+        return {table: self.db.execute_query(f"SELECT COUNT(*) FROM {table}")[0][0]
+                for table in ['departments', 'staff', 'kpi_categories',
+                              'kpi', 'kpi_assignments', 'kpi_results']}
+
+
+def generate_database(db_path, scale='10k', seed=42, profile='fast'):
+    """Create db_path filled at the given scale; returns the row counts"""
+    db = DatabaseManager(db_path, profile=profile)
+    try:
+        if db.execute_query("SELECT COUNT(*) FROM departments")[0][0]:
+            raise ValueError(f"{db_path} already contains data")
+        with db.transaction():
+            return DataGenerator(db, seed).generate(**SCALES[scale])
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help="database file to fill")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = generate_database(args.db, args.scale, args.seed)
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+    print(f"Generated in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
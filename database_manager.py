@@ -1,305 +1,1846 @@
+import json
+import math
+import re
 import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, namedtuple
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import chain, islice
+from operator import itemgetter
+
+from amounts import AMOUNT_COLUMNS, parse_amount
+from change_events import ChangeEvent, EventBus, statement_operation
+from periods import (ALL_TIME, GRANULARITY_MONTHS, ROLLUP_GRANULARITIES,
+                     UNKNOWN_GRANULARITY, parse_period, period_target, period_text)
+from query_cache import KeyLookup, QueryCache, table_written, tables_read
+from query_stats import QueryStats
+from text_search import fts5_available, normalize_text, trigrams
+
+
+# Original table layout; every later change ships as a numbered migration
+BASE_SCHEMA = {
+    'departments': '''
+        id TEXT PRIMARY KEY,
+        dept_code TEXT UNIQUE NOT NULL,
+        dept_name TEXT NOT NULL,
+        description TEXT,
+        manager TEXT,
+        phone TEXT,
+        email TEXT,
+        address TEXT,
+        budget TEXT,
+        max_staff INTEGER,
+        created_date TEXT,
+        status TEXT DEFAULT 'active'
+    ''',
+    'staff': '''
+        id TEXT PRIMARY KEY,
+        staff_code TEXT UNIQUE NOT NULL,
+        full_name TEXT NOT NULL,
+        birth_date TEXT,
+        gender TEXT,
+        id_number TEXT,
+        phone TEXT,
+        email TEXT,
+        address TEXT,
+        department_id TEXT,
+        position TEXT,
+        education TEXT,
+        basic_salary TEXT,
+        start_date TEXT,
+        status TEXT DEFAULT 'active',
+        created_date TEXT,
+        FOREIGN KEY (department_id) REFERENCES departments (id)
+    ''',
+    'kpi_categories': '''
+        id TEXT PRIMARY KEY,
+        category_name TEXT UNIQUE NOT NULL,
+        description TEXT,
+        created_date TEXT
+    ''',
+    'kpi': '''
+        id TEXT PRIMARY KEY,
+        kpi_code TEXT UNIQUE NOT NULL,
+        kpi_name TEXT NOT NULL,
+        description TEXT,
+        category_id TEXT,
+        department_id TEXT,
+        unit TEXT,
+        target_value REAL,
+        weight REAL,
+        measurement_frequency TEXT,
+        created_date TEXT,
+        status TEXT DEFAULT 'active',
+        FOREIGN KEY (category_id) REFERENCES kpi_categories (id),
+        FOREIGN KEY (department_id) REFERENCES departments (id)
+    ''',
+    'kpi_assignments': '''
+        id TEXT PRIMARY KEY,
+        kpi_id TEXT,
+        staff_id TEXT,
+        assigned_date TEXT,
+        role TEXT,
+        FOREIGN KEY (kpi_id) REFERENCES kpi (id),
+        FOREIGN KEY (staff_id) REFERENCES staff (id)
+    ''',
+    'kpi_results': '''
+        id TEXT PRIMARY KEY,
+        kpi_id TEXT,
+        period TEXT,
+        actual_value REAL,
+        achievement_percentage REAL,
+        note TEXT,
+        recorded_by TEXT,
+        recorded_date TEXT,
+        FOREIGN KEY (kpi_id) REFERENCES kpi (id)
+    '''
+}
+
+# Child columns whose rows are removed together with their parent row
+CASCADE_FOREIGN_KEYS = {
+    'staff': {'department_id': 'departments'},
+    'kpi': {'department_id': 'departments'},
+    'kpi_assignments': {'kpi_id': 'kpi', 'staff_id': 'staff'},
+    'kpi_results': {'kpi_id': 'kpi'}
+}
+
+
+# Every foreign key column and the table whose id it holds
+FOREIGN_KEYS = {
+    'staff': {'department_id': 'departments'},
+    'kpi': {'category_id': 'kpi_categories', 'department_id': 'departments'},
+    'kpi_assignments': {'kpi_id': 'kpi', 'staff_id': 'staff'},
+    'kpi_results': {'kpi_id': 'kpi'},
+    'kpi_result_history': {'result_id': 'kpi_results'},
+    'kpi_targets': {'kpi_id': 'kpi'},
+    'staff_trigrams': {'staff_id': 'staff'}
+}
+
+# Tables keyed by id, each listed before every table it references
+INTEGER_KEY_ORDER = ['staff_trigrams', 'kpi_results', 'kpi_assignments',
+                     'kpi', 'staff', 'kpi_categories', 'departments']
+
+
+def cascade_dependents(table):
+    """Return every table whose rows a delete from table can remove"""
+    dependents = set()
+    pending = [table]
+    while pending:
+        parent = pending.pop()
+        for child, references in CASCADE_FOREIGN_KEYS.items():
+            if child not in dependents and parent in references.values():
+                dependents.add(child)
+                pending.append(child)
+    return dependents
+
+
+# Secondary indexes for foreign keys and common lookups
+LOOKUP_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_staff_department ON staff (department_id)",
+    "CREATE INDEX IF NOT EXISTS idx_staff_status_code ON staff (status, staff_code)",
+    "CREATE INDEX IF NOT EXISTS idx_departments_name ON departments (dept_name)",
+    "CREATE INDEX IF NOT EXISTS idx_kpi_department ON kpi (department_id)",
+    "CREATE INDEX IF NOT EXISTS idx_kpi_category ON kpi (category_id)",
+    "CREATE INDEX IF NOT EXISTS idx_kpi_status_code ON kpi (status, kpi_code)",
+    "CREATE INDEX IF NOT EXISTS idx_kpi_assignments_kpi_staff ON kpi_assignments (kpi_id, staff_id)",
+    "CREATE INDEX IF NOT EXISTS idx_kpi_assignments_staff ON kpi_assignments (staff_id)",
+    "CREATE INDEX IF NOT EXISTS idx_kpi_assignments_date ON kpi_assignments (assigned_date)",
+    "CREATE INDEX IF NOT EXISTS idx_kpi_results_kpi_period ON kpi_results (kpi_id, period)",
+    "CREATE INDEX IF NOT EXISTS idx_kpi_results_recorded_date ON kpi_results (recorded_date)"
+]
+
+# Columns forms resolve to ids through lookup_id(); each is indexed, so a
+# map loads from one ordered index scan and a change patches it by seeks
+LOOKUP_COLUMNS = {
+    'departments': ('dept_code', 'dept_name'),
+    'kpi_categories': ('category_name',),
+    'kpi': ('kpi_code',),
+    'staff': ('staff_code',)
+}
+
+# Indexes for the list sort orders users pick most; expression indexes must
+# repeat the sort expression of the list exactly for SQLite to use them
+SORT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_staff_name_code ON staff (full_name, staff_code)",
+    "CREATE INDEX IF NOT EXISTS idx_staff_position_code ON staff (COALESCE(position, ''), staff_code)",
+    "CREATE INDEX IF NOT EXISTS idx_staff_salary_code ON staff (COALESCE(CAST(basic_salary AS REAL), 0), staff_code)",
+    "CREATE INDEX IF NOT EXISTS idx_staff_department_code ON staff (department_id, staff_code)",
+    "DROP INDEX IF EXISTS idx_staff_department",
+    "CREATE INDEX IF NOT EXISTS idx_kpi_name_code ON kpi (kpi_name, kpi_code)",
+    "CREATE INDEX IF NOT EXISTS idx_kpi_target_code ON kpi (COALESCE(target_value, 0), kpi_code)"
+]
+
+# Full-text index over KPI text, kept in sync by triggers. It is an
+# external-content table on kpi.rowid, so the text is stored only once.
+KPI_FTS_STATEMENTS = [
+    '''
+    CREATE VIRTUAL TABLE kpi_fts USING fts5(
+        kpi_code, kpi_name, description,
+        content='kpi', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER kpi_fts_insert AFTER INSERT ON kpi BEGIN
+        INSERT INTO kpi_fts (rowid, kpi_code, kpi_name, description)
+        VALUES (new.rowid, new.kpi_code, new.kpi_name, new.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER kpi_fts_delete AFTER DELETE ON kpi BEGIN
+        INSERT INTO kpi_fts (kpi_fts, rowid, kpi_code, kpi_name, description)
+        VALUES ('delete', old.rowid, old.kpi_code, old.kpi_name, old.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER kpi_fts_update AFTER UPDATE OF kpi_code, kpi_name, description ON kpi BEGIN
+        INSERT INTO kpi_fts (kpi_fts, rowid, kpi_code, kpi_name, description)
+        VALUES ('delete', old.rowid, old.kpi_code, old.kpi_name, old.description);
+        INSERT INTO kpi_fts (rowid, kpi_code, kpi_name, description)
+        VALUES (new.rowid, new.kpi_code, new.kpi_name, new.description);
+    END
+    ''',
+    "INSERT INTO kpi_fts (kpi_fts) VALUES ('rebuild')"
+]
+
+# External-content FTS tables by content table; they index rowids, which a
+# table rebuild renumbers
+FTS_INDEXES = {'kpi': 'kpi_fts'}
+
+# Accent-insensitive staff name search. name_normalized holds the unaccented
+# name and staff_trigrams its trigrams; the triggers reset name_normalized to
+# NULL whenever the name may be stale, and _index_staff_names fills both in
+# before the writing transaction commits.
+STAFF_NAME_INDEX_STATEMENTS = [
+    "ALTER TABLE staff ADD COLUMN name_normalized TEXT",
+    '''
+    CREATE TABLE staff_trigrams (
+        trigram TEXT NOT NULL,
+        staff_id TEXT NOT NULL,
+        PRIMARY KEY (trigram, staff_id),
+        FOREIGN KEY (staff_id) REFERENCES staff (id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    ''',
+    "CREATE INDEX idx_staff_trigrams_staff ON staff_trigrams (staff_id)",
+    "CREATE INDEX idx_staff_name_pending ON staff (id) WHERE name_normalized IS NULL",
+    '''
+    CREATE TRIGGER staff_name_insert AFTER INSERT ON staff
+    WHEN new.name_normalized IS NOT NULL BEGIN
+        UPDATE staff SET name_normalized = NULL WHERE rowid = new.rowid;
+    END
+    ''',
+    '''
+    CREATE TRIGGER staff_name_update AFTER UPDATE OF full_name ON staff
+    WHEN new.full_name IS NOT old.full_name BEGIN
+        UPDATE staff SET name_normalized = NULL WHERE rowid = new.rowid;
+    END
+    '''
+]
+
+# Amounts were stored as free text; the migration parses them into INTEGER
+# columns that only accept integers. Values it cannot parse are set to NULL
+# and recorded here with the code of their row.
+AMOUNT_FAILURES_TABLE = '''
+    CREATE TABLE amount_parse_failures (
+        table_name TEXT NOT NULL,
+        row_code TEXT NOT NULL,
+        column_name TEXT NOT NULL,
+        raw_value TEXT,
+        recorded_date TEXT
+    )
+'''
+
+# Numeric sort and aggregate indexes over the converted columns
+AMOUNT_INDEXES = [
+    "DROP INDEX IF EXISTS idx_staff_salary_code",
+    "CREATE INDEX idx_staff_salary_code ON staff (COALESCE(basic_salary, 0), staff_code)",
+    "CREATE INDEX idx_staff_status_salary ON staff (status, basic_salary)"
+]
+
+# Code column naming each row in amount_parse_failures
+AMOUNT_ROW_CODES = {'departments': 'dept_code', 'staff': 'staff_code'}
+
+# departments.staff_count, kept equal to the number of staff rows pointing
+# at the department by triggers on every staff write
+STAFF_COUNT_STATEMENTS = [
+    "ALTER TABLE departments ADD COLUMN staff_count INTEGER NOT NULL DEFAULT 0",
+    '''
+    CREATE TRIGGER staff_count_insert AFTER INSERT ON staff
+    WHEN new.department_id IS NOT NULL BEGIN
+        UPDATE departments SET staff_count = staff_count + 1 WHERE id = new.department_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER staff_count_delete AFTER DELETE ON staff
+    WHEN old.department_id IS NOT NULL BEGIN
+        UPDATE departments SET staff_count = staff_count - 1 WHERE id = old.department_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER staff_count_update AFTER UPDATE OF department_id ON staff
+    WHEN new.department_id IS NOT old.department_id BEGIN
+        UPDATE departments SET staff_count = staff_count - 1 WHERE id = old.department_id;
+        UPDATE departments SET staff_count = staff_count + 1 WHERE id = new.department_id;
+    END
+    '''
+]
+
+# Parsed result periods, next to the period text they were parsed from. As
+# with staff names, the triggers reset period_granularity to NULL whenever
+# the period may be stale and _index_periods fills the columns in before
+# the writing transaction commits.
+PERIOD_INDEX_STATEMENTS = [
+    "ALTER TABLE kpi_results ADD COLUMN period_granularity TEXT",
+    "ALTER TABLE kpi_results ADD COLUMN period_start INTEGER",
+    "ALTER TABLE kpi_results ADD COLUMN period_end INTEGER",
+    "CREATE INDEX idx_kpi_results_period_range ON kpi_results (period_start, period_end)",
+    "CREATE INDEX idx_kpi_results_kpi_period_start ON kpi_results (kpi_id, period_start, period_end)",
+    "CREATE INDEX idx_kpi_results_period_pending ON kpi_results (id) WHERE period_granularity IS NULL",
+    '''
+    CREATE TRIGGER kpi_results_period_insert AFTER INSERT ON kpi_results
+    WHEN new.period_granularity IS NOT NULL BEGIN
+        UPDATE kpi_results SET period_granularity = NULL WHERE rowid = new.rowid;
+    END
+    ''',
+    '''
+    CREATE TRIGGER kpi_results_period_update AFTER UPDATE OF period ON kpi_results
+    WHEN new.period IS NOT old.period BEGIN
+        UPDATE kpi_results SET period_granularity = NULL WHERE rowid = new.rowid;
+    END
+    '''
+]
+
+# Achievement rollups per KPI. Each result counts towards its KPI's
+# ALL_TIME row and towards every month, quarter and year that contains its
+# whole period. Results saved since the last commit are added to the rows
+# they fall in; deleting or changing an indexed result marks its KPI stale
+# and _update_rollups recomputes that KPI's rows before the commit.
+KPI_ROLLUP_STATEMENTS = [
+    '''
+    CREATE TABLE kpi_rollups (
+        kpi_id INTEGER NOT NULL,
+        granularity TEXT NOT NULL,
+        period_start INTEGER NOT NULL,
+        result_count INTEGER NOT NULL,
+        achievement_count INTEGER NOT NULL,
+        achievement_sum REAL NOT NULL,
+        achievement_min REAL,
+        achievement_max REAL,
+        last_recorded_date TEXT,
+        last_achievement REAL,
+        PRIMARY KEY (kpi_id, granularity, period_start)
+    ) WITHOUT ROWID
+    ''',
+    "CREATE INDEX idx_kpi_rollups_period ON kpi_rollups (granularity, period_start)",
+    "CREATE TABLE kpi_rollup_stale (kpi_id INTEGER NOT NULL PRIMARY KEY) WITHOUT ROWID",
+    '''
+    CREATE TRIGGER kpi_rollup_delete AFTER DELETE ON kpi_results
+    WHEN old.period_granularity IS NOT NULL BEGIN
+        INSERT OR IGNORE INTO kpi_rollup_stale VALUES (old.kpi_id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER kpi_rollup_update
+    AFTER UPDATE OF kpi_id, achievement_percentage, recorded_date, period_granularity ON kpi_results
+    WHEN old.period_granularity IS NOT NULL BEGIN
+        INSERT OR IGNORE INTO kpi_rollup_stale VALUES (old.kpi_id), (new.kpi_id);
+    END
+    '''
+]
+
+KPI_ROLLUP_COLUMNS = ('kpi_id, granularity, period_start, result_count, achievement_count, '
+                      'achievement_sum, achievement_min, achievement_max, '
+                      'last_recorded_date, last_achievement')
+
+
+def rollup_aggregate(buckets):
+    """SELECT aggregating bucket rows (kpi_id, granularity, period_start,
+    id, achievement_percentage, recorded_date) into kpi_rollups rows, in
+    KPI_ROLLUP_COLUMNS order"""
+    return f"""
+        SELECT kpi_id, granularity, period_start, COUNT(*), COUNT(achievement_percentage),
+               TOTAL(achievement_percentage), MIN(achievement_percentage),
+               MAX(achievement_percentage), MAX(recorded_date), MAX(last_achievement)
+        FROM (
+            SELECT *, FIRST_VALUE(achievement_percentage) OVER (
+                PARTITION BY kpi_id, granularity, period_start
+                ORDER BY recorded_date DESC, id DESC) AS last_achievement
+            FROM ({buckets})
+        )
+        GROUP BY kpi_id, granularity, period_start
+    """
+
+
+def rollup_query(where="1", params=(), exclude_stale=False):
+    """SELECT computing kpi_rollups rows from the kpi_results rows matching
+    where, and its params. With exclude_stale the rollup rows marked in
+    kpi_rollup_stale are left out.
+    """
+    buckets = [f"SELECT kpi_id, '{ALL_TIME}' AS granularity, 0 AS period_start, "
+               f"id, achievement_percentage, recorded_date "
+               f"FROM kpi_results WHERE kpi_id IS NOT NULL AND {where}"]
+    for granularity in ROLLUP_GRANULARITIES:
+        months = GRANULARITY_MONTHS[granularity]
+        buckets.append(
+            f"SELECT kpi_id, '{granularity}', period_start / {months} * {months}, "
+            f"id, achievement_percentage, recorded_date "
+            f"FROM kpi_results WHERE kpi_id IS NOT NULL AND {where} "
+            f"AND period_end / {months} = period_start / {months}")
+    rows = ' UNION ALL '.join(buckets)
+    if exclude_stale:
+        rows = f"""
+            SELECT * FROM ({rows}) b
+            WHERE NOT EXISTS (SELECT 1 FROM kpi_rollup_stale s
+                              WHERE s.kpi_id = b.kpi_id AND s.granularity = b.granularity
+                                AND s.period_start = b.period_start)
+        """
+    return rollup_aggregate(rows), list(params) * len(buckets)
+
+
+def stale_rollup_query():
+    """SELECT recomputing the kpi_rollups rows marked in kpi_rollup_stale,
+    each from the results of its KPI and period only"""
+    # CROSS JOIN keeps the few stale rows as the outer loop, so each
+    # is one range scan of the (kpi_id, period_start, period_end) index
+    buckets = [f"SELECT s.kpi_id, s.granularity, s.period_start, "
+               f"kr.id, kr.achievement_percentage, kr.recorded_date "
+               f"FROM kpi_rollup_stale s CROSS JOIN kpi_results kr "
+               f"WHERE s.granularity = '{ALL_TIME}' AND kr.kpi_id = s.kpi_id"]
+    for granularity in ROLLUP_GRANULARITIES:
+        last = GRANULARITY_MONTHS[granularity] - 1
+        buckets.append(
+            f"SELECT s.kpi_id, s.granularity, s.period_start, "
+            f"kr.id, kr.achievement_percentage, kr.recorded_date "
+            f"FROM kpi_rollup_stale s CROSS JOIN kpi_results kr "
+            f"WHERE s.granularity = '{granularity}' AND kr.kpi_id = s.kpi_id "
+            f"AND kr.period_start BETWEEN s.period_start AND s.period_start + {last} "
+            f"AND kr.period_end <= s.period_start + {last}")
+    return rollup_aggregate(' UNION ALL '.join(buckets))
+
+
+def stale_rollup_buckets(*rows):
+    """Trigger statement marking the rollup rows that the old or new rows
+    of a trigger count towards as stale, skipping ones already marked"""
+    buckets = []
+    for row in rows:
+        buckets.append(f"SELECT {row}.kpi_id AS kpi_id, '{ALL_TIME}' AS granularity, "
+                       f"0 AS period_start")
+        for granularity in ROLLUP_GRANULARITIES:
+            months = GRANULARITY_MONTHS[granularity]
+            buckets.append(
+                f"SELECT {row}.kpi_id, '{granularity}', {row}.period_start / {months} * {months} "
+                f"WHERE {row}.period_end / {months} = {row}.period_start / {months}")
+    return f"""
+        INSERT INTO kpi_rollup_stale (kpi_id, granularity, period_start)
+        SELECT kpi_id, granularity, period_start FROM ({' UNION '.join(buckets)}) b
+        WHERE kpi_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM kpi_rollup_stale s
+                          WHERE s.kpi_id = b.kpi_id AND s.granularity = b.granularity
+                            AND s.period_start = b.period_start);
+    """
+
+
+# One result per KPI and period. Values a result held before an update
+# overwrote them are kept in kpi_result_history, oldest first, so
+# corrections leave kpi_results at one row per period.
+RESULT_HISTORY_STATEMENTS = [
+    '''
+    CREATE TABLE kpi_result_history (
+        id INTEGER PRIMARY KEY,
+        result_id INTEGER NOT NULL,
+        actual_value REAL,
+        achievement_percentage REAL,
+        note TEXT,
+        recorded_by TEXT,
+        recorded_date TEXT,
+        FOREIGN KEY (result_id) REFERENCES kpi_results (id) ON DELETE CASCADE
+    )
+    ''',
+    "CREATE INDEX idx_kpi_result_history_result ON kpi_result_history (result_id)",
+    '''
+    CREATE TRIGGER kpi_results_history AFTER UPDATE OF actual_value, achievement_percentage, note ON kpi_results
+    WHEN old.actual_value IS NOT new.actual_value
+         OR old.achievement_percentage IS NOT new.achievement_percentage
+         OR old.note IS NOT new.note BEGIN
+        INSERT INTO kpi_result_history (result_id, actual_value, achievement_percentage,
+                                        note, recorded_by, recorded_date)
+        VALUES (old.id, old.actual_value, old.achievement_percentage,
+                old.note, old.recorded_by, old.recorded_date);
+    END
+    '''
+]
+
+# Migration 10 marked KPIs stale with INSERT OR IGNORE, but a trigger runs
+# with the conflict handling of the statement that fired it, so an upsert
+# that wrote the same KPI twice failed. These skip KPIs already marked.
+ROLLUP_STALE_TRIGGERS = [
+    "DROP TRIGGER kpi_rollup_delete",
+    "DROP TRIGGER kpi_rollup_update",
+    '''
+    CREATE TRIGGER kpi_rollup_delete AFTER DELETE ON kpi_results
+    WHEN old.period_granularity IS NOT NULL BEGIN
+        INSERT INTO kpi_rollup_stale
+        SELECT old.kpi_id
+        WHERE old.kpi_id IS NOT NULL
+          AND old.kpi_id NOT IN (SELECT kpi_id FROM kpi_rollup_stale);
+    END
+    ''',
+    '''
+    CREATE TRIGGER kpi_rollup_update
+    AFTER UPDATE OF kpi_id, achievement_percentage, recorded_date, period_granularity ON kpi_results
+    WHEN old.period_granularity IS NOT NULL BEGIN
+        INSERT INTO kpi_rollup_stale
+        SELECT kpi_id FROM (SELECT old.kpi_id AS kpi_id UNION SELECT new.kpi_id)
+        WHERE kpi_id IS NOT NULL
+          AND kpi_id NOT IN (SELECT kpi_id FROM kpi_rollup_stale);
+    END
+    '''
+]
+
+
+# Marking whole KPIs stale made saving one period for many KPIs recompute
+# all of their history. Rollup rows are now marked stale one by one: the
+# rows the changed result counted towards, and for a KPI change the rows
+# it counts towards next.
+ROLLUP_BUCKET_STALE_STATEMENTS = [
+    "DROP TRIGGER kpi_rollup_delete",
+    "DROP TRIGGER kpi_rollup_update",
+    "DROP TABLE kpi_rollup_stale",
+    '''
+    CREATE TABLE kpi_rollup_stale (
+        kpi_id INTEGER NOT NULL,
+        granularity TEXT NOT NULL,
+        period_start INTEGER NOT NULL,
+        PRIMARY KEY (kpi_id, granularity, period_start)
+    ) WITHOUT ROWID
+    ''',
+    f'''
+    CREATE TRIGGER kpi_rollup_delete AFTER DELETE ON kpi_results
+    WHEN old.period_granularity IS NOT NULL BEGIN
+        {stale_rollup_buckets('old')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER kpi_rollup_update
+    AFTER UPDATE OF kpi_id, achievement_percentage, recorded_date, period_granularity ON kpi_results
+    WHEN old.period_granularity IS NOT NULL BEGIN
+        {stale_rollup_buckets('old', 'new')}
+    END
+    '''
+]
+
+
+# Targets of a KPI by period: each version applies from the month ordinal
+# effective_start until the next one. KPIs whose target never changed for
+# a period have no versions and use kpi.target_value throughout.
+KPI_TARGET_STATEMENTS = [
+    '''
+    CREATE TABLE kpi_targets (
+        id INTEGER PRIMARY KEY,
+        kpi_id INTEGER NOT NULL,
+        effective_start INTEGER NOT NULL,
+        target_value REAL,
+        created_date TEXT,
+        UNIQUE (kpi_id, effective_start),
+        FOREIGN KEY (kpi_id) REFERENCES kpi (id) ON DELETE CASCADE
+    )
+    ''',
+    # Achievements recomputed for a new target are not corrections; only
+    # entered values go to the history
+    "DROP TRIGGER kpi_results_history",
+    '''
+    CREATE TRIGGER kpi_results_history AFTER UPDATE OF actual_value, note ON kpi_results
+    WHEN old.actual_value IS NOT new.actual_value OR old.note IS NOT new.note BEGIN
+        INSERT INTO kpi_result_history (result_id, actual_value, achievement_percentage,
+                                        note, recorded_by, recorded_date)
+        VALUES (old.id, old.actual_value, old.achievement_percentage,
+                old.note, old.recorded_by, old.recorded_date);
+    END
+    '''
+]
+
+# (id, achievement) for the results matching the query's {where} whose
+# stored achievement differs from the one computed from their period's
+# target, as result_entry.achievement_percentage computes it
+STALE_ACHIEVEMENTS = f"""
+    SELECT id, achievement FROM (
+        SELECT id, stored, CASE WHEN target > 0 THEN actual_value / target * 100 ELSE 0 END AS achievement
+        FROM (
+            SELECT kr.id, kr.actual_value, kr.achievement_percentage AS stored,
+                   COALESCE(NULLIF({period_target('kr.period_start')}, 0), 1) AS target
+            FROM kpi_results kr
+            JOIN kpi k ON k.id = kr.kpi_id
+            WHERE kr.actual_value IS NOT NULL AND {{where}}
+        )
+    )
+    WHERE achievement IS NOT stored
+"""
+
+# Rows recompute_achievements rewrote and the seconds it took
+RecomputeResult = namedtuple('RecomputeResult', ['changed', 'seconds'])
+
+
+def rollup_values_equal(first, second):
+    """Compare two kpi_rollups value tuples, allowing float rounding in the
+    sums that incremental updates add up in a different order"""
+    if first is None or second is None:
+        return first is second
+    return all(a == b or isinstance(a, float) and isinstance(b, float) and math.isclose(a, b)
+               for a, b in zip(first, second))
+
+
+# Tables that triggers, or cascades to tables without events, write when a
+# table is written; their cached results are invalidated along with it.
+# kpi_result_history is filled by a trigger and follows its result on delete;
+# kpi_targets follows its KPI.
+TRIGGER_WRITES = {'staff': {'departments'}, 'kpi': {'kpi_targets'},
+                  'kpi_results': {'kpi_result_history'}}
+
+# Connection settings applied to every pooled connection. "safe" keeps the
+# rollback journal, which is the only mode that works on network shares, and
+# is the default since the database file usually lives on one; the WAL
+# profiles are for a database on local disk, picked in main_application with
+# --profile or $KPI_DB_PROFILE.
+PERFORMANCE_PROFILES = {
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 5000
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000
+    },
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000
+    }
+}
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections shared across threads"""
+
+    def __init__(self, db_path, max_connections=4, timeout=30.0, on_connect=None):
+        self.db_path = db_path
+        self.on_connect = on_connect
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle = []
+        self._all = []
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.connections_opened = 0
+        self.reuse_hits = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _open(self):
+        """Open a new connection usable from any thread"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        if self.on_connect:
+            self.on_connect(conn)
+        return conn
+
+    @contextmanager
+    def connection(self, dedicated=False):
+        """Lease a connection for the calling thread.
+
+        Nested leases on the same thread share one connection, and a thread
+        gets its previous connection back when it is still idle. A dedicated
+        lease always takes a separate connection, e.g. for a long read.
+        """
+        if dedicated:
+            conn = self._checkout()
+            try:
+                yield conn
+            finally:
+                self._checkin(conn)
+            return
+
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            self._checkin(conn)
+
+    def _checkout(self):
+        """Take an idle connection, open a new one or wait for a free slot"""
+        with self._cond:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+
+            started = None
+            while not self._idle and len(self._all) >= self.max_connections:
+                if started is None:
+                    started = time.perf_counter()
+                    self.waits += 1
+                remaining = self.timeout - (time.perf_counter() - started)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    self.wait_time += time.perf_counter() - started
+                    raise sqlite3.OperationalError(
+                        "Timed out waiting for a database connection")
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+            if started is not None:
+                self.wait_time += time.perf_counter() - started
+
+            if self._idle:
+                preferred = getattr(self._local, 'last', None)
+                conn = preferred if preferred in self._idle else self._idle[-1]
+                self._idle.remove(conn)
+                self.reuse_hits += 1
+            else:
+                conn = self._open()
+                self._all.append(conn)
+                self.connections_opened += 1
+
+        self._local.last = conn
+        return conn
+
+    def _checkin(self, conn):
+        """Return a leased connection to the idle list"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if self._closed:
+                conn.close()
+                self._all.remove(conn)
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self):
+        """Close idle connections; leased ones close when returned"""
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+                self._all.remove(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def get_stats(self):
+        """Return pool counters"""
+        with self._cond:
+            return {
+                'max_connections': self.max_connections,
+                'open_connections': len(self._all),
+                'idle_connections': len(self._idle),
+                'connections_opened': self.connections_opened,
+                'reuse_hits': self.reuse_hits,
+                'waits': self.waits,
+                'wait_time': self.wait_time
+            }
 
 
 class DatabaseManager:
-    def __init__(self, db_path="management_system.db"):
+    DEFAULT_CHUNK_SIZE = 1000
+
+    # Tables load_sample_data fills
+    SAMPLE_TABLES = ['kpi_categories', 'departments', 'staff', 'kpi',
+                     'kpi_assignments', 'kpi_results']
+
+    # SQLite virtual machine steps between calls to an iter_query cancel check
+    CANCEL_CHECK_STEPS = 1000
+
+    # (version, description, method) applied in order by migrate()
+    MIGRATIONS = [
+        (1, "Cascade deletes to dependent rows", '_migrate_cascading_foreign_keys'),
+        (2, "Foreign-key and lookup indexes", '_migrate_lookup_indexes'),
+        (3, "Full-text index for KPI search", '_migrate_kpi_fts'),
+        (4, "Trigram index for staff name search", '_migrate_staff_name_index'),
+        (5, "Indexes for sortable list columns", '_migrate_sort_indexes'),
+        (6, "Integer budget and salary columns", '_migrate_amounts'),
+        (7, "Integer keys with UUID external ids", '_migrate_integer_keys'),
+        (8, "Trigger-maintained department staff counts", '_migrate_staff_counts'),
+        (9, "Parsed and indexed KPI result periods", '_migrate_periods'),
+        (10, "Per-period KPI achievement rollups", '_migrate_kpi_rollups'),
+        (11, "One KPI result per period with value history", '_migrate_unique_results'),
+        (12, "Per-period KPI rollup staleness", '_migrate_rollup_buckets'),
+        (13, "KPI target versions by period", '_migrate_kpi_targets'),
+    ]
+
+    def __init__(self, db_path="management_system.db", pool_size=4, profile="safe",
+                 slow_query_ms=100, cache_bytes=8 * 1024 * 1024):
+        if profile not in PERFORMANCE_PROFILES:
+            raise ValueError(f"Unknown performance profile: {profile}")
         self.db_path = db_path
+        self.profile = profile
+        self.pool = ConnectionPool(
+            db_path, pool_size, on_connect=self._configure_connection)
+        self._tx = threading.local()
+        self.query_stats = QueryStats(slow_query_ms)
+        self.cache = QueryCache(cache_bytes)
+        self.lookups = KeyLookup(self._load_lookup)
+        self.events = EventBus()
+        self.events.subscribe(self.lookups.on_change, LOOKUP_COLUMNS)
         self.init_database()
 
+    def close(self):
+        """Close all pooled connections"""
+        self.pool.close()
+
+    def get_pool_stats(self):
+        """Return connection pool counters"""
+        return self.pool.get_stats()
+
+    def get_query_stats(self, order_by='total_ms'):
+        """Return per-statement latency stats keyed by normalized SQL"""
+        return self.query_stats.snapshot(order_by)
+
+    def get_slow_queries(self):
+        """Return logged slow statements with their query plans"""
+        return self.query_stats.slow_queries()
+
+    def reset_query_stats(self):
+        """Clear collected query statistics"""
+        self.query_stats.reset()
+
+    def get_cache_stats(self):
+        """Return result cache hit/miss counters and memory use"""
+        return dict(self.cache.get_stats(), lookup_loads=self.lookups.loads,
+                    lookup_patches=self.lookups.patches)
+
+    def lookup_id(self, table, column, value):
+        """Return the id of the row whose column equals value, or None.
+
+        Served from an in-memory map per LOOKUP_COLUMNS entry, loaded once
+        and patched by the change events of committed writes; for duplicate
+        names the oldest row wins, as an indexed SELECT would return it.
+        Inside a transaction that wrote the table, the map has not seen
+        those writes yet and the row is read directly.
+        """
+        if column not in LOOKUP_COLUMNS.get(table, ()):
+            raise ValueError(f"{table}.{column} is not a lookup column")
+        if getattr(self._tx, 'depth', 0) and table in self._tx.touched:
+            rows = self.execute_query(
+                f"SELECT MIN(id) FROM {table} WHERE {column} = ?", [value])
+            return rows[0][0]
+        return self.lookups.get(table, column, value)
+
+    def _load_lookup(self, table, column, keys=None, values=()):
+        """(value, id) rows of a lookup map: all of them, or with keys the
+        lowest id of each value in values or held by a row in keys"""
+        if keys is None:
+            return self.execute_query(
+                f"SELECT {column}, id FROM {table} ORDER BY {column}, id")
+        return self.execute_query(f"""
+            SELECT {column}, MIN(id) FROM {table}
+            WHERE {column} IN (SELECT value FROM json_each(?))
+               OR {column} IN (SELECT {column} FROM {table}
+                               WHERE id IN (SELECT value FROM json_each(?)))
+            GROUP BY {column}
+        """, [json.dumps(list(values)), json.dumps(list(keys))])
+
     def init_database(self):
-        """Initialize database with all required tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS departments (
-                id TEXT PRIMARY KEY,
-                dept_code TEXT UNIQUE NOT NULL,
-                dept_name TEXT NOT NULL,
-                description TEXT,
-                manager TEXT,
-                phone TEXT,
-                email TEXT,
-                address TEXT,
-                budget TEXT,
-                max_staff INTEGER,
-                created_date TEXT,
-                status TEXT DEFAULT 'active'
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS staff (
-                id TEXT PRIMARY KEY,
-                staff_code TEXT UNIQUE NOT NULL,
-                full_name TEXT NOT NULL,
-                birth_date TEXT,
-                gender TEXT,
-                id_number TEXT,
-                phone TEXT,
-                email TEXT,
-                address TEXT,
-                department_id TEXT,
-                position TEXT,
-                education TEXT,
-                basic_salary TEXT,
-                start_date TEXT,
-                status TEXT DEFAULT 'active',
-                created_date TEXT,
-                FOREIGN KEY (department_id) REFERENCES departments (id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS kpi_categories (
-                id TEXT PRIMARY KEY,
-                category_name TEXT UNIQUE NOT NULL,
-                description TEXT,
-                created_date TEXT
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS kpi (
-                id TEXT PRIMARY KEY,
-                kpi_code TEXT UNIQUE NOT NULL,
-                kpi_name TEXT NOT NULL,
-                description TEXT,
-                category_id TEXT,
-                department_id TEXT,
-                unit TEXT,
-                target_value REAL,
-                weight REAL,
-                measurement_frequency TEXT,
-                created_date TEXT,
-                status TEXT DEFAULT 'active',
-                FOREIGN KEY (category_id) REFERENCES kpi_categories (id),
-                FOREIGN KEY (department_id) REFERENCES departments (id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS kpi_assignments (
-                id TEXT PRIMARY KEY,
-                kpi_id TEXT,
-                staff_id TEXT,
-                assigned_date TEXT,
-                role TEXT,
-                FOREIGN KEY (kpi_id) REFERENCES kpi (id),
-                FOREIGN KEY (staff_id) REFERENCES staff (id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS kpi_results (
-                id TEXT PRIMARY KEY,
-                kpi_id TEXT,
-                period TEXT,
-                actual_value REAL,
-                achievement_percentage REAL,
-                note TEXT,
-                recorded_by TEXT,
-                recorded_date TEXT,
-                FOREIGN KEY (kpi_id) REFERENCES kpi (id)
+        """Initialize database with all required tables and migrations"""
+        with self.pool.connection() as conn:
+            with conn:
+                for table, columns in BASE_SCHEMA.items():
+                    conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT,
+                        applied_date TEXT
+                    )
+                ''')
+            self.migrate(conn)
+            self.kpi_fts_enabled = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'kpi_fts'"
+            ).fetchone() is not None
+
+    def _configure_connection(self, conn):
+        """Apply per-connection settings to a newly opened connection"""
+        conn.execute("PRAGMA foreign_keys = ON")
+        for pragma, value in PERFORMANCE_PROFILES[self.profile].items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+
+    def get_performance_settings(self):
+        """Return the active profile and the settings SQLite reports"""
+        names = {
+            'synchronous': ['OFF', 'NORMAL', 'FULL', 'EXTRA'],
+            'temp_store': ['DEFAULT', 'FILE', 'MEMORY']
+        }
+        settings = {'profile': self.profile}
+        with self.pool.connection() as conn:
+            for pragma in PERFORMANCE_PROFILES[self.profile]:
+                value = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+                settings[pragma] = names[pragma][value] if pragma in names else value
+        return settings
+
+    def get_schema_version(self):
+        """Return the version of the last applied migration"""
+        return self.execute_query("PRAGMA user_version")[0][0]
+
+    def migrate(self, conn):
+        """Apply pending migrations in order, each in its own transaction"""
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        pending = [m for m in self.MIGRATIONS if m[0] > current]
+        if not pending:
+            return
+
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.execute("PRAGMA legacy_alter_table = ON")
+        try:
+            for version, description, method in pending:
+                conn.execute("BEGIN")
+                try:
+                    orphans = self._foreign_key_violations(conn)
+                    getattr(self, method)(conn)
+                    # Tables are rebuilt with foreign keys off; refuse to
+                    # commit a migration that left rows pointing nowhere
+                    added = self._foreign_key_violations(conn) - orphans
+                    if added:
+                        raise sqlite3.IntegrityError(
+                            f"Migration {version} broke foreign keys: "
+                            + ', '.join(f"{table} -> {parent} ({count})"
+                                        for (table, parent), count in sorted(added.items())))
+                    conn.execute(
+                        "INSERT INTO schema_migrations VALUES (?, ?, ?)",
+                        [version, description, datetime.now().isoformat()])
+                    conn.execute(f"PRAGMA user_version = {version}")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        finally:
+            conn.execute("PRAGMA legacy_alter_table = OFF")
+            conn.execute("PRAGMA foreign_keys = ON")
+
+    def _foreign_key_violations(self, conn):
+        """Count rows whose foreign key matches no parent row, by (table,
+        parent table). Rows orphaned before foreign keys were enforced
+        are counted too, so callers compare against an earlier count.
+        """
+        return Counter((table, parent) for table, _, parent, _ in
+                       conn.execute("PRAGMA foreign_key_check"))
+
+    def _rebuild_table(self, conn, table, create_sql, select_sql=None):
+        """Recreate a table from create_sql and copy its rows across.
+
+        create_sql uses {table} for the table name; select_sql defaults to
+        copying every column as is. Indexes and triggers are recreated and
+        full-text indexes over the table are rebuilt for the new rowids.
+        """
+        dependents = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            [table]).fetchall()
+        conn.execute(create_sql.format(table=f"{table}__new"))
+        conn.execute(f"INSERT INTO {table}__new {select_sql or f'SELECT * FROM {table}'}")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}__new RENAME TO {table}")
+        for (sql,) in dependents:
+            conn.execute(sql)
+        fts = FTS_INDEXES.get(table)
+        if fts and conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = ?", [fts]).fetchone():
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+    def _migrate_cascading_foreign_keys(self, conn):
+        """Make child rows follow their parent on delete"""
+        for table, columns in CASCADE_FOREIGN_KEYS.items():
+            on_delete = {fk[3]: fk[6] for fk in conn.execute(f"PRAGMA foreign_key_list({table})")}
+            if all(on_delete.get(column) == 'CASCADE' for column in columns):
+                continue
+            create_sql = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", [table]).fetchone()[0]
+            # A table renamed into place is stored with its name quoted
+            create_sql = re.sub(r'^CREATE TABLE "?\w+"?', "CREATE TABLE {table}", create_sql)
+            for column in columns:
+                create_sql = re.sub(
+                    rf"(FOREIGN KEY \({column}\) REFERENCES \w+ \(id\))(?! ON DELETE)",
+                    r"\1 ON DELETE CASCADE", create_sql)
+            self._rebuild_table(conn, table, create_sql)
+
+    def _migrate_lookup_indexes(self, conn):
+        """Index foreign keys and the columns lists and lookups filter on"""
+        for statement in LOOKUP_INDEXES:
+            conn.execute(statement)
+
+    def _migrate_kpi_fts(self, conn):
+        """Index KPI code, name and description for ranked prefix search.
+
+        Builds without FTS5 skip the index; KPI search then falls back to LIKE.
+        """
+        if not fts5_available(conn):
+            return
+        for statement in KPI_FTS_STATEMENTS:
+            conn.execute(statement)
+
+    def _migrate_staff_name_index(self, conn):
+        """Add the normalized name column and trigram table, then fill both"""
+        for statement in STAFF_NAME_INDEX_STATEMENTS:
+            conn.execute(statement)
+        self._index_staff_names(conn)
+
+    def _index_staff_names(self, conn):
+        """Refresh name_normalized and trigrams for staff whose name changed.
+
+        Returns the number of staff rows indexed.
+        """
+        rows = conn.execute(
+            "SELECT id, full_name FROM staff WHERE name_normalized IS NULL").fetchall()
+        if not rows:
+            return 0
+        conn.executemany("DELETE FROM staff_trigrams WHERE staff_id = ?",
+                         [(staff_id,) for staff_id, _ in rows])
+        conn.executemany("UPDATE staff SET name_normalized = ? WHERE id = ?",
+                         [(normalize_text(name), staff_id) for staff_id, name in rows])
+        conn.executemany("INSERT INTO staff_trigrams (trigram, staff_id) VALUES (?, ?)",
+                         [(gram, staff_id) for staff_id, name in rows for gram in trigrams(name)])
+        return len(rows)
+
+    def _migrate_sort_indexes(self, conn):
+        """Index the common list sort orders, each with its code tiebreaker"""
+        for statement in SORT_INDEXES:
+            conn.execute(statement)
+
+    def _migrate_amounts(self, conn):
+        """Parse text budgets and salaries into integer-only columns"""
+        conn.execute(AMOUNT_FAILURES_TABLE)
+        now = datetime.now().isoformat()
+        for table, column in AMOUNT_COLUMNS.items():
+            code_column = AMOUNT_ROW_CODES[table]
+            values, failures = [], []
+            for row_id, code, raw in conn.execute(
+                    f"SELECT id, {code_column}, {column} FROM {table} WHERE {column} IS NOT NULL"):
+                try:
+                    values.append((parse_amount(raw), row_id))
+                except ValueError:
+                    values.append((None, row_id))
+                    failures.append((table, code, column, raw, now))
+            conn.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", values)
+            conn.executemany(
+                "INSERT INTO amount_parse_failures VALUES (?, ?, ?, ?, ?)", failures)
+            create_sql = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", [table]).fetchone()[0]
+            # Tables renamed by an earlier rebuild have a quoted name
+            create_sql = re.sub(r'^CREATE TABLE "?\w+"?', "CREATE TABLE {table}", create_sql)
+            create_sql = re.sub(
+                rf"\b{column} TEXT\b",
+                f"{column} INTEGER CHECK (typeof({column}) IN ('integer', 'null'))", create_sql)
+            self._rebuild_table(conn, table, create_sql)
+        for statement in AMOUNT_INDEXES:
+            conn.execute(statement)
+
+    def _migrate_integer_keys(self, conn):
+        """Key rows by INTEGER id and move the UUID key to a uuid column.
+
+        The new id of each row is its current rowid. Children are rebuilt
+        first so their foreign keys can still look up the parent's rowid by
+        the old UUID; rebuilding a parent then keeps those rowids as ids.
+        """
+        for table in INTEGER_KEY_ORDER:
+            references = FOREIGN_KEYS.get(table, {})
+            create_sql = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", [table]).fetchone()[0]
+            create_sql = re.sub(r'^CREATE TABLE "?\w+"?', "CREATE TABLE {table}", create_sql)
+            create_sql = re.sub(r"\bid TEXT PRIMARY KEY",
+                                "id INTEGER PRIMARY KEY,\n        uuid TEXT UNIQUE NOT NULL", create_sql)
+            columns = []
+            for row in conn.execute(f"PRAGMA table_info({table})"):
+                column = row[1]
+                if column == 'id':
+                    columns += ["rowid", "id"]
+                elif column in references:
+                    create_sql = re.sub(rf"\b{column} TEXT\b", f"{column} INTEGER", create_sql)
+                    columns.append(
+                        f"(SELECT rowid FROM {references[column]} WHERE id = {table}.{column})")
+                else:
+                    columns.append(column)
+            self._rebuild_table(conn, table, create_sql, f"SELECT {', '.join(columns)} FROM {table}")
+
+    def _migrate_staff_counts(self, conn):
+        """Add departments.staff_count with its triggers and fill it"""
+        for statement in STAFF_COUNT_STATEMENTS:
+            conn.execute(statement)
+        conn.execute("""
+            UPDATE departments
+            SET staff_count = (SELECT COUNT(*) FROM staff WHERE department_id = departments.id)
+        """)
+
+    def _migrate_periods(self, conn):
+        """Add the parsed period columns with their triggers and fill them"""
+        for statement in PERIOD_INDEX_STATEMENTS:
+            conn.execute(statement)
+        self._index_periods(conn)
+
+    def _index_periods(self, conn):
+        """Parse the period of results whose period changed.
+
+        Periods that do not parse are marked UNKNOWN_GRANULARITY and keep a
+        NULL start and end. Returns the ids of the results indexed.
+        """
+        rows = conn.execute(
+            "SELECT id, period FROM kpi_results WHERE period_granularity IS NULL").fetchall()
+        values = []
+        for result_id, text in rows:
+            try:
+                values.append((*parse_period(text or ''), result_id))
+            except ValueError:
+                values.append((UNKNOWN_GRANULARITY, None, None, result_id))
+        conn.executemany("""
+            UPDATE kpi_results SET period_granularity = ?, period_start = ?, period_end = ?
+            WHERE id = ?
+        """, values)
+        return [result_id for result_id, _ in rows]
+
+    def _migrate_kpi_rollups(self, conn):
+        """Add the rollup tables with their triggers and fill them"""
+        for statement in KPI_ROLLUP_STATEMENTS:
+            conn.execute(statement)
+        query, params = rollup_query()
+        conn.execute(f"INSERT INTO kpi_rollups ({KPI_ROLLUP_COLUMNS}) {query}", params)
+
+    def _migrate_unique_results(self, conn):
+        """Make (kpi_id, period) unique, keeping the latest result of each.
+
+        Periods are rewritten in canonical form first, so "2024-1" and
+        "2024-01" count as the same period. Older duplicates are moved to
+        the history of the result that is kept. Also replaces the rollup
+        stale triggers, which upserts would trip.
+        """
+        canonical = []
+        for result_id, text in conn.execute("SELECT id, period FROM kpi_results"):
+            try:
+                period = period_text(parse_period(text or ''))
+            except ValueError:
+                continue
+            if period != text:
+                canonical.append((period, result_id))
+        for statement in ROLLUP_STALE_TRIGGERS + RESULT_HISTORY_STATEMENTS:
+            conn.execute(statement)
+        conn.executemany("UPDATE kpi_results SET period = ? WHERE id = ?", canonical)
+        conn.execute("""
+            CREATE TEMP TABLE result_duplicates AS
+            SELECT id, keeper FROM (
+                SELECT id, FIRST_VALUE(id) OVER latest AS keeper, ROW_NUMBER() OVER latest AS rank
+                FROM kpi_results
+                WHERE kpi_id IS NOT NULL AND period IS NOT NULL
+                WINDOW latest AS (PARTITION BY kpi_id, period ORDER BY recorded_date DESC, id DESC)
             )
-        ''')
+            WHERE rank > 1
+        """)
+        conn.execute("""
+            INSERT INTO kpi_result_history (result_id, actual_value, achievement_percentage,
+                                            note, recorded_by, recorded_date)
+            SELECT d.keeper, kr.actual_value, kr.achievement_percentage,
+                   kr.note, kr.recorded_by, kr.recorded_date
+            FROM result_duplicates d
+            JOIN kpi_results kr ON kr.id = d.id
+            ORDER BY d.keeper, kr.recorded_date, kr.id
+        """)
+        conn.execute("DELETE FROM kpi_results WHERE id IN (SELECT id FROM result_duplicates)")
+        conn.execute("DROP TABLE result_duplicates")
+        conn.execute("DROP INDEX IF EXISTS idx_kpi_results_kpi_period")
+        conn.execute("CREATE UNIQUE INDEX idx_kpi_results_kpi_period ON kpi_results (kpi_id, period)")
+        # Migration 12 rebuilds the rollups this leaves stale
+        self._index_periods(conn)
+
+    def _migrate_rollup_buckets(self, conn):
+        """Mark single rollup rows stale instead of KPIs, then rebuild the
+        rollups"""
+        for statement in ROLLUP_BUCKET_STALE_STATEMENTS:
+            conn.execute(statement)
+        conn.execute("DELETE FROM kpi_rollups")
+        query, params = rollup_query()
+        conn.execute(f"INSERT INTO kpi_rollups ({KPI_ROLLUP_COLUMNS}) {query}", params)
+
+    def _migrate_kpi_targets(self, conn):
+        """Add the target versions table and stop recording recomputed
+        achievements as history"""
+        for statement in KPI_TARGET_STATEMENTS:
+            conn.execute(statement)
+
+    def _update_rollups(self, conn, result_ids):
+        """Bring kpi_rollups up to date with the results written.
+
+        Rollup rows marked stale are recomputed from the results of their
+        KPI and period. result_ids are the results just indexed; they are
+        then added to the other rollup rows they fall in. Returns whether
+        any rollup row was written.
+        """
+        written = False
+        stale = conn.execute("SELECT COUNT(*) FROM kpi_rollup_stale").fetchone()[0]
+        if stale and stale * 2 > conn.execute("SELECT COUNT(*) FROM kpi_rollups").fetchone()[0]:
+            # Most rows are stale, as after a restore: rebuilding all is faster
+            conn.execute("DELETE FROM kpi_rollups")
+            query, params = rollup_query()
+            conn.execute(f"INSERT INTO kpi_rollups ({KPI_ROLLUP_COLUMNS}) {query}", params)
+            conn.execute("DELETE FROM kpi_rollup_stale")
+            return True
+        if stale:
+            conn.execute("""
+                DELETE FROM kpi_rollups WHERE (kpi_id, granularity, period_start) IN
+                    (SELECT kpi_id, granularity, period_start FROM kpi_rollup_stale)
+            """)
+            conn.execute(f"INSERT INTO kpi_rollups ({KPI_ROLLUP_COLUMNS}) {stale_rollup_query()}")
+            written = True
+        if result_ids:
+            query, params = rollup_query(
+                "id IN (SELECT value FROM json_each(?))", [json.dumps(result_ids)],
+                exclude_stale=True)
+            written = conn.execute(f"""
+                INSERT INTO kpi_rollups ({KPI_ROLLUP_COLUMNS}) {query}
+                ON CONFLICT (kpi_id, granularity, period_start) DO UPDATE SET
+                    result_count = result_count + excluded.result_count,
+                    achievement_count = achievement_count + excluded.achievement_count,
+                    achievement_sum = achievement_sum + excluded.achievement_sum,
+                    achievement_min = COALESCE(MIN(achievement_min, excluded.achievement_min),
+                                               achievement_min, excluded.achievement_min),
+                    achievement_max = COALESCE(MAX(achievement_max, excluded.achievement_max),
+                                               achievement_max, excluded.achievement_max),
+                    last_recorded_date = COALESCE(MAX(last_recorded_date, excluded.last_recorded_date),
+                                                  last_recorded_date, excluded.last_recorded_date),
+                    last_achievement = CASE
+                        WHEN last_recorded_date IS NULL
+                             OR excluded.last_recorded_date >= last_recorded_date
+                        THEN excluded.last_achievement ELSE last_achievement END
+            """, params).rowcount > 0 or written
+        conn.execute("DELETE FROM kpi_rollup_stale")
+        return written
+
+    def check_staff_counts(self, repair=False):
+        """Return (department id, stored, actual) for every wrong staff_count.
 
-        conn.commit()
-        conn.close()
+        The triggers keep the counts right across staff writes; counts can
+        still go wrong when the column itself is written, as when a backup
+        is restored. With repair the wrong counts are rewritten, which
+        publishes an update event for them.
+        """
+        with self.transaction() as conn:
+            mismatches = conn.execute("""
+                SELECT d.id, d.staff_count, COUNT(s.id)
+                FROM departments d
+                LEFT JOIN staff s ON s.department_id = d.id
+                GROUP BY d.id
+                HAVING d.staff_count != COUNT(s.id)
+            """).fetchall()
+            if repair:
+                for dept_id, _, actual in mismatches:
+                    self._write(conn, "UPDATE departments SET staff_count = ? WHERE id = ?",
+                                [actual, dept_id], (dept_id,))
+        return mismatches
+
+    def check_kpi_rollups(self, repair=False):
+        """Return (kpi id, granularity, period start) for every kpi_rollups
+        row that differs from its recomputation from kpi_results.
+
+        Rows missing from either side count as wrong. With repair the wrong
+        rows are recomputed.
+        """
+        with self.transaction() as conn:
+            query, params = rollup_query()
+            actual = {row[:3]: row[3:] for row in conn.execute(query, params)}
+            stored = {row[:3]: row[3:] for row in conn.execute(
+                f"SELECT {KPI_ROLLUP_COLUMNS} FROM kpi_rollups")}
+            mismatches = sorted(
+                key for key in actual.keys() | stored.keys()
+                if not rollup_values_equal(actual.get(key), stored.get(key)))
+            if repair and mismatches:
+                conn.executemany("INSERT INTO kpi_rollup_stale VALUES (?, ?, ?)", mismatches)
+                self._update_rollups(conn, [])
+                self._tx.touched.add('kpi_rollups')
+        return mismatches
+
+    def set_kpi_target(self, kpi_id, target_value, effective_from=None):
+        """Make target_value the KPI's target from the Period effective_from
+        on, or for every period if it is None, and recompute the achievement
+        of its results. Returns the RecomputeResult.
+
+        The first change from a period keeps the old target as the version
+        for the periods before it; versions from effective_from on are
+        replaced.
+        """
+        now = datetime.now().isoformat()
+        with self.transaction() as conn:
+            if effective_from is None:
+                self._write(conn, "DELETE FROM kpi_targets WHERE kpi_id = ?", [kpi_id])
+            else:
+                if not conn.execute(
+                        "SELECT 1 FROM kpi_targets WHERE kpi_id = ?", [kpi_id]).fetchone():
+                    self._write(conn, """
+                        INSERT INTO kpi_targets (kpi_id, effective_start, target_value, created_date)
+                        SELECT id, 0, target_value, ? FROM kpi WHERE id = ?
+                    """, [now, kpi_id])
+                self._write(conn, "DELETE FROM kpi_targets WHERE kpi_id = ? AND effective_start >= ?",
+                            [kpi_id, effective_from.start])
+                self._write(conn, """
+                    INSERT INTO kpi_targets (kpi_id, effective_start, target_value, created_date)
+                    VALUES (?, ?, ?, ?)
+                """, [kpi_id, effective_from.start, target_value, now])
+            self._write(conn, "UPDATE kpi SET target_value = ? WHERE id = ?",
+                        [target_value, kpi_id], (kpi_id,))
+            return self.recompute_achievements([kpi_id])
+
+    def recompute_achievements(self, kpi_ids=None):
+        """Recompute achievement_percentage of the results of kpi_ids, or of
+        every KPI, from the target of each result's period.
+
+        Only results whose stored achievement differs are rewritten, in one
+        UPDATE; rollups follow on commit. Returns a RecomputeResult.
+        """
+        started = time.perf_counter()
+        if kpi_ids is None:
+            where, params = "1", []
+        else:
+            where, params = "kr.kpi_id IN (SELECT value FROM json_each(?))", [json.dumps(list(kpi_ids))]
+        with self.transaction() as conn:
+            conn.execute("CREATE TEMP TABLE achievement_recompute (id INTEGER PRIMARY KEY, achievement REAL)")
+            try:
+                conn.execute("INSERT INTO achievement_recompute "
+                             + STALE_ACHIEVEMENTS.format(where=where), params)
+                ids = tuple(row[0] for row in conn.execute("SELECT id FROM achievement_recompute"))
+                if ids:
+                    # A recompute of every KPI can rewrite most results;
+                    # their event asks for a refresh instead of listing them
+                    self._write(conn, """
+                        UPDATE kpi_results
+                        SET achievement_percentage = (SELECT achievement FROM achievement_recompute r
+                                                      WHERE r.id = kpi_results.id)
+                        WHERE id IN (SELECT id FROM achievement_recompute)
+                    """, [], ids if len(ids) <= self.DEFAULT_CHUNK_SIZE else None)
+            finally:
+                conn.execute("DROP TABLE achievement_recompute")
+        return RecomputeResult(len(ids), time.perf_counter() - started)
+
+    def get_amount_parse_failures(self):
+        """Return (table, code, column, raw value) for amounts the migration
+        to integer columns could not parse and set to NULL"""
+        return self.execute_query(
+            "SELECT table_name, row_code, column_name, raw_value FROM amount_parse_failures "
+            "ORDER BY table_name, row_code")
+
+    @contextmanager
+    def transaction(self):
+        """Run statements on one connection and commit once.
+
+        Nested transactions on the same thread join the outermost one, which
+        commits on success and rolls everything back on error.
+        """
+        with self.pool.connection() as conn:
+            depth = getattr(self._tx, 'depth', 0)
+            self._tx.depth = depth + 1
+            if not depth:
+                self._tx.touched = set()
+                self._tx.events = []
+            try:
+                if depth:
+                    yield conn
+                else:
+                    with conn:
+                        yield conn
+                        if 'staff' in self._tx.touched and self._index_staff_names(conn):
+                            self._tx.touched.add('staff_trigrams')
+                        if 'kpi_results' in self._tx.touched and self._update_rollups(
+                                conn, self._index_periods(conn)):
+                            self._tx.touched.add('kpi_rollups')
+            finally:
+                self._tx.depth = depth
+                if not depth:
+                    # Bump again once committed so other threads cannot keep
+                    # results they read before the commit became visible
+                    self.cache.bump(self._tx.touched)
+        # Only reached when the outermost transaction committed; on rollback
+        # the exception skips this and the queued events are discarded
+        if not depth and self._tx.events:
+            events, self._tx.events = self._tx.events, []
+            self.events.publish(events)
+
+    def _touch(self, query, keys=None, conn=None):
+        """Invalidate cached results for the table a statement writes and
+        queue its change event for publishing on commit.
+
+        Call before executing the statement: for deletes with known keys,
+        conn is used to look up the child rows the cascade will remove.
+        """
+        table = table_written(query)
+        if table:
+            dependents = cascade_dependents(table)
+            tables = {table} | dependents
+            for written in list(tables):
+                tables |= TRIGGER_WRITES.get(written, set())
+            self.cache.bump(tables)
+            self._tx.touched |= tables
+            if not self.events.has_subscribers():
+                return
+            operation = statement_operation(query)
+            self._tx.events.append(ChangeEvent(table, operation, keys))
+            if operation == 'delete' and keys is not None and conn is not None:
+                self._tx.events.extend(self._cascade_events(conn, table, keys))
+            elif operation == 'delete':
+                self._tx.events.extend(
+                    ChangeEvent(child, 'delete', None) for child in sorted(dependents))
+
+    def _cascade_events(self, conn, table, keys):
+        """Yield delete events for the rows ON DELETE CASCADE removes with keys"""
+        for child, references in CASCADE_FOREIGN_KEYS.items():
+            for column, parent in references.items():
+                if parent != table or not keys:
+                    continue
+                child_keys = tuple(row[0] for row in conn.execute(
+                    f"SELECT id FROM {child} WHERE {column} IN ({', '.join('?' * len(keys))})",
+                    list(keys)))
+                yield ChangeEvent(child, 'delete', child_keys)
+                yield from self._cascade_events(conn, child, child_keys)
+
+    def subscribe(self, callback, tables=None):
+        """Call callback(ChangeEvent) after each committed write to tables.
+
+        Events are delivered on the writing thread once the outermost
+        transaction commits; rolled back writes publish nothing.
+        """
+        return self.events.subscribe(callback, tables)
+
+    def unsubscribe(self, callback):
+        """Stop delivering change events to callback"""
+        self.events.unsubscribe(callback)
+
+    def _row_ids(self, conn, table, condition):
+        """Return the ids of the rows a column = value condition matches.
+
+        Also run for id conditions, so keys taken from Treeview iids, which
+        are text, come back as integers.
+        """
+        return tuple(row[0] for row in conn.execute(
+            f"SELECT id FROM {table} WHERE {condition['column']} = ?",
+            [condition['value']]))
+
+    def cached_query(self, query, params=None):
+        """Like execute_query, but serve repeated reads from the result cache.
+
+        Entries are keyed by SQL plus params and are dropped as soon as any
+        table the query reads is written.
+        """
+        key = (query, tuple(params or ()))
+        tables = tables_read(query)
+        rows = self.cache.get(key, tables)
+        if rows is None:
+            versions = self.cache.versions(tables)
+            rows = self.execute_query(query, params)
+            self.cache.put(key, rows, versions)
+        return list(rows)
 
     def execute_query(self, query, params=None):
         """Execute a query and return results"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.transaction() as conn:
+            started = time.perf_counter()
+            self._touch(query)
+            cursor = conn.execute(query, params or [])
+            results = cursor.fetchall()
+            rows = len(results) if cursor.description else cursor.rowcount
+            self.query_stats.record(
+                query, time.perf_counter() - started, rows, conn, params)
+            return results
 
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
+    def iter_query(self, query, params=None, batch_size=500, cancelled=None):
+        """Yield result rows in fetchmany batches from a dedicated connection.
 
-        results = cursor.fetchall()
-        conn.commit()
-        conn.close()
-        return results
+        Memory stays bounded by batch_size however many rows match. SQLite
+        polls cancelled() while it works, from the iterating thread; once it
+        returns true the statement stops with sqlite3.OperationalError.
+        """
+        with self.pool.connection(dedicated=True) as conn:
+            if cancelled is not None:
+                conn.set_progress_handler(cancelled, self.CANCEL_CHECK_STEPS)
+            try:
+                started = time.perf_counter()
+                cursor = conn.execute(query, params or [])
+                elapsed = time.perf_counter() - started
+                count = 0
+                try:
+                    while True:
+                        started = time.perf_counter()
+                        rows = cursor.fetchmany(batch_size)
+                        elapsed += time.perf_counter() - started
+                        if not rows:
+                            break
+                        count += len(rows)
+                        yield from rows
+                finally:
+                    cursor.close()
+                    self.query_stats.record(query, elapsed, count, conn, params)
+            finally:
+                if cancelled is not None:
+                    conn.set_progress_handler(None, 0)
+
+    def _write(self, conn, query, params, keys=None):
+        """Execute a write statement on conn and record its latency.
+
+        An insert without keys names the id SQLite assigned in its event.
+        """
+        assigned = keys is None and statement_operation(query) == 'insert'
+        if not assigned:
+            self._touch(query, keys, conn)
+        started = time.perf_counter()
+        cursor = conn.execute(query, params)
+        self.query_stats.record(
+            query, time.perf_counter() - started, cursor.rowcount, conn, params)
+        if assigned:
+            self._touch(query, (cursor.lastrowid,))
+        return cursor
 
     def insert_data(self, table, data):
         """Insert data into a table"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         columns = ', '.join(data.keys())
         placeholders = ', '.join(['?' for _ in data])
         query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
 
-        cursor.execute(query, list(data.values()))
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            self._write(conn, query, list(data.values()), (data['id'],) if 'id' in data else None)
+
+    def upsert_data(self, table, data, conflict_columns):
+        """Insert a row, or update the row whose conflict_columns hold the
+        same values; conflict_columns must have a unique index.
+
+        An update keeps the row's id and uuid. Returns the row's id.
+        """
+        query = self._upsert_query(table, list(data), conflict_columns)
+        with self.transaction() as conn:
+            existing = conn.execute(
+                self._conflict_lookup(table, conflict_columns),
+                [data[k] for k in conflict_columns]).fetchone()
+            keys = (existing[0],) if existing else (data['id'],) if 'id' in data else None
+            cursor = self._write(conn, query, list(data.values()), keys)
+            return existing[0] if existing else cursor.lastrowid
+
+    def _upsert_query(self, table, columns, conflict_columns):
+        placeholders = ', '.join(['?' for _ in columns])
+        updates = ', '.join(f"{c} = excluded.{c}" for c in columns
+                            if c not in conflict_columns and c not in ('id', 'uuid'))
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+                f"ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE SET {updates}")
+
+    def _conflict_lookup(self, table, conflict_columns):
+        return f"SELECT id FROM {table} WHERE " + ' AND '.join(f"{c} = ?" for c in conflict_columns)
 
     def update_data(self, table, data, condition):
         """Update data in a table"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         set_clause = ', '.join([f"{k} = ?" for k in data.keys()])
         query = f"UPDATE {table} SET {set_clause} WHERE {condition['column']} = ?"
 
         params = list(data.values()) + [condition['value']]
-        cursor.execute(query, params)
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            self._write(conn, query, params, self._row_ids(conn, table, condition))
 
     def delete_data(self, table, condition):
         """Delete data from a table"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         query = f"DELETE FROM {table} WHERE {condition['column']} = ?"
-        cursor.execute(query, [condition['value']])
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            self._write(conn, query, [condition['value']],
+                        self._row_ids(conn, table, condition))
+
+    def _chunks(self, rows, chunk_size):
+        """Yield lists of at most chunk_size rows"""
+        iterator = iter(rows)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _executemany(self, query, chunks, to_params, to_key=None):
+        """Run executemany per chunk, committing once per chunk.
+
+        Inside an enclosing transaction() all chunks commit together.
+        to_key extracts each row's id for the chunk's change event.
+        """
+        count = 0
+        for chunk in chunks:
+            params = [to_params(row) for row in chunk]
+            keys = tuple(to_key(row) for row in chunk) if to_key else None
+            with self.transaction() as conn:
+                self._touch(query, keys, conn)
+                started = time.perf_counter()
+                conn.executemany(query, params)
+                self.query_stats.record(
+                    query, time.perf_counter() - started, len(params), conn, params[0])
+            count += len(chunk)
+        return count
+
+    def insert_many(self, table, rows, columns=None, chunk_size=None):
+        """Insert many rows (dicts or tuples) with executemany.
+
+        Dict rows take their columns from the first row. Tuple rows use
+        `columns` when given, otherwise they must match the table layout.
+        Returns the number of rows inserted.
+        """
+        iterator = iter(rows)
+        first = next(iterator, None)
+        if first is None:
+            return 0
+        iterator = chain([first], iterator)
+
+        to_key = None
+        if isinstance(first, dict):
+            columns = list(columns or first.keys())
+
+            def to_params(row):
+                return [row[c] for c in columns]
+            if 'id' in columns:
+                to_key = itemgetter('id')
+        else:
+            to_params = tuple
+            if columns and 'id' in columns:
+                to_key = itemgetter(list(columns).index('id'))
+
+        placeholders = ', '.join(['?'] * len(columns or first))
+        if columns:
+            query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        else:
+            query = f"INSERT INTO {table} VALUES ({placeholders})"
+
+        return self._executemany(
+            query, self._chunks(iterator, chunk_size or self.DEFAULT_CHUNK_SIZE),
+            to_params, to_key)
+
+    def update_many(self, table, rows, key_column, columns=None, chunk_size=None):
+        """Update many rows matched on key_column with executemany.
+
+        Dict rows must contain key_column plus the columns to set. Tuple rows
+        hold the values for `columns` followed by the key value.
+        Returns the number of rows processed.
+        """
+        iterator = iter(rows)
+        first = next(iterator, None)
+        if first is None:
+            return 0
+        iterator = chain([first], iterator)
+
+        if isinstance(first, dict):
+            columns = list(columns or [c for c in first if c != key_column])
+
+            def to_params(row):
+                return [row[c] for c in columns] + [row[key_column]]
+            to_key = itemgetter(key_column)
+        else:
+            if not columns:
+                raise ValueError("columns is required for tuple rows")
+            to_params = tuple
+            to_key = itemgetter(-1)
+
+        set_clause = ', '.join([f"{c} = ?" for c in columns])
+        query = f"UPDATE {table} SET {set_clause} WHERE {key_column} = ?"
+
+        return self._executemany(
+            query, self._chunks(iterator, chunk_size or self.DEFAULT_CHUNK_SIZE),
+            to_params, to_key if key_column == 'id' else None)
+
+    def upsert_many(self, table, rows, conflict_columns, chunk_size=None):
+        """Insert or update many dict rows as upsert_data does, with executemany.
+
+        Each chunk's change event names the ids of its rows, looked up by
+        their conflict columns once written. Returns the number of rows
+        processed.
+        """
+        iterator = iter(rows)
+        first = next(iterator, None)
+        if first is None:
+            return 0
+        iterator = chain([first], iterator)
+
+        columns = list(first)
+        query = self._upsert_query(table, columns, conflict_columns)
+        lookup = self._conflict_lookup(table, conflict_columns)
+        count = 0
+        for chunk in self._chunks(iterator, chunk_size or self.DEFAULT_CHUNK_SIZE):
+            params = [[row[c] for c in columns] for row in chunk]
+            with self.transaction() as conn:
+                started = time.perf_counter()
+                conn.executemany(query, params)
+                self.query_stats.record(
+                    query, time.perf_counter() - started, len(params), conn, params[0])
+                self._touch(query, tuple(
+                    conn.execute(lookup, [row[c] for c in conflict_columns]).fetchone()[0]
+                    for row in chunk))
+            count += len(chunk)
+        return count
+
+    def delete_many(self, table, column, values, chunk_size=None):
+        """Delete every row whose column matches one of values.
+
+        Returns the number of values processed.
+        """
+        query = f"DELETE FROM {table} WHERE {column} = ?"
+        return self._executemany(
+            query, self._chunks(values, chunk_size or self.DEFAULT_CHUNK_SIZE),
+            lambda value: [value], (lambda value: value) if column == 'id' else None)
 
     def load_sample_data(self):
         """Load sample data for demonstration"""
         try:
+            # One transaction, so a failure leaves no partial sample set
+            with self.transaction():
+                # The sample rows use fixed ids; seed only an empty database
+                if any(self.execute_query(f"SELECT EXISTS (SELECT 1 FROM {table})")[0][0]
+                       for table in self.SAMPLE_TABLES):
+                    return
 
-            if self.execute_query("SELECT COUNT(*) FROM departments")[0][0] > 0:
-                return
+                categories = [
+                    (1, 'Tài Chính', 'KPI liên quan đến tài chính và ngân sách'),
+                    (2, 'Kinh Doanh', 'KPI liên quan đến bán hàng và khách hàng'),
+                    (3, 'Nhân Sự', 'KPI liên quan đến quản lý nhân sự'),
+                    (4, 'Chất Lượng', 'KPI liên quan đến chất lượng sản phẩm/dịch vụ')
+                ]
+
+                self.insert_many('kpi_categories', ({
+                        'id': cat_id,
+                        'uuid': str(uuid.uuid4()),
+                        'category_name': name,
+                        'description': desc,
+                        'created_date': datetime.now().isoformat()
+                    } for cat_id, name, desc in categories))
+
+                departments = [
+                    (1, 'PB001', 'Phòng Tài Chính', 'Quản lý tài chính và kế toán',
+                     'Nguyễn Thị Lan', '024-3844-1234', 'taichinh@company.com', 'Tầng 3', 500000000, 8),
+                    (2, 'PB002', 'Phòng Kinh Doanh', 'Phát triển kinh doanh và marketing',
+                     'Trần Văn Minh', '024-3844-1235', 'kinhdoanh@company.com', 'Tầng 4', 800000000, 12),
+                    (3, 'PB003', 'Phòng Nhân Sự', 'Quản lý nhân sự và đào tạo',
+                     'Lê Thị Hoa', '024-3844-1236', 'nhansu@company.com', 'Tầng 2', 300000000, 6)
+                ]
+
+                self.insert_many('departments', ({
+                        'id': dept_id,
+                        'uuid': str(uuid.uuid4()),
+                        'dept_code': code,
+                        'dept_name': name,
+                        'description': desc,
+                        'manager': manager,
+                        'phone': phone,
+                        'email': email,
+                        'address': address,
+                        'budget': budget,
+                        'max_staff': max_staff,
+                        'created_date': datetime.now().isoformat(),
+                        'status': 'active'
+                    } for dept_id, code, name, desc, manager, phone, email, address, budget, max_staff in departments))
+
+                staff_data = [
+                    (1, 'NV001', 'Nguyễn Văn An', '1985-03-15', 'Nam', '123456789012', '0912345678',
+                     'an.nguyen@company.com', '123 Đường ABC', 1, 'Chuyên viên', 'Đại học', 15000000, '2020-01-15'),
+                    (2, 'NV002', 'Trần Thị Bình', '1990-07-22', 'Nữ', '123456789013', '0912345679',
+                     'binh.tran@company.com', '456 Đường DEF', 2, 'Trưởng phòng', 'Thạc sĩ', 25000000, '2019-06-01'),
+                    (3, 'NV003', 'Lê Văn Cường', '1988-11-08', 'Nam', '123456789014', '0912345680',
+                     'cuong.le@company.com', '789 Đường GHI', 3, 'Phó trưởng phòng', 'Đại học', 20000000, '2021-03-01')
+                ]
+
+                self.insert_many('staff', ({
+                        'id': staff_id,
+                        'uuid': str(uuid.uuid4()),
+                        'staff_code': code,
+                        'full_name': name,
+                        'birth_date': birth,
+                        'gender': gender,
+                        'id_number': id_num,
+                        'phone': phone,
+                        'email': email,
+                        'address': address,
+                        'department_id': dept_id,
+                        'position': position,
+                        'education': education,
+                        'basic_salary': salary,
+                        'start_date': start_date,
+                        'status': 'active',
+                        'created_date': datetime.now().isoformat()
+                    } for staff_id, code, name, birth, gender, id_num, phone, email, address, dept_id, position, education, salary, start_date in staff_data))
+
+                kpi_data = [
+                    (1, 'KPI001', 'Doanh Thu Hàng Tháng', 2,
+                     2, 'VND', 100000000, 30, 'Hàng tháng'),
+                    (2, 'KPI002', 'Tỷ Lệ Hài Lòng Khách Hàng',
+                     4, 2, '%', 90, 25, 'Hàng quý'),
+                    (3, 'KPI003', 'Chi Phí Vận Hành', 1,
+                     1, 'VND', 50000000, 20, 'Hàng tháng'),
+                    (4, 'KPI004', 'Tỷ Lệ Nhân Viên Được Đào Tạo',
+                     3, 3, '%', 80, 15, 'Hàng quý')
+                ]
+
+                self.insert_many('kpi', ({
+                        'id': kpi_id,
+                        'uuid': str(uuid.uuid4()),
+                        'kpi_code': code,
+                        'kpi_name': name,
+                        'description': f'Mô tả cho {name}',
+                        'category_id': cat_id,
+                        'department_id': dept_id,
+                        'unit': unit,
+                        'target_value': target,
+                        'weight': weight,
+                        'measurement_frequency': freq,
+                        'created_date': datetime.now().isoformat(),
+                        'status': 'active'
+                    } for kpi_id, code, name, cat_id, dept_id, unit, target, weight, freq in kpi_data))
+
+                assignments = [
+                    (1, 1, 2, 'owner'),
+                    (2, 2, 2, 'owner'),
+                    (3, 3, 1, 'owner'),
+                    (4, 4, 3, 'owner')
+                ]
+
+                self.insert_many('kpi_assignments', ({
+                        'id': assign_id,
+                        'uuid': str(uuid.uuid4()),
+                        'kpi_id': kpi_id,
+                        'staff_id': staff_id,
+                        'assigned_date': datetime.now().isoformat(),
+                        'role': role
+                    } for assign_id, kpi_id, staff_id, role in assignments))
+
+                results = [
+                    (1, 1, '2024-01', 95000000,
+                     95.0, 'Đạt mục tiêu tháng 1'),
+                    (2, 1, '2024-02', 105000000,
+                     105.0, 'Vượt mục tiêu tháng 2'),
+                    (3, 2, '2024-Q1', 92,
+                     102.2, 'Khách hàng rất hài lòng'),
+                    (4, 3, '2024-01', 48000000,
+                     96.0, 'Tiết kiệm chi phí tốt')
+                ]
 
-            categories = [
-                ('cat1', 'Tài Chính', 'KPI liên quan đến tài chính và ngân sách'),
-                ('cat2', 'Kinh Doanh', 'KPI liên quan đến bán hàng và khách hàng'),
-                ('cat3', 'Nhân Sự', 'KPI liên quan đến quản lý nhân sự'),
-                ('cat4', 'Chất Lượng', 'KPI liên quan đến chất lượng sản phẩm/dịch vụ')
-            ]
-
-            for cat_id, name, desc in categories:
-                self.insert_data('kpi_categories', {
-                    'id': cat_id,
-                    'category_name': name,
-                    'description': desc,
-                    'created_date': datetime.now().isoformat()
-                })
-
-            departments = [
-                ('dept1', 'PB001', 'Phòng Tài Chính', 'Quản lý tài chính và kế toán',
-                 'Nguyễn Thị Lan', '024-3844-1234', 'taichinh@company.com', 'Tầng 3', '500000000', 8),
-                ('dept2', 'PB002', 'Phòng Kinh Doanh', 'Phát triển kinh doanh và marketing',
-                 'Trần Văn Minh', '024-3844-1235', 'kinhdoanh@company.com', 'Tầng 4', '800000000', 12),
-                ('dept3', 'PB003', 'Phòng Nhân Sự', 'Quản lý nhân sự và đào tạo',
-                 'Lê Thị Hoa', '024-3844-1236', 'nhansu@company.com', 'Tầng 2', '300000000', 6)
-            ]
-
-            for dept_id, code, name, desc, manager, phone, email, address, budget, max_staff in departments:
-                self.insert_data('departments', {
-                    'id': dept_id,
-                    'dept_code': code,
-                    'dept_name': name,
-                    'description': desc,
-                    'manager': manager,
-                    'phone': phone,
-                    'email': email,
-                    'address': address,
-                    'budget': budget,
-                    'max_staff': max_staff,
-                    'created_date': datetime.now().isoformat(),
-                    'status': 'active'
-                })
-
-            staff_data = [
-                ('staff1', 'NV001', 'Nguyễn Văn An', '1985-03-15', 'Nam', '123456789012', '0912345678',
-                 'an.nguyen@company.com', '123 Đường ABC', 'dept1', 'Chuyên viên', 'Đại học', '15000000', '2020-01-15'),
-                ('staff2', 'NV002', 'Trần Thị Bình', '1990-07-22', 'Nữ', '123456789013', '0912345679',
-                 'binh.tran@company.com', '456 Đường DEF', 'dept2', 'Trưởng phòng', 'Thạc sĩ', '25000000', '2019-06-01'),
-                ('staff3', 'NV003', 'Lê Văn Cường', '1988-11-08', 'Nam', '123456789014', '0912345680',
-                 'cuong.le@company.com', '789 Đường GHI', 'dept3', 'Phó trưởng phòng', 'Đại học', '20000000', '2021-03-01')
-            ]
-
-            for staff_id, code, name, birth, gender, id_num, phone, email, address, dept_id, position, education, salary, start_date in staff_data:
-                self.insert_data('staff', {
-                    'id': staff_id,
-                    'staff_code': code,
-                    'full_name': name,
-                    'birth_date': birth,
-                    'gender': gender,
-                    'id_number': id_num,
-                    'phone': phone,
-                    'email': email,
-                    'address': address,
-                    'department_id': dept_id,
-                    'position': position,
-                    'education': education,
-                    'basic_salary': salary,
-                    'start_date': start_date,
-                    'status': 'active',
-                    'created_date': datetime.now().isoformat()
-                })
-
-            kpi_data = [
-                ('kpi1', 'KPI001', 'Doanh Thu Hàng Tháng', 'cat2',
-                 'dept2', 'VND', 100000000, 30, 'Hàng tháng'),
-                ('kpi2', 'KPI002', 'Tỷ Lệ Hài Lòng Khách Hàng',
-                 'cat4', 'dept2', '%', 90, 25, 'Hàng quý'),
-                ('kpi3', 'KPI003', 'Chi Phí Vận Hành', 'cat1',
-                 'dept1', 'VND', 50000000, 20, 'Hàng tháng'),
-                ('kpi4', 'KPI004', 'Tỷ Lệ Nhân Viên Được Đào Tạo',
-                 'cat3', 'dept3', '%', 80, 15, 'Hàng quý')
-            ]
-
-            for kpi_id, code, name, cat_id, dept_id, unit, target, weight, freq in kpi_data:
-                self.insert_data('kpi', {
-                    'id': kpi_id,
-                    'kpi_code': code,
-                    'kpi_name': name,
-                    'description': f'Mô tả cho {name}',
-                    'category_id': cat_id,
-                    'department_id': dept_id,
-                    'unit': unit,
-                    'target_value': target,
-                    'weight': weight,
-                    'measurement_frequency': freq,
-                    'created_date': datetime.now().isoformat(),
-                    'status': 'active'
-                })
-
-            assignments = [
-                ('assign1', 'kpi1', 'staff2', 'owner'),
-                ('assign2', 'kpi2', 'staff2', 'owner'),
-                ('assign3', 'kpi3', 'staff1', 'owner'),
-                ('assign4', 'kpi4', 'staff3', 'owner')
-            ]
-
-            for assign_id, kpi_id, staff_id, role in assignments:
-                self.insert_data('kpi_assignments', {
-                    'id': assign_id,
-                    'kpi_id': kpi_id,
-                    'staff_id': staff_id,
-                    'assigned_date': datetime.now().isoformat(),
-                    'role': role
-                })
-
-            results = [
-                ('result1', 'kpi1', '2024-01', 95000000,
-                 95.0, 'Đạt mục tiêu tháng 1'),
-                ('result2', 'kpi1', '2024-02', 105000000,
-                 105.0, 'Vượt mục tiêu tháng 2'),
-                ('result3', 'kpi2', '2024-Q1', 92,
-                 102.2, 'Khách hàng rất hài lòng'),
-                ('result4', 'kpi3', '2024-01', 48000000,
-                 96.0, 'Tiết kiệm chi phí tốt')
-            ]
-
-            for result_id, kpi_id, period, actual, achievement, note in results:
-                self.insert_data('kpi_results', {
-                    'id': result_id,
-                    'kpi_id': kpi_id,
-                    'period': period,
-                    'actual_value': actual,
-                    'achievement_percentage': achievement,
-                    'note': note,
-                    'recorded_by': 'System',
-                    'recorded_date': datetime.now().isoformat()
-                })
+                self.insert_many('kpi_results', ({
+                        'id': result_id,
+                        'uuid': str(uuid.uuid4()),
+                        'kpi_id': kpi_id,
+                        'period': period,
+                        'actual_value': actual,
+                        'achievement_percentage': achievement,
+                        'note': note,
+                        'recorded_by': 'System',
+                        'recorded_date': datetime.now().isoformat()
+                    } for result_id, kpi_id, period, actual, achievement, note in results))
 
         except Exception as e:
             print(f"Error loading sample data: {str(e)}")
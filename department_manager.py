@@ -5,14 +5,50 @@ import sqlite3
 import uuid
 from datetime import datetime
 
+from amounts import parse_amount
+from search_controller import SearchController
+from tree_sync import ColumnSorter, VirtualTreeList, keyset_page, placeholders, sort_order
+
+
+# SQL sort expression of each list column, for click-to-sort
+DEPARTMENT_SORT_COLUMNS = [
+    "dept_code", "dept_name", "COALESCE(manager, '')", "COALESCE(phone, '')",
+    "COALESCE(email, '')", "staff_count",
+    "COALESCE(budget, 0)"
+]
+
+
+def department_rows(db, search_term="", where="1", params=(), sort=None,
+                    after=None, before=None, limit=None, cancelled=None):
+    """Yield (id, *values) department list rows; usable without a UI.
+
+    sort is a ColumnSorter order, by code when None. after, before and
+    limit select one keyset page (see keyset_page).
+    """
+    order, descending = sort_order(sort or (0, False), DEPARTMENT_SORT_COLUMNS, "dept_code")
+    page, page_params, order_by = keyset_page(
+        order, f"SELECT {', '.join(order)} FROM departments WHERE id = ?",
+        descending, after=after, before=before, limit=limit)
+    query = f"""
+        SELECT id, dept_code, dept_name, manager, phone, email, staff_count, budget
+        FROM departments 
+        WHERE (LOWER(dept_name) LIKE ? OR LOWER(dept_code) LIKE ? OR LOWER(manager) LIKE ?)
+        AND status = 'active' AND {where} AND {page}
+        {order_by}
+    """
+
+    return db.iter_query(
+        query, [f"%{search_term}%", f"%{search_term}%", f"%{search_term}%", *params, *page_params],
+        cancelled=cancelled)
+
 
 class DepartmentManager:
-    def __init__(self, parent_frame, db_manager, update_callback=None):
+    def __init__(self, parent_frame, db_manager):
         self.parent_frame = parent_frame
         self.db = db_manager
-        self.update_callback = update_callback
         self.dept_vars = {}
         self.create_widgets()
+        self.db.subscribe(self.on_data_changed, ['departments', 'staff'])
 
     def create_widgets(self):
         """Create department management interface"""
@@ -89,13 +125,18 @@ class DepartmentManager:
 
         v_scroll = ttk.Scrollbar(
             right_panel, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=v_scroll.set)
+        self.view = VirtualTreeList(self.tree, v_scroll, self.list_rows)
 
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
         self.tree.bind('<<TreeviewSelect>>', self.on_select)
 
+        self.search = SearchController(
+            self.tree, lambda cancelled: self.list_rows(
+                limit=self.view.page_size, cancelled=cancelled), self.view.show)
+        self.sorter = ColumnSorter(self.tree, self.search.search_now)
+
         self.refresh_list()
 
     def add_department(self):
@@ -104,7 +145,7 @@ class DepartmentManager:
             return
 
         dept_data = {
-            'id': str(uuid.uuid4()),
+            'uuid': str(uuid.uuid4()),
             'dept_code': self.dept_vars['dept_code'].get(),
             'dept_name': self.dept_vars['dept_name'].get(),
             'description': self.dept_description_text.get("1.0", tk.END).strip(),
@@ -112,7 +153,7 @@ class DepartmentManager:
             'phone': self.dept_vars['phone'].get(),
             'email': self.dept_vars['email'].get(),
             'address': self.dept_vars['address'].get(),
-            'budget': self.dept_vars['budget'].get(),
+            'budget': parse_amount(self.dept_vars['budget'].get()),
             'max_staff': int(self.dept_vars['max_staff'].get()) if self.dept_vars['max_staff'].get().isdigit() else 0,
             'created_date': datetime.now().isoformat(),
             'status': 'active'
@@ -120,9 +161,6 @@ class DepartmentManager:
 
         try:
             self.db.insert_data('departments', dept_data)
-            self.refresh_list()
-            if self.update_callback:
-                self.update_callback()
             self.clear_form()
             messagebox.showinfo("Thành công", "Đã thêm phòng ban thành công!")
         except sqlite3.IntegrityError:
@@ -150,16 +188,13 @@ class DepartmentManager:
             'phone': self.dept_vars['phone'].get(),
             'email': self.dept_vars['email'].get(),
             'address': self.dept_vars['address'].get(),
-            'budget': self.dept_vars['budget'].get(),
+            'budget': parse_amount(self.dept_vars['budget'].get()),
             'max_staff': int(self.dept_vars['max_staff'].get()) if self.dept_vars['max_staff'].get().isdigit() else 0
         }
 
         try:
             self.db.update_data('departments', dept_data, {
                                 'column': 'dept_code', 'value': dept_code})
-            self.refresh_list()
-            if self.update_callback:
-                self.update_callback()
             self.clear_form()
             messagebox.showinfo(
                 "Thành công", "Đã cập nhật phòng ban thành công!")
@@ -178,34 +213,17 @@ class DepartmentManager:
         dept_code = self.tree.item(selected[0])['values'][0]
 
         staff_count = self.db.execute_query(
-            "SELECT COUNT(*) FROM staff WHERE department_id = (SELECT id FROM departments WHERE dept_code = ?)",
-            [dept_code]
-        )[0][0]
+            "SELECT staff_count FROM departments WHERE dept_code = ?", [dept_code])[0][0]
 
         if staff_count > 0:
             if not messagebox.askyesno("Xác nhận", f"Phòng ban có {staff_count} cán bộ. Bạn có chắc chắn muốn xóa?"):
                 return
 
         try:
-
-            dept_id = self.db.execute_query(
-                "SELECT id FROM departments WHERE dept_code = ?", [dept_code]
-            )[0][0]
-
-            self.db.execute_query(
-                "DELETE FROM kpi_assignments WHERE kpi_id IN (SELECT id FROM kpi WHERE department_id = ?)", [dept_id])
-            self.db.execute_query(
-                "DELETE FROM kpi_results WHERE kpi_id IN (SELECT id FROM kpi WHERE department_id = ?)", [dept_id])
-            self.db.execute_query(
-                "DELETE FROM kpi WHERE department_id = ?", [dept_id])
-            self.db.execute_query(
-                "DELETE FROM staff WHERE department_id = ?", [dept_id])
+            # Staff, KPIs, assignments and results cascade from the department row
             self.db.delete_data(
                 'departments', {'column': 'dept_code', 'value': dept_code})
 
-            self.refresh_list()
-            if self.update_callback:
-                self.update_callback()
             self.clear_form()
             messagebox.showinfo(
                 "Thành công", "Đã xóa phòng ban và dữ liệu liên quan!")
@@ -219,6 +237,11 @@ class DepartmentManager:
             if not self.dept_vars[field].get().strip():
                 messagebox.showerror("Lỗi", f"Vui lòng nhập {field}!")
                 return False
+        try:
+            parse_amount(self.dept_vars['budget'].get())
+        except ValueError:
+            messagebox.showerror("Lỗi", "Ngân sách phải là số tiền nguyên, không âm (VD: 15000000 hoặc 15.000.000)!")
+            return False
         return True
 
     def clear_form(self):
@@ -233,7 +256,9 @@ class DepartmentManager:
         if selected:
             dept_code = self.tree.item(selected[0])['values'][0]
             dept_data = self.db.execute_query(
-                "SELECT * FROM departments WHERE dept_code = ?", [dept_code]
+                """SELECT id, dept_code, dept_name, description, manager, phone,
+                          email, address, budget, max_staff
+                   FROM departments WHERE dept_code = ?""", [dept_code]
             )
             if dept_data:
                 dept = dept_data[0]
@@ -249,47 +274,36 @@ class DepartmentManager:
                 self.dept_vars['max_staff'].set(str(dept[9] or ""))
 
     def search_departments(self, event):
-        """Search departments"""
-        search_term = self.search_var.get().lower()
+        """Search departments once typing pauses"""
+        self.search.schedule()
 
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        query = """
-            SELECT dept_code, dept_name, manager, phone, email, 
-                   (SELECT COUNT(*) FROM staff WHERE department_id = departments.id) as staff_count,
-                   budget
-            FROM departments 
-            WHERE (LOWER(dept_name) LIKE ? OR LOWER(dept_code) LIKE ? OR LOWER(manager) LIKE ?)
-            AND status = 'active'
-            ORDER BY dept_code
-        """
-
-        results = self.db.execute_query(
-            query, [f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"])
-
-        for row in results:
-            self.tree.insert("", "end", values=row)
+    def list_rows(self, where="1", params=(), **page):
+        """Yield (id, *values) list rows matching the search box and where"""
+        return department_rows(self.db, self.search_var.get().lower(), where, params,
+                               self.sorter.order, **page)
 
     def refresh_list(self):
         """Refresh department list"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        query = """
-            SELECT dept_code, dept_name, manager, phone, email, 
-                   (SELECT COUNT(*) FROM staff WHERE department_id = departments.id) as staff_count,
-                   budget
-            FROM departments 
-            WHERE status = 'active'
-            ORDER BY dept_code
-        """
+        self.search.cancel()
+        self.view.refresh()
 
-        results = self.db.execute_query(query)
-
-        for row in results:
-            self.tree.insert("", "end", values=row)
+    def on_data_changed(self, event):
+        """Patch the rows a committed write touched"""
+        if self.search.rerun_if_busy():
+            return
+        if event.keys is None or self.sorter.order is not None:
+            # Rows can move anywhere in a user-chosen order
+            self.refresh_list()
+        elif event.table == 'departments':
+            keys = list(event.keys)
+            if keys:
+                self.view.patch(keys, self.list_rows(
+                    f"id IN ({placeholders(keys)})", keys), sort_column=0)
+        else:
+            # Staff writes change staff_count; re-reading the loaded rows
+            # updates only the counts that moved
+            self.view.refresh()
 
     def get_department_names(self):
         """Get list of department names for comboboxes"""
-        return [row[0] for row in self.db.execute_query("SELECT dept_name FROM departments WHERE status = 'active' ORDER BY dept_name")]
+        return [row[0] for row in self.db.cached_query("SELECT dept_name FROM departments WHERE status = 'active' ORDER BY dept_name")]
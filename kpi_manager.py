@@ -1,16 +1,77 @@
 
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, simpledialog
 import sqlite3
 import uuid
 from datetime import datetime
 
+from periods import parse_period, period_text, recent_months
+from text_search import KPI_FTS_WEIGHTS, fts_prefix_query
+from search_controller import SearchController
+from tree_sync import ChoiceList, ColumnSorter, VirtualTreeList, keyset_page, placeholders, sort_order
+
+
+# SQL sort expression of each list column, for click-to-sort
+KPI_SORT_COLUMNS = [
+    "k.kpi_code", "k.kpi_name", "COALESCE(d.dept_name, 'Không có')", "COALESCE(k.unit, '')",
+    "COALESCE(k.target_value, 0)", "COALESCE(k.weight, 0)",
+    "COALESCE(k.measurement_frequency, '')", "COALESCE(k.status, '')"
+]
+
+
+def kpi_rows(db, search_term="", dept_filter="Tất cả", where="1", params=(), sort=None,
+             after=None, before=None, limit=None, cancelled=None):
+    """Yield (id, *values) KPI list rows; usable without a UI.
+
+    A search term is matched as word prefixes through the kpi_fts index and
+    results are ranked by relevance; without FTS5 it falls back to LIKE.
+    sort is a ColumnSorter order, by rank or code when None. after, before
+    and limit select one keyset page (see keyset_page).
+    """
+    columns = """k.id, k.kpi_code, k.kpi_name, COALESCE(d.dept_name, 'Không có'), k.unit,
+               k.target_value, k.weight, k.measurement_frequency, k.status"""
+    source = "kpi k LEFT JOIN departments d ON k.department_id = d.id"
+    match = fts_prefix_query(search_term) if db.kpi_fts_enabled else None
+    if match:
+        # The ranked matches are materialized once and shared with the
+        # keyset anchor lookup
+        source = "f JOIN kpi k ON k.rowid = f.rowid LEFT JOIN departments d ON k.department_id = d.id"
+        query = """
+            WITH f AS (
+                SELECT rowid, bm25(kpi_fts, {}, {}, {}) AS score FROM kpi_fts WHERE kpi_fts MATCH ?
+            )
+        """.format(*KPI_FTS_WEIGHTS) + f"SELECT {columns} FROM {source} WHERE {where}"
+        params = [match, *params]
+    elif search_term:
+        query = f"""
+            SELECT {columns} FROM {source}
+            WHERE (LOWER(k.kpi_name) LIKE ? OR LOWER(k.kpi_code) LIKE ?) AND {where}
+        """
+        params = [f"%{search_term}%", f"%{search_term}%", *params]
+    else:
+        query = f"SELECT {columns} FROM {source} WHERE {where}"
+        params = list(params)
+
+    if match and sort is None:
+        order, descending = ["f.score", "k.kpi_code"], False
+    else:
+        order, descending = sort_order(sort or (0, False), KPI_SORT_COLUMNS, "k.kpi_code")
+
+    if dept_filter != "Tất cả":
+        query += " AND d.dept_name = ?"
+        params.append(dept_filter)
+
+    page, page_params, order_by = keyset_page(
+        order, f"SELECT {', '.join(order)} FROM {source} WHERE k.id = ?",
+        descending, after=after, before=before, limit=limit)
+    return db.iter_query(f"{query} AND {page} {order_by}", params + page_params,
+                         cancelled=cancelled)
+
 
 class KPIManager:
-    def __init__(self, parent_frame, db_manager, update_callback=None):
+    def __init__(self, parent_frame, db_manager):
         self.parent_frame = parent_frame
         self.db = db_manager
-        self.update_callback = update_callback
         self.kpi_vars = {}
 
         self.kpi_frequencies = ["Hàng ngày", "Hàng tuần",
@@ -19,6 +80,7 @@ class KPIManager:
                           "Số lượng", "Tỷ lệ", "Điểm", "Giờ", "Ngày"]
 
         self.create_widgets()
+        self.db.subscribe(self.on_data_changed, ['kpi', 'departments'])
 
     def create_widgets(self):
         """Create KPI management interface"""
@@ -130,15 +192,30 @@ class KPIManager:
 
         v_scroll = ttk.Scrollbar(
             right_panel, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=v_scroll.set)
+        self.view = VirtualTreeList(self.tree, v_scroll, self.list_rows)
 
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
         self.tree.bind('<<TreeviewSelect>>', self.on_select)
 
+        self.search = SearchController(
+            self.tree, lambda cancelled: self.list_rows(
+                limit=self.view.page_size, cancelled=cancelled), self.view.show)
+        self.sorter = ColumnSorter(self.tree, self.search.search_now)
+
         self.refresh_list()
-        self.update_comboboxes()
+
+        self.dept_choices = ChoiceList(
+            self.db, 'departments',
+            "SELECT id, dept_name, dept_name FROM departments WHERE status = 'active' AND {where}")
+        self.dept_choices.attach(self.dept_combobox)
+        self.dept_choices.attach(self.dept_filter_combo, prefix=["Tất cả"])
+
+        self.category_choices = ChoiceList(
+            self.db, 'kpi_categories',
+            "SELECT id, category_name, category_name FROM kpi_categories WHERE {where}")
+        self.category_choices.attach(self.category_combobox)
 
     def add_kpi(self):
         """Add new KPI"""
@@ -148,25 +225,11 @@ class KPIManager:
         category_name = self.kpi_vars['category_id'].get()
         dept_name = self.kpi_vars['department_id'].get()
 
-        category_id = None
-        if category_name:
-            cat_result = self.db.execute_query(
-                "SELECT id FROM kpi_categories WHERE category_name = ?", [
-                    category_name]
-            )
-            if cat_result:
-                category_id = cat_result[0][0]
-
-        dept_id = None
-        if dept_name:
-            dept_result = self.db.execute_query(
-                "SELECT id FROM departments WHERE dept_name = ?", [dept_name]
-            )
-            if dept_result:
-                dept_id = dept_result[0][0]
+        category_id = self.db.lookup_id('kpi_categories', 'category_name', category_name)
+        dept_id = self.db.lookup_id('departments', 'dept_name', dept_name)
 
         kpi_data = {
-            'id': str(uuid.uuid4()),
+            'uuid': str(uuid.uuid4()),
             'kpi_code': self.kpi_vars['kpi_code'].get(),
             'kpi_name': self.kpi_vars['kpi_name'].get(),
             'description': self.description_text.get("1.0", tk.END).strip(),
@@ -182,9 +245,6 @@ class KPIManager:
 
         try:
             self.db.insert_data('kpi', kpi_data)
-            self.refresh_list()
-            if self.update_callback:
-                self.update_callback()
             self.clear_form()
             messagebox.showinfo("Thành công", "Đã thêm KPI thành công!")
         except sqlite3.IntegrityError:
@@ -208,22 +268,8 @@ class KPIManager:
         category_name = self.kpi_vars['category_id'].get()
         dept_name = self.kpi_vars['department_id'].get()
 
-        category_id = None
-        if category_name:
-            cat_result = self.db.execute_query(
-                "SELECT id FROM kpi_categories WHERE category_name = ?", [
-                    category_name]
-            )
-            if cat_result:
-                category_id = cat_result[0][0]
-
-        dept_id = None
-        if dept_name:
-            dept_result = self.db.execute_query(
-                "SELECT id FROM departments WHERE dept_name = ?", [dept_name]
-            )
-            if dept_result:
-                dept_id = dept_result[0][0]
+        category_id = self.db.lookup_id('kpi_categories', 'category_name', category_name)
+        dept_id = self.db.lookup_id('departments', 'dept_name', dept_name)
 
         kpi_data = {
             'kpi_code': self.kpi_vars['kpi_code'].get(),
@@ -238,14 +284,40 @@ class KPIManager:
             'status': self.kpi_vars['status'].get()
         }
 
+        kpi_id, old_target = self.db.execute_query(
+            "SELECT id, target_value FROM kpi WHERE kpi_code = ?", [kpi_code])[0]
+        retarget = kpi_data['target_value'] != (old_target or 0)
+        effective_from = None
+        if retarget:
+            answer = simpledialog.askstring(
+                "Mục Tiêu Mới",
+                "Áp dụng mục tiêu mới từ kỳ nào? (vd. 2024-01, 2024-Q1)\n"
+                "Để trống để áp dụng cho mọi kỳ.",
+                initialvalue=period_text(recent_months(1)), parent=self.parent_frame)
+            if answer is None:
+                return
+            if answer.strip():
+                try:
+                    effective_from = parse_period(answer)
+                except ValueError:
+                    messagebox.showerror(
+                        "Lỗi", "Kỳ báo cáo phải có dạng 2024-01, 2024-Q1, 2024-H1 hoặc 2024!")
+                    return
+
         try:
-            self.db.update_data(
-                'kpi', kpi_data, {'column': 'kpi_code', 'value': kpi_code})
-            self.refresh_list()
-            if self.update_callback:
-                self.update_callback()
+            with self.db.transaction():
+                # Before the update, so the old target is kept for the
+                # periods before effective_from
+                recompute = (self.db.set_kpi_target(kpi_id, kpi_data['target_value'], effective_from)
+                             if retarget else None)
+                self.db.update_data(
+                    'kpi', kpi_data, {'column': 'kpi_code', 'value': kpi_code})
             self.clear_form()
-            messagebox.showinfo("Thành công", "Đã cập nhật KPI thành công!")
+            message = "Đã cập nhật KPI thành công!"
+            if recompute:
+                message += (f"\nĐã tính lại tỷ lệ đạt của {recompute.changed} kết quả "
+                            f"trong {recompute.seconds:.2f} giây.")
+            messagebox.showinfo("Thành công", message)
         except Exception as e:
             messagebox.showerror("Lỗi", f"Không thể cập nhật KPI: {str(e)}")
 
@@ -260,21 +332,9 @@ class KPIManager:
 
         if messagebox.askyesno("Xác nhận", "Bạn có chắc chắn muốn xóa KPI này?"):
             try:
-
-                kpi_id = self.db.execute_query(
-                    "SELECT id FROM kpi WHERE kpi_code = ?", [kpi_code]
-                )[0][0]
-
-                self.db.delete_data(
-                    'kpi_results', {'column': 'kpi_id', 'value': kpi_id})
-                self.db.delete_data('kpi_assignments', {
-                                    'column': 'kpi_id', 'value': kpi_id})
+                # Results and assignments cascade from the KPI row
                 self.db.delete_data(
                     'kpi', {'column': 'kpi_code', 'value': kpi_code})
-
-                self.refresh_list()
-                if self.update_callback:
-                    self.update_callback()
                 self.clear_form()
                 messagebox.showinfo(
                     "Thành công", "Đã xóa KPI và dữ liệu liên quan!")
@@ -305,7 +365,9 @@ class KPIManager:
         if selected:
             kpi_code = self.tree.item(selected[0])['values'][0]
             kpi_data = self.db.execute_query("""
-                SELECT k.*, c.category_name, d.dept_name 
+                SELECT k.id, k.kpi_code, k.kpi_name, k.description, c.category_name,
+                       d.dept_name, k.unit, k.target_value, k.weight,
+                       k.measurement_frequency, k.status
                 FROM kpi k
                 LEFT JOIN kpi_categories c ON k.category_id = c.id
                 LEFT JOIN departments d ON k.department_id = d.id
@@ -318,76 +380,54 @@ class KPIManager:
                 self.kpi_vars['kpi_name'].set(kpi[2])
                 self.description_text.delete("1.0", tk.END)
                 self.description_text.insert("1.0", kpi[3] or "")
-                self.kpi_vars['category_id'].set(kpi[13] or "")
-                self.kpi_vars['department_id'].set(kpi[14] or "")
+                self.kpi_vars['category_id'].set(kpi[4] or "")
+                self.kpi_vars['department_id'].set(kpi[5] or "")
                 self.kpi_vars['unit'].set(kpi[6] or "")
                 self.kpi_vars['target_value'].set(str(kpi[7] or ""))
                 self.kpi_vars['weight'].set(str(kpi[8] or ""))
                 self.kpi_vars['measurement_frequency'].set(kpi[9] or "")
-                self.kpi_vars['status'].set(kpi[11] or "active")
+                self.kpi_vars['status'].set(kpi[10] or "active")
 
     def search_kpi(self, event):
-        """Search KPI"""
-        self.filter_kpi()
+        """Search KPI once typing pauses"""
+        self.search.schedule()
 
     def filter_kpi(self, event=None):
         """Filter KPI list"""
-        search_term = self.search_var.get().lower()
-        dept_filter = self.dept_filter_var.get()
-
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        query = """
-            SELECT k.kpi_code, k.kpi_name, COALESCE(d.dept_name, 'Không có'), k.unit, 
-                   k.target_value, k.weight, k.measurement_frequency, k.status
-            FROM kpi k
-            LEFT JOIN departments d ON k.department_id = d.id
-            WHERE (LOWER(k.kpi_name) LIKE ? OR LOWER(k.kpi_code) LIKE ?)
-        """
-        params = [f"%{search_term}%", f"%{search_term}%"]
-
-        if dept_filter != "Tất cả":
-            query += " AND d.dept_name = ?"
-            params.append(dept_filter)
-
-        query += " ORDER BY k.kpi_code"
-
-        results = self.db.execute_query(query, params)
+        self.search.search_now()
 
-        for row in results:
-            self.tree.insert("", "end", values=row)
+    def list_rows(self, where="1", params=(), **page):
+        """Yield (id, *values) list rows matching the filters and where"""
+        return kpi_rows(self.db, self.search_var.get().lower(),
+                        self.dept_filter_var.get(), where, params, self.sorter.order, **page)
 
     def refresh_list(self):
         """Refresh KPI list"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+        self.search.cancel()
+        self.view.refresh()
 
-        query = """
-            SELECT k.kpi_code, k.kpi_name, COALESCE(d.dept_name, 'Không có'), k.unit, 
-                   k.target_value, k.weight, k.measurement_frequency, k.status
-            FROM kpi k
-            LEFT JOIN departments d ON k.department_id = d.id
-            ORDER BY k.kpi_code
-        """
-
-        results = self.db.execute_query(query)
-
-        for row in results:
-            self.tree.insert("", "end", values=row)
-
-    def update_comboboxes(self):
-        """Update comboboxes with current data"""
-
-        dept_names = [row[0] for row in self.db.execute_query(
-            "SELECT dept_name FROM departments WHERE status = 'active' ORDER BY dept_name")]
-        self.dept_combobox['values'] = dept_names
-        self.dept_filter_combo['values'] = ["Tất cả"] + dept_names
+    def on_data_changed(self, event):
+        """Patch the rows a committed write touched"""
+        if self.search.rerun_if_busy():
+            return
+        if event.keys is None or self.sorter.order is not None:
+            # Rows can move anywhere in a user-chosen order
+            self.refresh_list()
+            return
 
-        cat_names = [row[0] for row in self.db.execute_query(
-            "SELECT category_name FROM kpi_categories ORDER BY category_name")]
-        self.category_combobox['values'] = cat_names
+        keys = list(event.keys)
+        if event.table == 'departments':
+            if event.operation != 'update' or not keys:
+                return
+            # A renamed department changes the department column of its KPIs
+            keys = [row[0] for row in self.db.execute_query(
+                f"SELECT id FROM kpi WHERE department_id IN ({placeholders(keys)})", keys)]
+        if keys:
+            # Search results are ranked, not sorted by code; new matches go on top
+            sort_column = None if self.search_var.get().strip() else 0
+            self.view.patch(keys, self.list_rows(
+                f"k.id IN ({placeholders(keys)})", keys), sort_column=sort_column)
 
     def get_kpi_displays(self):
         """Get list of KPI displays for comboboxes"""
-        return [f"{row[0]} - {row[1]}" for row in self.db.execute_query("SELECT kpi_code, kpi_name FROM kpi WHERE status = 'active' ORDER BY kpi_code")]
+        return [f"{row[0]} - {row[1]}" for row in self.db.cached_query("SELECT kpi_code, kpi_name FROM kpi WHERE status = 'active' ORDER BY kpi_code")]
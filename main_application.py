@@ -1,4 +1,6 @@
 
+import argparse
+import os
 import tkinter as tk
 from tkinter import ttk, messagebox
 import sqlite3
@@ -6,21 +8,77 @@ import uuid
 from datetime import datetime
 
 
-from database_manager import DatabaseManager
+from database_manager import PERFORMANCE_PROFILES, DatabaseManager
+from query_stats import LATENCY_BUCKETS_MS
 from department_manager import DepartmentManager
 from staff_manager import StaffManager
 from kpi_manager import KPIManager
 from reports_manager import ReportsManager
+from periods import parse_period, period_filter, period_target, period_text
+from result_entry import ResultBatchEntry, achievement_percentage
+from tree_sync import ChoiceList, VirtualTreeList, keyset_page, patch_rows, placeholders
+
+
+def assignment_rows(db, where="1", params=(), after=None, before=None, limit=None):
+    """Yield (id, *values) KPI assignment list rows, newest first; usable
+    without a UI. after, before and limit select one keyset page.
+    """
+    page, page_params, order_by = keyset_page(
+        ["ka.assigned_date", "ka.id"], "SELECT assigned_date, id FROM kpi_assignments WHERE id = ?",
+        descending=True, after=after, before=before, limit=limit)
+    query = f"""
+        SELECT ka.id, k.kpi_code, k.kpi_name, s.staff_code, s.full_name, ka.role, ka.assigned_date
+        FROM kpi_assignments ka
+        JOIN kpi k ON ka.kpi_id = k.id
+        JOIN staff s ON ka.staff_id = s.id
+        WHERE {where} AND {page}
+        {order_by}
+    """
+
+    for row in db.iter_query(query, [*params, *page_params]):
+
+        assigned_date = datetime.fromisoformat(row[6]).strftime("%d/%m/%Y")
+        yield row[:6] + (assigned_date,)
+
+
+def results_rows(db, where="1", params=(), after=None, before=None, limit=None):
+    """Yield (id, *values) KPI result list rows, newest first; usable
+    without a UI. after, before and limit select one keyset page.
+    """
+    page, page_params, order_by = keyset_page(
+        ["kr.recorded_date", "kr.id"], "SELECT recorded_date, id FROM kpi_results WHERE id = ?",
+        descending=True, after=after, before=before, limit=limit)
+    query = f"""
+        SELECT kr.id, k.kpi_code, k.kpi_name, kr.period, {period_target('kr.period_start')},
+               kr.actual_value, kr.achievement_percentage, kr.note, kr.recorded_date
+        FROM kpi_results kr
+        JOIN kpi k ON kr.kpi_id = k.id
+        WHERE {where} AND {page}
+        {order_by}
+    """
+
+    for row in db.iter_query(query, [*params, *page_params]):
+
+        recorded_date = datetime.fromisoformat(row[8]).strftime("%d/%m/%Y")
+        achievement = f"{row[6]:.1f}%" if row[6] else "0%"
+
+        yield row[:6] + (achievement, row[7], recorded_date)
+
+
+# Environment variable naming the SQLite performance profile to run with;
+# --profile overrides it. Unset, the database runs with "safe", the only
+# profile that works for a database file on a network share.
+PROFILE_VARIABLE = 'KPI_DB_PROFILE'
 
 
 class MainApplication:
-    def __init__(self, root):
+    def __init__(self, root, profile="safe"):
         self.root = root
         self.root.title("Hệ Thống Quản Lý Tích Hợp - KPI, Phòng Ban, Cán Bộ")
         self.root.geometry("1600x1000")
         self.root.state('zoomed')
 
-        self.db = DatabaseManager()
+        self.db = DatabaseManager(profile=profile)
 
         self.kpi_frequencies = ["Hàng ngày", "Hàng tuần",
                                 "Hàng tháng", "Hàng quý", "Hàng năm"]
@@ -31,7 +89,12 @@ class MainApplication:
 
         self.db.load_sample_data()
 
-        self.update_all_comboboxes()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        """Release database connections and close the window"""
+        self.db.close()
+        self.root.destroy()
 
     def create_widgets(self):
 
@@ -58,24 +121,21 @@ class MainApplication:
         dept_frame = ttk.Frame(self.notebook)
         self.notebook.add(dept_frame, text="🏢 Phòng Ban")
 
-        self.dept_manager = DepartmentManager(
-            dept_frame, self.db, self.update_all_comboboxes)
+        self.dept_manager = DepartmentManager(dept_frame, self.db)
 
     def create_staff_tab(self):
         """Staff management tab"""
         staff_frame = ttk.Frame(self.notebook)
         self.notebook.add(staff_frame, text="👥 Cán Bộ")
 
-        self.staff_manager = StaffManager(
-            staff_frame, self.db, self.update_all_comboboxes)
+        self.staff_manager = StaffManager(staff_frame, self.db)
 
     def create_kpi_tab(self):
         """KPI management tab"""
         kpi_frame = ttk.Frame(self.notebook)
         self.notebook.add(kpi_frame, text="📊 KPI")
 
-        self.kpi_manager = KPIManager(
-            kpi_frame, self.db, self.update_all_comboboxes)
+        self.kpi_manager = KPIManager(kpi_frame, self.db)
 
     def create_kpi_assignment_tab(self):
         """KPI Assignment tab"""
@@ -131,11 +191,26 @@ class MainApplication:
 
         assign_v_scroll = ttk.Scrollbar(
             assign_list_frame, orient=tk.VERTICAL, command=self.assign_tree.yview)
-        self.assign_tree.configure(yscrollcommand=assign_v_scroll.set)
+        self.assign_view = VirtualTreeList(
+            self.assign_tree, assign_v_scroll,
+            lambda **page: assignment_rows(self.db, **page))
 
         self.assign_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         assign_v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
+        self.kpi_choices = ChoiceList(
+            self.db, 'kpi',
+            "SELECT id, kpi_code, kpi_code || ' - ' || kpi_name FROM kpi WHERE status = 'active' AND {where}")
+        self.kpi_choices.attach(self.assign_kpi_combo)
+        self.staff_choices = ChoiceList(
+            self.db, 'staff',
+            "SELECT id, staff_code, staff_code || ' - ' || full_name FROM staff WHERE status = 'active' AND {where}")
+        self.staff_choices.attach(self.assign_staff_combo)
+
+        self.refresh_assignment_list()
+        self.db.subscribe(self.on_assignments_changed,
+                          ['kpi_assignments', 'kpi', 'staff'])
+
     def create_kpi_results_tab(self):
         """KPI Results tracking tab"""
         results_frame = ttk.Frame(self.notebook)
@@ -181,7 +256,9 @@ class MainApplication:
         ttk.Button(results_btn_frame, text="Lưu Kết Quả",
                    command=self.save_kpi_result).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(results_btn_frame, text="Làm Mới",
-                   command=self.clear_results_form).pack(side=tk.LEFT)
+                   command=self.clear_results_form).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(results_btn_frame, text="Nhập Theo Kỳ...",
+                   command=self.open_batch_entry).pack(side=tk.LEFT)
 
         results_list_frame = ttk.LabelFrame(
             results_frame, text="Lịch Sử Kết Quả KPI", padding="15")
@@ -198,8 +275,15 @@ class MainApplication:
         results_filter_combo.bind('<<ComboboxSelected>>', self.filter_results)
         self.results_filter_combo = results_filter_combo
 
+        ttk.Label(filter_frame, text="Kỳ:").grid(row=0, column=2)
+        self.results_period_filter_var = tk.StringVar()
+        results_period_entry = ttk.Entry(
+            filter_frame, textvariable=self.results_period_filter_var, width=15)
+        results_period_entry.grid(row=0, column=3, padx=(5, 10))
+        results_period_entry.bind('<Return>', self.filter_results)
+
         ttk.Button(filter_frame, text="Làm Mới", command=self.refresh_results_list).grid(
-            row=0, column=2, padx=(10, 0))
+            row=0, column=4, padx=(10, 0))
 
         results_columns = ("KPI", "Tên KPI", "Kỳ", "Mục Tiêu",
                            "Thực Tế", "Đạt (%)", "Ghi Chú", "Ngày Ghi")
@@ -213,11 +297,19 @@ class MainApplication:
 
         results_v_scroll = ttk.Scrollbar(
             results_list_frame, orient=tk.VERTICAL, command=self.results_tree.yview)
-        self.results_tree.configure(yscrollcommand=results_v_scroll.set)
+        self.results_view = VirtualTreeList(
+            self.results_tree, results_v_scroll,
+            lambda **page: results_rows(self.db, *self.results_filter(), **page))
 
         self.results_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         results_v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
+        self.kpi_choices.attach(self.results_kpi_combo)
+        self.kpi_choices.attach(self.results_filter_combo, prefix=["Tất cả"])
+
+        self.refresh_results_list()
+        self.db.subscribe(self.on_results_changed, ['kpi_results', 'kpi'])
+
     def create_reports_tab(self):
         """Reports and analytics tab"""
         reports_frame = ttk.Frame(self.notebook)
@@ -270,9 +362,12 @@ class MainApplication:
         self.category_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         cat_v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
+        monitor_frame = ttk.Frame(admin_frame)
+        monitor_frame.pack(fill=tk.BOTH, expand=True)
+
         stats_frame = ttk.LabelFrame(
-            admin_frame, text="Thống Kê Cơ Sở Dữ Liệu", padding="15")
-        stats_frame.pack(fill=tk.BOTH, expand=True)
+            monitor_frame, text="Thống Kê Cơ Sở Dữ Liệu", padding="15")
+        stats_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
 
         self.stats_text = tk.Text(
             stats_frame, wrap=tk.WORD, font=('Consolas', 10), height=15)
@@ -283,10 +378,29 @@ class MainApplication:
         self.stats_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         stats_scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
-        ttk.Button(admin_frame, text="Cập Nhật Thống Kê",
-                   command=self.update_database_stats).pack(pady=10)
+        query_stats_frame = ttk.LabelFrame(
+            monitor_frame, text="Thống Kê Truy Vấn", padding="15")
+        query_stats_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+
+        self.query_stats_text = tk.Text(
+            query_stats_frame, wrap=tk.NONE, font=('Consolas', 10), height=15)
+        query_stats_scroll = ttk.Scrollbar(
+            query_stats_frame, orient=tk.VERTICAL, command=self.query_stats_text.yview)
+        self.query_stats_text.configure(yscrollcommand=query_stats_scroll.set)
+
+        self.query_stats_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        query_stats_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+
+        admin_btn_frame = ttk.Frame(admin_frame)
+        admin_btn_frame.pack(pady=10)
+
+        ttk.Button(admin_btn_frame, text="Cập Nhật Thống Kê",
+                   command=self.update_database_stats).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(admin_btn_frame, text="Xóa Thống Kê Truy Vấn",
+                   command=self.reset_query_stats).pack(side=tk.LEFT)
 
         self.refresh_category_list()
+        self.db.subscribe(self.on_categories_changed, ['kpi_categories'])
         self.update_database_stats()
 
     def assign_kpi(self):
@@ -302,10 +416,11 @@ class MainApplication:
         kpi_code = kpi_display.split(" - ")[0]
         staff_code = staff_display.split(" - ")[0]
 
-        kpi_id = self.db.execute_query(
-            "SELECT id FROM kpi WHERE kpi_code = ?", [kpi_code])[0][0]
-        staff_id = self.db.execute_query(
-            "SELECT id FROM staff WHERE staff_code = ?", [staff_code])[0][0]
+        kpi_id = self.db.lookup_id('kpi', 'kpi_code', kpi_code)
+        staff_id = self.db.lookup_id('staff', 'staff_code', staff_code)
+        if kpi_id is None or staff_id is None:
+            messagebox.showerror("Lỗi", "KPI hoặc cán bộ không tồn tại!")
+            return
 
         existing = self.db.execute_query(
             "SELECT id FROM kpi_assignments WHERE kpi_id = ? AND staff_id = ?",
@@ -317,7 +432,7 @@ class MainApplication:
             return
 
         assignment_data = {
-            'id': str(uuid.uuid4()),
+            'uuid': str(uuid.uuid4()),
             'kpi_id': kpi_id,
             'staff_id': staff_id,
             'assigned_date': datetime.now().isoformat(),
@@ -326,7 +441,6 @@ class MainApplication:
 
         try:
             self.db.insert_data('kpi_assignments', assignment_data)
-            self.refresh_assignment_list()
             messagebox.showinfo("Thành công", "Đã phân công KPI thành công!")
         except Exception as e:
             messagebox.showerror("Lỗi", f"Không thể phân công KPI: {str(e)}")
@@ -339,23 +453,12 @@ class MainApplication:
                 "Cảnh báo", "Vui lòng chọn phân công để hủy!")
             return
 
-        kpi_code = self.assign_tree.item(selected[0])['values'][0]
-        staff_code = self.assign_tree.item(selected[0])['values'][2]
-
         if messagebox.askyesno("Xác nhận", "Bạn có chắc chắn muốn hủy phân công này?"):
             try:
+                # Tree rows are keyed by the assignment id
+                self.db.delete_data(
+                    'kpi_assignments', {'column': 'id', 'value': selected[0]})
 
-                kpi_id = self.db.execute_query(
-                    "SELECT id FROM kpi WHERE kpi_code = ?", [kpi_code])[0][0]
-                staff_id = self.db.execute_query(
-                    "SELECT id FROM staff WHERE staff_code = ?", [staff_code])[0][0]
-
-                self.db.execute_query(
-                    "DELETE FROM kpi_assignments WHERE kpi_id = ? AND staff_id = ?",
-                    [kpi_id, staff_id]
-                )
-
-                self.refresh_assignment_list()
                 messagebox.showinfo("Thành công", "Đã hủy phân công KPI!")
             except Exception as e:
                 messagebox.showerror(
@@ -363,24 +466,25 @@ class MainApplication:
 
     def refresh_assignment_list(self):
         """Refresh assignment list"""
-        for item in self.assign_tree.get_children():
-            self.assign_tree.delete(item)
-
-        query = """
-            SELECT k.kpi_code, k.kpi_name, s.staff_code, s.full_name, ka.role, ka.assigned_date
-            FROM kpi_assignments ka
-            JOIN kpi k ON ka.kpi_id = k.id
-            JOIN staff s ON ka.staff_id = s.id
-            ORDER BY ka.assigned_date DESC
-        """
+        self.assign_view.refresh()
 
-        results = self.db.execute_query(query)
-
-        for row in results:
+    def on_assignments_changed(self, event):
+        """Patch the assignment rows a committed write touched"""
+        if event.keys is None:
+            self.refresh_assignment_list()
+            return
 
-            assigned_date = datetime.fromisoformat(row[5]).strftime("%d/%m/%Y")
-            self.assign_tree.insert(
-                "", "end", values=row[:5] + (assigned_date,))
+        keys = list(event.keys)
+        if event.table != 'kpi_assignments':
+            if event.operation != 'update' or not keys:
+                return
+            # Renamed KPIs and staff change the name columns of their assignments
+            column = 'kpi_id' if event.table == 'kpi' else 'staff_id'
+            keys = [row[0] for row in self.db.execute_query(
+                f"SELECT id FROM kpi_assignments WHERE {column} IN ({placeholders(keys)})", keys)]
+        if keys:
+            self.assign_view.patch(keys, assignment_rows(
+                self.db, f"ka.id IN ({placeholders(keys)})", keys))
 
     def save_kpi_result(self):
         """Save KPI result"""
@@ -388,40 +492,44 @@ class MainApplication:
             return
 
         kpi_display = self.results_vars['kpi_id'].get()
-        period = self.results_vars['period'].get()
+        period = parse_period(self.results_vars['period'].get())
         actual_value = float(self.results_vars['actual_value'].get())
         note = self.results_vars['note'].get()
 
         kpi_code = kpi_display.split(" - ")[0]
+        # The target the KPI had in this period, which may since have changed
         kpi_data = self.db.execute_query(
-            "SELECT id, target_value FROM kpi WHERE kpi_code = ?", [kpi_code]
+            f"SELECT id, {period_target('?')} FROM kpi k WHERE kpi_code = ?",
+            [period.start, kpi_code]
         )[0]
 
         kpi_id = kpi_data[0]
-        target_value = kpi_data[1] or 1
-
-        achievement_percentage = (
-            actual_value / target_value * 100) if target_value > 0 else 0
+        target_value = kpi_data[1]
 
         result_data = {
-            'id': str(uuid.uuid4()),
+            'uuid': str(uuid.uuid4()),
             'kpi_id': kpi_id,
-            'period': period,
+            'period': period_text(period),
             'actual_value': actual_value,
-            'achievement_percentage': achievement_percentage,
+            'achievement_percentage': achievement_percentage(actual_value, target_value),
             'note': note,
             'recorded_by': 'System',
             'recorded_date': datetime.now().isoformat()
         }
 
         try:
-            self.db.insert_data('kpi_results', result_data)
-            self.refresh_results_list()
+            # Saving a period again replaces its value; the old one is kept
+            # in kpi_result_history
+            self.db.upsert_data('kpi_results', result_data, ('kpi_id', 'period'))
             self.clear_results_form()
             messagebox.showinfo("Thành công", "Đã lưu kết quả KPI thành công!")
         except Exception as e:
             messagebox.showerror("Lỗi", f"Không thể lưu kết quả: {str(e)}")
 
+    def open_batch_entry(self):
+        """Open the grid for entering every KPI's result of one period"""
+        ResultBatchEntry(self.root, self.db, self.results_vars['period'].get())
+
     def validate_results_input(self):
         """Validate results input"""
         if not self.results_vars['kpi_id'].get():
@@ -435,6 +543,12 @@ class MainApplication:
         except ValueError:
             messagebox.showerror("Lỗi", "Giá trị thực tế phải là số!")
             return False
+        try:
+            parse_period(self.results_vars['period'].get())
+        except ValueError:
+            messagebox.showerror(
+                "Lỗi", "Kỳ báo cáo phải có dạng 2024-01, 2024-Q1, 2024-H1 hoặc 2024!")
+            return False
         return True
 
     def clear_results_form(self):
@@ -447,28 +561,47 @@ class MainApplication:
         """Filter results"""
         self.refresh_results_list()
 
-    def refresh_results_list(self):
-        """Refresh results list"""
-        for item in self.results_tree.get_children():
-            self.results_tree.delete(item)
-
-        query = """
-            SELECT k.kpi_code, k.kpi_name, kr.period, k.target_value, kr.actual_value, 
-                   kr.achievement_percentage, kr.note, kr.recorded_date
-            FROM kpi_results kr
-            JOIN kpi k ON kr.kpi_id = k.id
-            ORDER BY kr.recorded_date DESC
-        """
+    def results_filter(self):
+        """WHERE condition and params for the KPI and period filters.
 
-        results = self.db.execute_query(query)
+        The period filter takes any period parse_period accepts and matches
+        results lying within it; one that does not parse is ignored.
+        """
+        conditions, params = ["1"], []
+        kpi_code = self.results_filter_var.get().split(" - ")[0]
+        if kpi_code and kpi_code != "Tất cả":
+            conditions.append("kr.kpi_id = ?")
+            params.append(self.db.lookup_id('kpi', 'kpi_code', kpi_code))
+        try:
+            period = parse_period(self.results_period_filter_var.get())
+        except ValueError:
+            pass
+        else:
+            condition, period_params = period_filter(period)
+            conditions.append(condition)
+            params += period_params
+        return " AND ".join(conditions), params
 
-        for row in results:
+    def refresh_results_list(self):
+        """Refresh results list"""
+        self.results_view.refresh()
 
-            recorded_date = datetime.fromisoformat(row[7]).strftime("%d/%m/%Y")
-            achievement = f"{row[5]:.1f}%" if row[5] else "0%"
+    def on_results_changed(self, event):
+        """Patch the result rows a committed write touched"""
+        if event.keys is None:
+            self.refresh_results_list()
+            return
 
-            display_row = row[:5] + (achievement, row[6], recorded_date)
-            self.results_tree.insert("", "end", values=display_row)
+        keys = list(event.keys)
+        if event.table == 'kpi':
+            if event.operation != 'update' or not keys:
+                return
+            # KPI name and target are shown on every result row of the KPI
+            keys = [row[0] for row in self.db.execute_query(
+                f"SELECT id FROM kpi_results WHERE kpi_id IN ({placeholders(keys)})", keys)]
+        if keys:
+            self.results_view.patch(keys, results_rows(
+                self.db, f"kr.id IN ({placeholders(keys)})", keys))
 
     def add_category(self):
         """Add KPI category"""
@@ -480,7 +613,7 @@ class MainApplication:
             return
 
         category_data = {
-            'id': str(uuid.uuid4()),
+            'uuid': str(uuid.uuid4()),
             'category_name': category_name,
             'description': category_desc,
             'created_date': datetime.now().isoformat()
@@ -488,8 +621,6 @@ class MainApplication:
 
         try:
             self.db.insert_data('kpi_categories', category_data)
-            self.refresh_category_list()
-            self.update_all_comboboxes()
             self.category_name_var.set("")
             self.category_desc_var.set("")
             messagebox.showinfo("Thành công", "Đã thêm danh mục thành công!")
@@ -498,18 +629,31 @@ class MainApplication:
         except Exception as e:
             messagebox.showerror("Lỗi", f"Không thể thêm danh mục: {str(e)}")
 
+    def category_rows(self, where="1", params=()):
+        """Return (id, *values) category list rows matching where"""
+        categories = self.db.execute_query(
+            f"""SELECT id, uuid, category_name, description, created_date
+                FROM kpi_categories WHERE {where} ORDER BY category_name""", params)
+
+        return [(cat[0], cat[1][:8] + "...", cat[2], cat[3],
+                 datetime.fromisoformat(cat[4]).strftime("%d/%m/%Y"))
+                for cat in categories]
+
     def refresh_category_list(self):
         """Refresh category list"""
-        for item in self.category_tree.get_children():
-            self.category_tree.delete(item)
+        self.category_tree.delete(*self.category_tree.get_children())
 
-        categories = self.db.execute_query(
-            "SELECT * FROM kpi_categories ORDER BY category_name")
+        for row in self.category_rows():
+            self.category_tree.insert("", "end", iid=row[0], values=row[1:])
 
-        for cat in categories:
-            created_date = datetime.fromisoformat(cat[3]).strftime("%d/%m/%Y")
-            self.category_tree.insert("", "end", values=(
-                cat[0][:8] + "...", cat[1], cat[2], created_date))
+    def on_categories_changed(self, event):
+        """Patch the category rows a committed write touched"""
+        if event.keys is None:
+            self.refresh_category_list()
+        elif event.keys:
+            keys = list(event.keys)
+            patch_rows(self.category_tree, keys, self.category_rows(
+                f"id IN ({placeholders(keys)})", keys), sort_column=1)
 
     def update_database_stats(self):
         """Update database statistics display"""
@@ -544,55 +688,85 @@ class MainApplication:
         stats.extend([
             "",
             "HOẠT ĐỘNG GẦN ĐÂY:",
-            f"Kết quả KPI tuần qua: {recent_kpi_results}",
+            f"Kết quả KPI tuần qua: {recent_kpi_results}"
+        ])
+
+        settings = self.db.get_performance_settings()
+        pool = self.db.get_pool_stats()
+        cache = self.db.get_cache_stats()
+        stats.extend([
+            "",
+            "CẤU HÌNH HIỆU NĂNG:",
+            f"Hồ sơ hiệu năng: {settings['profile']}",
+            f"Journal mode: {settings['journal_mode']}",
+            f"Synchronous: {settings['synchronous']}",
+            f"Cache size: {settings['cache_size']}",
+            f"Mmap size: {settings['mmap_size']}",
+            f"Temp store: {settings['temp_store']}",
+            f"Busy timeout: {settings['busy_timeout']} ms",
+            f"Kết nối mở / tối đa: {pool['open_connections']} / {pool['max_connections']}",
+            f"Kết nối đã tạo: {pool['connections_opened']}",
+            f"Lượt tái sử dụng kết nối: {pool['reuse_hits']}",
+            f"Thời gian chờ kết nối: {pool['wait_time'] * 1000:.1f} ms ({pool['waits']} lần)",
+            "",
+            "BỘ NHỚ ĐỆM TRUY VẤN:",
+            f"Số mục: {cache['entries']} ({cache['bytes_used'] / 1024:.1f} / {cache['max_bytes'] / 1024:.0f} KB)",
+            f"Trúng / trượt: {cache['hits']} / {cache['misses']} ({cache['hit_rate'] * 100:.1f}%)",
+            f"Bị loại (LRU) / hết hạn: {cache['evictions']} / {cache['invalidations']}",
+            f"Bảng tra mã tải / cập nhật: {cache['lookup_loads']} / {cache['lookup_patches']}",
+            "",
+            f"Phiên bản lược đồ: {self.db.get_schema_version()}",
             f"Cập nhật lần cuối: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
         ])
 
         self.stats_text.delete("1.0", tk.END)
         self.stats_text.insert("1.0", "\n".join(stats))
 
-    def update_all_comboboxes(self):
-        """Update all comboboxes with current data"""
-
-        if hasattr(self, 'dept_manager'):
-
-            pass
-
-        if hasattr(self, 'staff_manager'):
-            self.staff_manager.update_department_comboboxes()
-
-        if hasattr(self, 'kpi_manager'):
-            self.kpi_manager.update_comboboxes()
-
-        if hasattr(self, 'assign_kpi_combo'):
-            kpi_displays = [f"{row[0]} - {row[1]}" for row in self.db.execute_query(
-                "SELECT kpi_code, kpi_name FROM kpi WHERE status = 'active' ORDER BY kpi_code")]
-            self.assign_kpi_combo['values'] = kpi_displays
+        self.update_query_stats()
+
+    def update_query_stats(self):
+        """Show the slowest statements and the slow-query log"""
+        lines = ["TRUY VẤN TỐN THỜI GIAN NHẤT:", ""]
+
+        for entry in self.db.get_query_stats()[:15]:
+            lines.extend([
+                entry['sql'][:120],
+                f"    Số lần: {entry['calls']} | Tổng: {entry['total_ms']:.1f} ms | "
+                f"TB: {entry['avg_ms']:.2f} ms | Max: {entry['max_ms']:.2f} ms | Dòng: {entry['rows']}",
+                "    Phân bố (ms): " + " ".join(
+                    f"≤{bound:g}:{count}" for bound, count in zip(LATENCY_BUCKETS_MS, entry['histogram']) if count),
+                ""
+            ])
+
+        slow_queries = self.db.get_slow_queries()
+        lines.extend([
+            f"TRUY VẤN CHẬM (≥ {self.db.query_stats.slow_query_ms} ms): {len(slow_queries)}",
+            ""
+        ])
+        for slow in slow_queries[:20]:
+            lines.append(f"[{slow['elapsed_ms']:.1f} ms] {slow['sql'][:120]}")
+            lines.extend(f"    {step}" for step in slow['plan'])
+            lines.append("")
 
-        if hasattr(self, 'assign_staff_combo'):
-            staff_displays = [f"{row[0]} - {row[1]}" for row in self.db.execute_query(
-                "SELECT staff_code, full_name FROM staff WHERE status = 'active' ORDER BY staff_code")]
-            self.assign_staff_combo['values'] = staff_displays
+        self.query_stats_text.delete("1.0", tk.END)
+        self.query_stats_text.insert("1.0", "\n".join(lines))
 
-        if hasattr(self, 'results_kpi_combo'):
-            kpi_displays = [f"{row[0]} - {row[1]}" for row in self.db.execute_query(
-                "SELECT kpi_code, kpi_name FROM kpi WHERE status = 'active' ORDER BY kpi_code")]
-            self.results_kpi_combo['values'] = kpi_displays
-
-        if hasattr(self, 'results_filter_combo'):
-            kpi_displays = [f"{row[0]} - {row[1]}" for row in self.db.execute_query(
-                "SELECT kpi_code, kpi_name FROM kpi WHERE status = 'active' ORDER BY kpi_code")]
-            self.results_filter_combo['values'] = ["Tất cả"] + kpi_displays
-
-        if hasattr(self, 'assign_tree'):
-            self.refresh_assignment_list()
-        if hasattr(self, 'results_tree'):
-            self.refresh_results_list()
+    def reset_query_stats(self):
+        """Clear collected query statistics"""
+        self.db.reset_query_stats()
+        self.update_query_stats()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Hệ Thống Quản Lý Tích Hợp - KPI, Phòng Ban, Cán Bộ")
+    parser.add_argument(
+        '--profile', default=os.environ.get(PROFILE_VARIABLE, 'safe'),
+        help=f"SQLite performance profile: {', '.join(PERFORMANCE_PROFILES)} "
+             f"(default: ${PROFILE_VARIABLE}, else safe)")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = MainApplication(root)
+    app = MainApplication(root, args.profile)
     root.mainloop()
 
 
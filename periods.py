@@ -0,0 +1,117 @@
+import re
+from collections import namedtuple
+from datetime import date
+
+from text_search import normalize_text
+
+
+# A reporting period as its granularity and its first and last month, both
+# inclusive, as month ordinals (year * 12 + month - 1). Periods of any
+# granularity compare and align on these: 2024-Q2 spans 2024-04 to 2024-06.
+Period = namedtuple('Period', ['granularity', 'start', 'end'])
+
+# Months spanned by one period of each granularity
+GRANULARITY_MONTHS = {'month': 1, 'quarter': 3, 'half': 6, 'year': 12}
+
+# Stored for periods that cannot be parsed; their start and end stay NULL,
+# so range filters never match them
+UNKNOWN_GRANULARITY = 'unknown'
+
+# Granularities KPI results are rolled up by, besides all time
+ROLLUP_GRANULARITIES = ('month', 'quarter', 'year')
+
+# Granularity and period_start of each KPI's all-time rollup row
+ALL_TIME = 'all'
+
+YEAR_TOKEN = re.compile(r"\d{4}")
+
+# What is left of a period once its year and "năm" are removed, by granularity
+PERIOD_PARTS = [
+    ('quarter', re.compile(r"(?:q|quy)([1-4])")),
+    ('half', re.compile(r"h([12])")),
+    ('month', re.compile(r"(?:t|thang)?(\d{1,2})")),
+]
+
+
+def month_ordinal(year, month):
+    """Month ordinal of a calendar month: 2024-01 -> 24288"""
+    return year * 12 + month - 1
+
+
+def parse_period(text):
+    """Parse a period as typed into a Period.
+
+    Accepts a month ("2024-01", "01/2024", "Tháng 1/2024"), a quarter
+    ("2024-Q1", "Q1/2024", "Quý 1 2024"), a half year ("2024-H1") or a
+    year ("2024"), with any punctuation and without accents. Raises
+    ValueError for anything else.
+    """
+    tokens = normalize_text(text).split()
+    years = [token for token in tokens if YEAR_TOKEN.fullmatch(token)]
+    if len(years) != 1:
+        raise ValueError(f"Not a period: {text!r}")
+    year = int(years[0])
+    rest = ''.join(token for token in tokens if token not in (years[0], 'nam'))
+    if not rest:
+        return Period('year', month_ordinal(year, 1), month_ordinal(year, 12))
+    for granularity, pattern in PERIOD_PARTS:
+        match = pattern.fullmatch(rest)
+        if match:
+            index = int(match.group(1))
+            months = GRANULARITY_MONTHS[granularity]
+            if index * months > 12 or not index:
+                break
+            start = month_ordinal(year, (index - 1) * months + 1)
+            return Period(granularity, start, start + months - 1)
+    raise ValueError(f"Not a period: {text!r}")
+
+
+def period_text(period):
+    """Canonical text of a Period: 2024-01, 2024-Q1, 2024-H1 or 2024"""
+    year, month = divmod(period.start, 12)
+    if period.granularity == 'month':
+        return f"{year}-{month + 1:02d}"
+    if period.granularity == 'quarter':
+        return f"{year}-Q{month // 3 + 1}"
+    if period.granularity == 'half':
+        return f"{year}-H{month // 6 + 1}"
+    return str(year)
+
+
+def period_containing(ordinal, granularity):
+    """The period of granularity that contains the month ordinal"""
+    months = GRANULARITY_MONTHS[granularity]
+    start = ordinal - ordinal % months
+    return Period(granularity, start, start + months - 1)
+
+
+def recent_months(count, today=None):
+    """Period of the last count months up to and including this month"""
+    today = today or date.today()
+    end = month_ordinal(today.year, today.month)
+    return Period('month', end - count + 1, end)
+
+
+def period_filter(period, alias='kr'):
+    """WHERE condition and params matching results whose period lies
+    within period, for a results table aliased as alias.
+
+    The condition bounds period_start on both sides so it runs as a range
+    scan of the period index; a quarter or year result only matches a
+    filter that covers all of its months.
+    """
+    return (f"{alias}.period_start BETWEEN ? AND ? AND {alias}.period_end <= ?",
+            [period.start, period.end, period.end])
+
+
+def period_target(start, kpi_alias='k'):
+    """SQL expression for the target a KPI had in the period starting at
+    start, an SQL month ordinal, for a kpi table aliased as kpi_alias.
+
+    That is the kpi_targets version with the latest effective_start not
+    after start. KPIs without versions, and periods that do not parse,
+    use the KPI's target_value.
+    """
+    return (f"COALESCE((SELECT kt.target_value FROM kpi_targets kt "
+            f"WHERE kt.kpi_id = {kpi_alias}.id AND kt.effective_start <= {start} "
+            f"ORDER BY kt.effective_start DESC LIMIT 1), {kpi_alias}.target_value)")
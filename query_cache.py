@@ -0,0 +1,173 @@
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+
+TABLE_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)", re.IGNORECASE)
+WRITE_PATTERN = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)",
+    re.IGNORECASE)
+
+
+def tables_read(query):
+    """Return the tables a SELECT reads from"""
+    return frozenset(name.lower() for name in TABLE_PATTERN.findall(query))
+
+
+def table_written(query):
+    """Return the table a write statement modifies, or None for reads"""
+    match = WRITE_PATTERN.match(query)
+    return match.group(1).lower() if match else None
+
+
+def estimate_size(rows):
+    """Rough memory footprint of a fetched result in bytes"""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+class QueryCache:
+    """LRU cache of query results validated against per-table write counters"""
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def versions(self, tables):
+        """Return the current write counters for tables"""
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in sorted(tables))
+
+    def bump(self, tables):
+        """Advance the write counters of tables, invalidating their entries"""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def get(self, key, tables):
+        """Return cached rows for key, or None on a miss or stale entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            current = tuple(self._versions.get(table, 0) for table in sorted(tables))
+            if entry is not None and entry[1] == current:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+                self.invalidations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, rows, versions):
+        """Store rows read at the given table versions"""
+        size = estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (rows, versions, size)
+            self.bytes_used += size
+            while self.bytes_used > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        """Drop one entry; the lock must be held"""
+        self.bytes_used -= self._entries.pop(key)[2]
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get_stats(self):
+        """Return hit/miss counters and memory use"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes_used': self.bytes_used,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+class KeyLookup:
+    """value -> id maps for lookup columns, shared by every caller.
+
+    A map is loaded on first use with load(table, column), which returns
+    (value, id) rows, first row winning for duplicate values. Committed
+    change events then patch it through on_change: load(table, column,
+    keys, values) returns the lowest id of every value in values or held
+    by a row in keys, so writes to a table cost a small indexed read
+    instead of a reload. Events without keys drop the table's maps.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self._lock = threading.Lock()
+        self._maps = {}
+        # Change events seen per table; a map loaded while one arrives may
+        # have missed it and is used once but not kept
+        self._changes = {}
+        self.loads = 0
+        self.patches = 0
+
+    def get(self, table, column, value):
+        """Return the id of the row whose column equals value, or None"""
+        with self._lock:
+            mapping = self._maps.get((table, column))
+            changes = self._changes.get(table, 0)
+        if mapping is None:
+            mapping = {}
+            for found, row_id in self.load(table, column):
+                mapping.setdefault(found, row_id)
+            with self._lock:
+                self.loads += 1
+                if self._changes.get(table, 0) == changes:
+                    self._maps[(table, column)] = mapping
+        return mapping.get(value)
+
+    def on_change(self, event):
+        """Patch the loaded maps of the table a committed write changed"""
+        with self._lock:
+            self._changes[event.table] = self._changes.get(event.table, 0) + 1
+            loaded = [(key, mapping) for key, mapping in self._maps.items()
+                      if key[0] == event.table]
+            if event.keys is None:
+                for key, _ in loaded:
+                    del self._maps[key]
+                return
+        keys = set(event.keys)
+        for (table, column), mapping in loaded:
+            with self._lock:
+                old_values = [value for value, row_id in mapping.items() if row_id in keys]
+            rows = self.load(table, column, keys, old_values)
+            with self._lock:
+                for value in old_values:
+                    mapping.pop(value, None)
+                mapping.update(rows)
+                self.patches += 1
+
+    def clear(self):
+        """Drop every map"""
+        with self._lock:
+            self._maps.clear()
@@ -0,0 +1,96 @@
+import re
+import threading
+from collections import deque
+from datetime import datetime
+
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+LATENCY_BUCKETS_MS = [1, 5, 10, 50, 100, 500, 1000, float('inf')]
+
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def normalize_sql(query):
+    """Collapse whitespace and literals so equivalent statements share a key"""
+    query = re.sub(r"'(?:[^']|'')*'", "?", query)
+    query = re.sub(r"\b\d+(\.\d+)?\b", "?", query)
+    query = re.sub(r"\s+", " ", query).strip()
+    return re.sub(r"\(\s*\?(\s*,\s*\?)+\s*\)", "(?, ...)", query)
+
+
+class QueryStats:
+    """Per-statement latency histogram and slow-query log"""
+
+    def __init__(self, slow_query_ms=100, slow_log_size=100):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._slow = deque(maxlen=slow_log_size)
+
+    def record(self, query, elapsed, rows, conn=None, params=None):
+        """Record one execution; slow ones also capture their query plan"""
+        key = normalize_sql(query)
+        elapsed_ms = elapsed * 1000
+
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {
+                    'sql': key,
+                    'calls': 0,
+                    'rows': 0,
+                    'total_ms': 0.0,
+                    'min_ms': elapsed_ms,
+                    'max_ms': 0.0,
+                    'histogram': [0] * len(LATENCY_BUCKETS_MS)
+                }
+            entry['calls'] += 1
+            entry['rows'] += max(rows or 0, 0)
+            entry['total_ms'] += elapsed_ms
+            entry['min_ms'] = min(entry['min_ms'], elapsed_ms)
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    entry['histogram'][i] += 1
+                    break
+
+        if elapsed_ms >= self.slow_query_ms:
+            plan = self._explain(conn, query, params)
+            with self._lock:
+                self._slow.append({
+                    'sql': key,
+                    'elapsed_ms': elapsed_ms,
+                    'rows': rows,
+                    'plan': plan,
+                    'recorded_date': datetime.now().isoformat()
+                })
+
+    def _explain(self, conn, query, params):
+        """Return EXPLAIN QUERY PLAN lines, or [] when unavailable"""
+        if conn is None or not query.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params or []).fetchall()
+        except Exception:
+            return []
+        return [row[-1] for row in rows]
+
+    def snapshot(self, order_by='total_ms'):
+        """Return statement stats sorted by the given field, largest first"""
+        with self._lock:
+            entries = [dict(entry, histogram=list(entry['histogram']))
+                       for entry in self._stats.values()]
+        for entry in entries:
+            entry['avg_ms'] = entry['total_ms'] / entry['calls']
+        return sorted(entries, key=lambda e: e[order_by], reverse=True)
+
+    def slow_queries(self):
+        """Return the slow-query log, newest first"""
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def reset(self):
+        """Forget all recorded statements"""
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
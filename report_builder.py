@@ -0,0 +1,469 @@
+import csv
+import json
+import os
+from datetime import datetime
+from operator import itemgetter
+
+from amounts import AMOUNT_COLUMNS, format_amount, parse_amount
+from database_manager import FOREIGN_KEYS
+from periods import ALL_TIME, parse_period, period_containing, period_text, recent_months
+
+
+# Backup order: parents before the tables that reference them
+BACKUP_TABLES = ['departments', 'staff', 'kpi_categories', 'kpi', 'kpi_targets',
+                 'kpi_assignments', 'kpi_results', 'kpi_result_history']
+
+# Department totals of the per-KPI rollups: all time, and the quarter whose
+# period_start is the query's one parameter. Summed when read rather than
+# stored, so moving a KPI to another department needs no rollup update.
+# Each result counts once, as in AVG over kpi_results; averaging through
+# kpi_assignments counted it once per staff member its KPI is assigned to.
+DEPT_ROLLUPS = f"""
+    SELECT k.department_id,
+           SUM(CASE WHEN r.granularity = '{ALL_TIME}' THEN r.result_count END) AS result_count,
+           SUM(CASE WHEN r.granularity = '{ALL_TIME}' THEN r.achievement_count END) AS achievement_count,
+           SUM(CASE WHEN r.granularity = '{ALL_TIME}' THEN r.achievement_sum END) AS achievement_sum,
+           SUM(CASE WHEN r.granularity = 'quarter' THEN r.achievement_count END) AS quarter_count,
+           SUM(CASE WHEN r.granularity = 'quarter' THEN r.achievement_sum END) AS quarter_sum
+    FROM kpi_rollups r
+    JOIN kpi k ON k.id = r.kpi_id
+    WHERE r.granularity = '{ALL_TIME}' OR r.granularity = 'quarter' AND r.period_start = ?
+    GROUP BY k.department_id
+"""
+
+# Columns filled from other columns of their row when it is written
+DERIVED_COLUMNS = {'kpi_results': ('period_granularity', 'period_start', 'period_end')}
+
+# Width of one salary band in the overview report, in VND
+SALARY_BAND = 10000000
+
+
+class ReportBuilder:
+    """Builds reports, CSV exports and backups without any UI.
+
+    ReportsManager shows the results; benchmarks and scripts call it directly.
+    """
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+
+    def overview_report(self):
+        """Generate comprehensive overview report"""
+
+        total_depts = self.db.execute_query(
+            "SELECT COUNT(*) FROM departments WHERE status = 'active'")[0][0]
+        total_staff = self.db.execute_query(
+            "SELECT COUNT(*) FROM staff WHERE status = 'active'")[0][0]
+        total_kpis = self.db.execute_query(
+            "SELECT COUNT(*) FROM kpi WHERE status = 'active'")[0][0]
+        total_assignments = self.db.execute_query(
+            "SELECT COUNT(*) FROM kpi_assignments")[0][0]
+
+        dept_stats = self.db.execute_query("""
+            SELECT d.dept_name, COUNT(s.id) as staff_count
+            FROM departments d
+            LEFT JOIN staff s ON d.id = s.department_id AND s.status = 'active'
+            WHERE d.status = 'active'
+            GROUP BY d.id, d.dept_name
+            ORDER BY staff_count DESC
+            LIMIT 1
+        """)
+
+        top_dept = dept_stats[0] if dept_stats else ("Không có", 0)
+
+        total_results, avg_achievement = self.db.execute_query(f"""
+            SELECT SUM(result_count), SUM(achievement_sum) / SUM(achievement_count)
+            FROM kpi_rollups
+            WHERE granularity = '{ALL_TIME}'
+        """)[0]
+        total_results = total_results or 0
+        avg_achievement = avg_achievement or 0
+
+        # Amounts are integer columns, so these aggregate straight off the
+        # (status, basic_salary) index without converting any row
+        total_budget = self.db.execute_query(
+            "SELECT SUM(budget) FROM departments WHERE status = 'active'")[0][0]
+        total_salary, avg_salary = self.db.execute_query(
+            "SELECT SUM(basic_salary), AVG(basic_salary) FROM staff WHERE status = 'active'")[0]
+        salary_bands = self.db.execute_query(f"""
+            SELECT basic_salary / {SALARY_BAND} AS band, COUNT(*)
+            FROM staff
+            WHERE status = 'active' AND basic_salary IS NOT NULL
+            GROUP BY band
+            ORDER BY band
+        """)
+        band_lines = "\n".join(
+            f"• {format_amount(band * SALARY_BAND)} - {format_amount((band + 1) * SALARY_BAND)} VND: {count} người"
+            for band, count in salary_bands) or "• Chưa có dữ liệu lương"
+
+        failures = self.db.get_amount_parse_failures()
+        failure_section = ""
+        if failures:
+            failure_lines = "\n".join(
+                f"• {table}.{column} ({code}): {raw!r}" for table, code, column, raw in failures)
+            failure_section = f"""
+⚠ GIÁ TRỊ TIỀN KHÔNG HỢP LỆ (đã để trống khi chuyển sang kiểu số):
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+{failure_lines}
+"""
+
+        report = f"""
+╔══════════════════════════════════════════════════════════════════════════════════════════════════════════════════╗
+║                                        BÁO CÁO TỔNG QUAN HỆ THỐNG QUẢN LÝ                                        ║
+╚══════════════════════════════════════════════════════════════════════════════════════════════════════════════════╝
+
+📊 THỐNG KÊ TỔNG QUAN:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+• Tổng số phòng ban: {total_depts}
+• Tổng số cán bộ: {total_staff}
+• Tổng số KPI: {total_kpis}
+• Tổng số phân công KPI: {total_assignments}
+• Số kết quả KPI đã ghi nhận: {total_results}
+
+🏆 HIỆU SUẤT TỔNG THỂ:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+• Tỷ lệ đạt KPI trung bình: {avg_achievement:.1f}%
+• Phòng ban có nhiều nhân viên nhất: {top_dept[0]} ({top_dept[1]} người)
+• Tỷ lệ phân công KPI: {(total_assignments/total_kpis*100) if total_kpis > 0 else 0:.1f}%
+
+💰 NGÂN SÁCH VÀ LƯƠNG:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+• Tổng ngân sách phòng ban: {format_amount(total_budget)} VND
+• Tổng quỹ lương cơ bản: {format_amount(total_salary)} VND
+• Lương cơ bản trung bình: {format_amount(avg_salary)} VND
+{band_lines}
+{failure_section}
+📅 Báo cáo được tạo lúc: {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+        """
+
+        return report
+
+    def dept_kpi_report(self):
+        """Generate department KPI performance report"""
+        quarter = period_containing(recent_months(1).start, 'quarter')
+        dept_kpi_stats = self.db.execute_query(f"""
+            SELECT d.dept_name,
+                   (SELECT COUNT(*) FROM kpi k WHERE k.department_id = d.id) as total_kpis,
+                   (SELECT COUNT(*) FROM kpi_assignments ka JOIN kpi k ON ka.kpi_id = k.id
+                    WHERE k.department_id = d.id) as assigned_kpis,
+                   COALESCE(r.result_count, 0) as completed_results,
+                   r.achievement_sum / r.achievement_count as avg_achievement,
+                   r.quarter_sum / r.quarter_count as quarter_achievement
+            FROM departments d
+            LEFT JOIN ({DEPT_ROLLUPS}) r ON r.department_id = d.id
+            WHERE d.status = 'active'
+            ORDER BY avg_achievement DESC
+        """, [quarter.start])
+
+        report = f"""
+╔══════════════════════════════════════════════════════════════════════════════════════════════════════════════════╗
+║                                        BÁO CÁO KPI THEO PHÒNG BAN                                                ║
+╚══════════════════════════════════════════════════════════════════════════════════════════════════════════════════╝
+
+"""
+
+        for dept in dept_kpi_stats:
+            dept_name, total_kpis, assigned_kpis, completed_results, avg_achievement, quarter_achievement = dept
+            avg_achievement = avg_achievement or 0
+
+            report += f"""
+🏢 PHÒNG BAN: {dept_name}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+• Tổng số KPI: {total_kpis}
+• KPI đã phân công: {assigned_kpis}
+• Kết quả đã ghi nhận: {completed_results}
+• Tỷ lệ đạt KPI trung bình: {avg_achievement:.1f}%
+• Tỷ lệ đạt KPI {period_text(quarter)}: {f"{quarter_achievement:.1f}%" if quarter_achievement is not None else "Chưa có"}
+• Tỷ lệ hoàn thành: {(completed_results/total_kpis*100) if total_kpis > 0 else 0:.1f}%
+
+"""
+
+        report += f"📅 Báo cáo được tạo lúc: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n"
+
+        return report
+
+    def staff_performance_report(self):
+        """Generate staff performance report"""
+        staff_performance = self.db.execute_query(f"""
+            SELECT s.staff_code, s.full_name, d.dept_name, s.position,
+                   a.assigned_kpis,
+                   COALESCE(SUM(r.result_count), 0) as completed_results,
+                   SUM(r.achievement_sum) / SUM(r.achievement_count) as avg_achievement
+            FROM staff s
+            JOIN departments d ON s.department_id = d.id
+            JOIN (SELECT staff_id, COUNT(*) as assigned_kpis
+                  FROM kpi_assignments GROUP BY staff_id) a ON a.staff_id = s.id
+            JOIN (SELECT DISTINCT staff_id, kpi_id FROM kpi_assignments) ak ON ak.staff_id = s.id
+            LEFT JOIN kpi_rollups r
+                ON r.kpi_id = ak.kpi_id AND r.granularity = '{ALL_TIME}' AND r.period_start = 0
+            WHERE s.status = 'active'
+            GROUP BY s.id
+            ORDER BY avg_achievement DESC, s.staff_code
+        """)
+
+        report = f"""
+╔══════════════════════════════════════════════════════════════════════════════════════════════════════════════════╗
+║                                        BÁO CÁO HIỆU SUẤT CÁN BỘ                                                  ║
+╚══════════════════════════════════════════════════════════════════════════════════════════════════════════════════╝
+
+👥 HIỆU SUẤT CÁN BỘ THEO KPI:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+"""
+
+        for staff in staff_performance:
+            staff_code, full_name, dept_name, position, assigned_kpis, completed_results, avg_achievement = staff
+            avg_achievement = avg_achievement or 0
+
+            report += f"""
+👤 {full_name} ({staff_code})
+   • Phòng ban: {dept_name}
+   • Chức vụ: {position}
+   • KPI được phân công: {assigned_kpis}
+   • Kết quả đã ghi nhận: {completed_results}
+   • Tỷ lệ đạt KPI trung bình: {avg_achievement:.1f}%
+   • Tỷ lệ hoàn thành: {(completed_results/assigned_kpis*100) if assigned_kpis > 0 else 0:.1f}%
+
+"""
+
+        report += f"📅 Báo cáo được tạo lúc: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n"
+
+        return report
+
+    def detailed_kpi_report(self):
+        """Generate detailed KPI report"""
+        kpi_details = self.db.execute_query(f"""
+            SELECT k.kpi_code, k.kpi_name, d.dept_name, k.unit, k.target_value, k.weight,
+                   (SELECT COUNT(*) FROM kpi_assignments ka WHERE ka.kpi_id = k.id) as assigned_count,
+                   COALESCE(r.result_count, 0) as result_count,
+                   r.achievement_sum / r.achievement_count as avg_achievement,
+                   r.last_recorded_date as last_update
+            FROM kpi k
+            LEFT JOIN departments d ON k.department_id = d.id
+            LEFT JOIN kpi_rollups r
+                ON r.kpi_id = k.id AND r.granularity = '{ALL_TIME}' AND r.period_start = 0
+            WHERE k.status = 'active'
+            ORDER BY k.kpi_code
+        """)
+
+        report = f"""
+╔══════════════════════════════════════════════════════════════════════════════════════════════════════════════════╗
+║                                           BÁO CÁO CHI TIẾT KPI                                                   ║
+╚══════════════════════════════════════════════════════════════════════════════════════════════════════════════════╝
+
+📊 CHI TIẾT TỪNG KPI:
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+"""
+
+        for kpi in kpi_details:
+            kpi_code, kpi_name, dept_name, unit, target_value, weight, assigned_count, result_count, avg_achievement, last_update = kpi
+            avg_achievement = avg_achievement or 0
+            last_update_str = datetime.fromisoformat(last_update).strftime(
+                "%d/%m/%Y") if last_update else "Chưa có"
+
+            report += f"""
+📈 KPI: {kpi_code} - {kpi_name}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+• Phòng ban: {dept_name or 'Không xác định'}
+• Đơn vị tính: {unit}
+• Giá trị mục tiêu: {target_value} {unit}
+• Trọng số: {weight}%
+• Số người được phân công: {assigned_count}
+• Số kết quả đã ghi nhận: {result_count}
+• Tỷ lệ đạt trung bình: {avg_achievement:.1f}%
+• Cập nhật lần cuối: {last_update_str}
+
+"""
+
+        report += f"📅 Báo cáo được tạo lúc: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n"
+
+        return report
+
+    def export_csv(self, export_dir, timestamp=None):
+        """Write departments, staff, KPI and results CSV files to export_dir.
+
+        Returns the paths written.
+        """
+        timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+        exports = [
+            ("departments", "SELECT * FROM departments",
+             ["ID", "UUID", "Mã PB", "Tên PB", "Mô tả", "Trưởng phòng", "SĐT",
+              "Email", "Địa chỉ", "Ngân sách", "Số NV tối đa", "Ngày tạo", "Trạng thái"]),
+            ("staff", """
+                SELECT s.id, s.uuid, s.staff_code, s.full_name, s.birth_date, s.gender,
+                       s.id_number, s.phone, s.email, s.address, s.department_id,
+                       s.position, s.education, s.basic_salary, s.start_date,
+                       s.status, s.created_date, d.dept_name
+                FROM staff s 
+                LEFT JOIN departments d ON s.department_id = d.id
+            """,
+             ["ID", "UUID", "Mã CB", "Họ tên", "Ngày sinh", "Giới tính", "CCCD", "SĐT", "Email", "Địa chỉ",
+              "ID PB", "Chức vụ", "Trình độ", "Lương", "Ngày vào làm", "Trạng thái", "Ngày tạo", "Tên phòng ban"]),
+            ("kpi", """
+                SELECT k.*, c.category_name, d.dept_name 
+                FROM kpi k
+                LEFT JOIN kpi_categories c ON k.category_id = c.id
+                LEFT JOIN departments d ON k.department_id = d.id
+            """,
+             ["ID", "UUID", "Mã KPI", "Tên KPI", "Mô tả", "ID danh mục", "ID phòng ban", "Đơn vị",
+              "Mục tiêu", "Trọng số", "Tần suất", "Ngày tạo", "Trạng thái", "Tên danh mục", "Tên phòng ban"]),
+            ("kpi_results", """
+                SELECT kr.*, k.kpi_code, k.kpi_name
+                FROM kpi_results kr
+                JOIN kpi k ON kr.kpi_id = k.id
+            """,
+             ["ID", "UUID", "ID KPI", "Kỳ", "Giá trị thực tế", "% Đạt",
+              "Ghi chú", "Người ghi", "Ngày ghi", "Mã KPI", "Tên KPI"])
+        ]
+
+        paths = []
+        for name, query, header in exports:
+            path = os.path.join(export_dir, f"{name}_{timestamp}.csv")
+            with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(self.db.iter_query(query))
+            paths.append(path)
+        return paths
+
+    def write_backup(self, f):
+        """Stream every table into f as JSON, one row at a time"""
+        f.write('{\n  "backup_date": ' + json.dumps(datetime.now().isoformat()))
+        for table in BACKUP_TABLES:
+            f.write(f',\n  "{table}": [')
+            separator = '\n    '
+            for row in self.db.iter_query(f"SELECT * FROM {table}"):
+                f.write(separator + json.dumps(row, ensure_ascii=False))
+                separator = ',\n    '
+            f.write('\n  ]')
+        f.write('\n}\n')
+
+    def restore_backup(self, backup_data):
+        """Replace every table with the rows of a loaded backup in one transaction"""
+        backup_data = self._upgrade_unique_results(self._upgrade_legacy_backup(backup_data))
+        with self.db.transaction():
+            for table in reversed(BACKUP_TABLES):
+                self.db.execute_query(f"DELETE FROM {table}")
+
+            for table, data in backup_data.items():
+                if table != 'backup_date' and data:
+                    if table in AMOUNT_COLUMNS:
+                        data = self._parse_amounts(table, data)
+                    if table in DERIVED_COLUMNS:
+                        data = self._clear_derived(table, data)
+                    self.db.insert_many(table, data)
+            # Backed-up counts plus the staff insert triggers count twice
+            self.db.check_staff_counts(repair=True)
+
+    def _upgrade_legacy_backup(self, backup_data):
+        """Return backup_data with integer ids in place of UUID text keys.
+
+        Backups taken before tables got integer keys hold a UUID in id and
+        in every foreign key. Their rows are numbered in backup order, the
+        UUID moves to the uuid column and foreign keys follow the numbers.
+        """
+        upgraded = dict(backup_data)
+        new_ids = {}
+        for table in BACKUP_TABLES:
+            rows = backup_data.get(table)
+            if not rows or not isinstance(rows[0][0], str):
+                continue
+            columns = [row[1] for row in self.db.execute_query(f"PRAGMA table_info({table})")]
+            legacy_columns = [column for column in columns if column != 'uuid']
+            ids = new_ids[table] = {}
+            records = []
+            for number, row in enumerate(rows, 1):
+                record = dict(zip(legacy_columns, row))
+                ids[record['id']] = number
+                record['uuid'], record['id'] = record['id'], number
+                for column, parent in FOREIGN_KEYS.get(table, {}).items():
+                    record[column] = new_ids.get(parent, {}).get(record[column])
+                records.append(record)
+            upgraded[table] = records
+        return upgraded
+
+    def _upgrade_unique_results(self, backup_data):
+        """Return backup_data with one kpi_results row per KPI and period.
+
+        Backups taken before results became unique hold no result history
+        and can hold a period twice, in more than one spelling. As
+        migration 11 did to the table, their periods are rewritten in
+        canonical form, the latest recorded result of each KPI and period
+        is kept and the others become its history, oldest first.
+        """
+        rows = backup_data.get('kpi_results')
+        if 'kpi_result_history' in backup_data or not rows:
+            return backup_data
+        columns = [row[1] for row in self.db.execute_query("PRAGMA table_info(kpi_results)")]
+        periods = {}
+        for row in rows:
+            record = dict(row) if isinstance(row, dict) else dict(zip(columns, row))
+            try:
+                record['period'] = period_text(parse_period(record['period'] or ''))
+            except ValueError:
+                pass
+            key = ((record['kpi_id'], record['period'])
+                   if record['kpi_id'] is not None and record['period'] is not None
+                   else record['id'])
+            periods.setdefault(key, []).append(record)
+
+        results, history = [], []
+        for records in periods.values():
+            # Oldest first; like ORDER BY ... DESC, a NULL date sorts oldest
+            records.sort(key=lambda r: (r['recorded_date'] is not None,
+                                        r['recorded_date'] or '', r['id']))
+            keeper = records[-1]
+            results.append(keeper)
+            history.extend({
+                'result_id': keeper['id'],
+                'actual_value': record['actual_value'],
+                'achievement_percentage': record['achievement_percentage'],
+                'note': record['note'],
+                'recorded_by': record['recorded_by'],
+                'recorded_date': record['recorded_date']
+            } for record in records[:-1])
+        history.sort(key=itemgetter('result_id'))
+        return dict(backup_data, kpi_results=results, kpi_result_history=history)
+
+    def _parse_amounts(self, table, rows):
+        """Convert the amount column of backup rows to integers.
+
+        Backups taken before amounts became integer columns hold them as
+        text; a value that does not parse aborts the restore.
+        """
+        column = AMOUNT_COLUMNS[table]
+        index = [row[1] for row in self.db.execute_query(
+            f"PRAGMA table_info({table})")].index(column)
+        parsed = []
+        for row in rows:
+            row = dict(row) if isinstance(row, dict) else list(row)
+            key = column if isinstance(row, dict) else index
+            try:
+                row[key] = parse_amount(row[key])
+            except ValueError as e:
+                raise ValueError(f"{table}.{column}: {e}") from None
+            parsed.append(row)
+        return parsed
+
+    def _clear_derived(self, table, rows):
+        """Blank the derived columns of backup rows.
+
+        Restored rows are derived again before the restore commits; a
+        derived value restored as is would be reset by the table's
+        triggers one row at a time instead.
+        """
+        columns = [row[1] for row in self.db.execute_query(f"PRAGMA table_info({table})")]
+        indexes = [columns.index(column) for column in DERIVED_COLUMNS[table]]
+        cleared = []
+        for row in rows:
+            if isinstance(row, dict):
+                row = {**row, **dict.fromkeys(DERIVED_COLUMNS[table])}
+            else:
+                row = list(row)
+                for index in indexes:
+                    if index < len(row):
+                        row[index] = None
+            cleared.append(row)
+        return cleared
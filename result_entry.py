@@ -0,0 +1,268 @@
+import tkinter as tk
+from tkinter import ttk, messagebox
+import uuid
+from datetime import datetime
+
+from periods import parse_period, period_target, period_text
+
+
+# Grid columns; the ones in BATCH_EDITABLE_COLUMNS are edited in place
+BATCH_COLUMNS = ("KPI", "Tên KPI", "Đơn Vị", "Mục Tiêu", "Thực Tế", "Đạt (%)", "Ghi Chú")
+BATCH_EDITABLE_COLUMNS = ("Thực Tế", "Ghi Chú")
+
+
+def achievement_percentage(actual_value, target_value):
+    """Achievement of actual_value against target_value, in percent"""
+    target_value = target_value or 1
+    return (actual_value / target_value * 100) if target_value > 0 else 0
+
+
+def batch_rows(db, period):
+    """Yield (kpi_id, kpi_code, kpi_name, unit, target_value, actual_value,
+    note) for every active KPI, with its target in period and the result
+    saved for period if any. Each KPI's result is one lookup of the
+    (kpi_id, period) index.
+    """
+    return db.iter_query(f"""
+        SELECT k.id, k.kpi_code, k.kpi_name, k.unit, {period_target('?')}, kr.actual_value, kr.note
+        FROM kpi k
+        LEFT JOIN kpi_results kr ON kr.kpi_id = k.id AND kr.period = ?
+        WHERE k.status = 'active'
+        ORDER BY k.kpi_code
+    """, [parse_period(period).start, period])
+
+
+def grid_entry(kpi_id, saved, actual_cell, note_cell):
+    """prepare_results entry for a grid row from its saved (target, actual,
+    note) and its cell values. Tk returns cells it was given as numbers
+    as numbers, so they are turned back into text here.
+    """
+    target, actual, note = saved
+    return (kpi_id, target, str(actual_cell), str(note_cell), actual, note)
+
+
+def prepare_results(entries, period, recorded_by='System', recorded_date=None):
+    """Validate grid entries and build the kpi_results rows to save.
+
+    entries are (kpi_id, target_value, actual text, note, saved actual,
+    saved note) tuples. Blank and unchanged entries are skipped. Returns
+    (rows, invalid) where invalid lists the kpi_ids whose actual value is
+    not a number; nothing should be saved unless it is empty.
+    """
+    recorded_date = recorded_date or datetime.now().isoformat()
+    changed, invalid = [], []
+    for kpi_id, target_value, text, note, saved_actual, saved_note in entries:
+        if not text.strip():
+            continue
+        try:
+            actual_value = float(text)
+        except ValueError:
+            invalid.append(kpi_id)
+            continue
+        if actual_value != saved_actual or note != (saved_note or ''):
+            changed.append((kpi_id, target_value, actual_value, note))
+
+    return [{
+        'uuid': str(uuid.uuid4()),
+        'kpi_id': kpi_id,
+        'period': period,
+        'actual_value': actual_value,
+        'achievement_percentage': achievement_percentage(actual_value, target_value),
+        'note': note,
+        'recorded_by': recorded_by,
+        'recorded_date': recorded_date
+    } for kpi_id, target_value, actual_value, note in changed], invalid
+
+
+class ResultBatchEntry:
+    """Window listing every active KPI for one period with editable values.
+
+    Values are checked and saved together in one transaction; the results
+    list picks the change up from its change events.
+    """
+
+    def __init__(self, parent, db_manager, period=""):
+        self.db = db_manager
+        self.window = tk.Toplevel(parent)
+        self.window.title("Nhập Kết Quả KPI Theo Kỳ")
+        self.window.geometry("1000x650")
+        # Saved (target, actual, note) by KPI id, for the loaded period
+        self.saved = {}
+        self.period = None
+        self.editor = None
+        self.create_widgets(period)
+        if period:
+            self.load_period()
+
+    def create_widgets(self, period):
+        """Create the period picker, grid and save bar"""
+        top_frame = ttk.Frame(self.window, padding="10")
+        top_frame.pack(fill=tk.X)
+
+        ttk.Label(top_frame, text="Kỳ Báo Cáo:").pack(side=tk.LEFT)
+        self.period_var = tk.StringVar(value=period)
+        period_entry = ttk.Entry(top_frame, textvariable=self.period_var, width=15)
+        period_entry.pack(side=tk.LEFT, padx=(5, 10))
+        period_entry.bind('<Return>', self.load_period)
+        ttk.Button(top_frame, text="Tải KPI",
+                   command=self.load_period).pack(side=tk.LEFT)
+
+        grid_frame = ttk.Frame(self.window, padding=(10, 0))
+        grid_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.tree = ttk.Treeview(grid_frame, columns=BATCH_COLUMNS, show='headings')
+        widths = [90, 280, 80, 110, 110, 80, 200]
+        for col, width in zip(BATCH_COLUMNS, widths):
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=width, minwidth=60)
+        self.tree.tag_configure('invalid', background='#f8d7da')
+        self.tree.tag_configure('changed', background='#fff3cd')
+
+        scroll = ttk.Scrollbar(grid_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scroll.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind('<Double-1>', self.on_double_click)
+        self.tree.bind('<Return>', lambda event: self.edit_cell(self.tree.focus(), "Thực Tế"))
+
+        bottom_frame = ttk.Frame(self.window, padding="10")
+        bottom_frame.pack(fill=tk.X)
+
+        self.status_var = tk.StringVar()
+        ttk.Label(bottom_frame, textvariable=self.status_var).pack(side=tk.LEFT)
+        ttk.Button(bottom_frame, text="Đóng",
+                   command=self.window.destroy).pack(side=tk.RIGHT)
+        ttk.Button(bottom_frame, text="Lưu Tất Cả",
+                   command=self.save_all).pack(side=tk.RIGHT, padx=(0, 5))
+
+    def load_period(self, event=None):
+        """List every active KPI with its saved value for the chosen period"""
+        try:
+            period = period_text(parse_period(self.period_var.get()))
+        except ValueError:
+            messagebox.showerror(
+                "Lỗi", "Kỳ báo cáo phải có dạng 2024-01, 2024-Q1, 2024-H1 hoặc 2024!",
+                parent=self.window)
+            return
+        self.close_editor()
+        self.period = period
+        self.period_var.set(period)
+        self.saved = {}
+        self.tree.delete(*self.tree.get_children())
+        for kpi_id, code, name, unit, target, actual, note in batch_rows(self.db, period):
+            self.saved[kpi_id] = (target, actual, note)
+            achievement = (f"{achievement_percentage(actual, target):.1f}%"
+                           if actual is not None else "")
+            self.tree.insert('', tk.END, iid=str(kpi_id), values=(
+                code, name, unit or "", target if target is not None else "",
+                actual if actual is not None else "", achievement, note or ""))
+        self.status_var.set(f"Kỳ {period}: {len(self.saved)} KPI")
+
+    def on_double_click(self, event):
+        """Edit the clicked cell if its column is editable"""
+        iid = self.tree.identify_row(event.y)
+        column = self.tree.identify_column(event.x)
+        if iid and column:
+            self.edit_cell(iid, BATCH_COLUMNS[int(column[1:]) - 1])
+
+    def edit_cell(self, iid, column):
+        """Open an entry over one editable cell; Return saves it and moves
+        to the same cell of the next row, Escape cancels"""
+        self.close_editor()
+        if not iid or column not in BATCH_EDITABLE_COLUMNS:
+            return
+        self.tree.see(iid)
+        bbox = self.tree.bbox(iid, column)
+        if not bbox:
+            return
+        x, y, width, height = bbox
+        var = tk.StringVar(value=self.tree.set(iid, column))
+        entry = ttk.Entry(self.tree, textvariable=var)
+        entry.place(x=x, y=y, width=width, height=height)
+        entry.select_range(0, tk.END)
+        entry.focus_set()
+        self.editor = (entry, iid, column, var)
+
+        def next_row(event):
+            self.close_editor(save=True)
+            following = self.tree.next(iid)
+            if following:
+                self.tree.selection_set(following)
+                self.tree.focus(following)
+                self.edit_cell(following, column)
+            return "break"
+
+        entry.bind('<Return>', next_row)
+        entry.bind('<Down>', next_row)
+
+        def focus_out(event):
+            # Destroying an entry moves focus too; only close this one
+            if self.editor and self.editor[0] is entry:
+                self.close_editor(save=True)
+
+        entry.bind('<Escape>', lambda event: self.close_editor())
+        entry.bind('<FocusOut>', focus_out)
+
+    def close_editor(self, save=False):
+        """Remove the cell entry, keeping its text in the grid if save"""
+        if not self.editor:
+            return
+        entry, iid, column, var = self.editor
+        self.editor = None
+        if save and self.tree.exists(iid):
+            self.tree.set(iid, column, var.get())
+            self.show_achievement(iid)
+        entry.destroy()
+
+    def show_achievement(self, iid):
+        """Update a row's achievement cell and tag from its entered values"""
+        target, saved_actual, saved_note = self.saved[int(iid)]
+        text = str(self.tree.set(iid, "Thực Tế")).strip()
+        try:
+            actual = float(text) if text else None
+        except ValueError:
+            self.tree.set(iid, "Đạt (%)", "")
+            self.tree.item(iid, tags=('invalid',))
+            return
+        changed = actual is not None and (
+            actual != saved_actual or str(self.tree.set(iid, "Ghi Chú")) != (saved_note or ''))
+        self.tree.set(iid, "Đạt (%)", f"{achievement_percentage(actual, target):.1f}%"
+                      if actual is not None else "")
+        self.tree.item(iid, tags=('changed',) if changed else ())
+
+    def entries(self):
+        """(kpi_id, target, actual text, note, saved actual, saved note) per row"""
+        for iid in self.tree.get_children():
+            yield grid_entry(int(iid), self.saved[int(iid)],
+                             self.tree.set(iid, "Thực Tế"), self.tree.set(iid, "Ghi Chú"))
+
+    def save_all(self):
+        """Check every row, then save the changed ones in one transaction"""
+        self.close_editor(save=True)
+        if self.period is None:
+            return
+        rows, invalid = prepare_results(list(self.entries()), self.period)
+        for kpi_id in invalid:
+            self.tree.item(str(kpi_id), tags=('invalid',))
+        if invalid:
+            self.tree.see(str(invalid[0]))
+            messagebox.showerror(
+                "Lỗi", f"{len(invalid)} giá trị thực tế không phải là số!", parent=self.window)
+            return
+        if not rows:
+            self.status_var.set("Không có thay đổi để lưu")
+            return
+
+        try:
+            with self.db.transaction():
+                self.db.upsert_many('kpi_results', rows, ('kpi_id', 'period'))
+        except Exception as e:
+            messagebox.showerror("Lỗi", f"Không thể lưu kết quả: {str(e)}", parent=self.window)
+            return
+
+        for row in rows:
+            target = self.saved[row['kpi_id']][0]
+            self.saved[row['kpi_id']] = (target, row['actual_value'], row['note'])
+            self.tree.item(str(row['kpi_id']), tags=())
+        self.status_var.set(f"Đã lưu {len(rows)} kết quả cho kỳ {self.period}")
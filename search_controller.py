@@ -0,0 +1,102 @@
+import queue
+import sqlite3
+import threading
+
+
+class SearchController:
+    """Debounced list search that queries off the Tk thread.
+
+    Bind schedule() to the search box's <KeyRelease>: each keystroke
+    restarts a short timer and only the last one starts a search. fetch is
+    called on the Tk thread with a cancelled() callable, reads the filter
+    widgets and returns a lazy row iterable (e.g. a *_rows() generator).
+    A worker thread drains it, and show(rows) gets the rows back on the Tk
+    thread. Every search takes a new generation number. Older searches see
+    cancelled() turn true, which stops their SQLite statement, and any rows
+    they still deliver are dropped.
+    """
+
+    def __init__(self, widget, fetch, show, delay_ms=250, poll_ms=30):
+        self.widget = widget
+        self.fetch = fetch
+        self.show = show
+        self.delay_ms = delay_ms
+        self.poll_ms = poll_ms
+        self.generation = 0
+        self._timer = None
+        self._poller = None
+        self._in_flight = set()
+        self._results = queue.Queue()
+
+    @property
+    def busy(self):
+        """Whether a search is waiting on its timer or still running"""
+        return self._timer is not None or self.generation in self._in_flight
+
+    def schedule(self, event=None):
+        """Restart the debounce timer; the search runs once typing pauses"""
+        self._cancel_timer()
+        self._timer = self.widget.after(self.delay_ms, self.search_now)
+
+    def search_now(self, event=None):
+        """Start a search at once, superseding any pending or running one"""
+        self._cancel_timer()
+        self.generation += 1
+        generation = self.generation
+        rows = self.fetch(lambda: generation != self.generation)
+        self._in_flight.add(generation)
+        threading.Thread(target=self._run, args=(generation, rows),
+                         name=f"search-{generation}", daemon=True).start()
+        if self._poller is None:
+            self._poller = self.widget.after(self.poll_ms, self._poll)
+
+    def cancel(self):
+        """Drop the pending search and the results of any running one"""
+        self._cancel_timer()
+        self.generation += 1
+
+    def rerun_if_busy(self):
+        """Restart a pending or running search so it sees a new commit.
+
+        Returns True when a search was restarted; its result replaces the
+        list, so the caller need not patch it.
+        """
+        if not self.busy:
+            return False
+        self.search_now()
+        return True
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self.widget.after_cancel(self._timer)
+            self._timer = None
+
+    def _run(self, generation, rows):
+        """Worker thread: materialize rows and hand them to the Tk thread"""
+        try:
+            result = list(rows)
+        except sqlite3.OperationalError as e:
+            # Superseded searches end here when their statement is interrupted
+            result = None if generation != self.generation else e
+        except Exception as e:
+            result = e
+        self._results.put((generation, result))
+
+    def _poll(self):
+        """Tk thread: show the newest finished result, ignore stale ones"""
+        self._poller = None
+        finished = None
+        while True:
+            try:
+                generation, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._in_flight.discard(generation)
+            if generation == self.generation:
+                finished = result
+        if self._in_flight:
+            self._poller = self.widget.after(self.poll_ms, self._poll)
+        if isinstance(finished, Exception):
+            raise finished
+        if finished is not None:
+            self.show(finished)
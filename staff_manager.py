@@ -1,16 +1,88 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox
+import math
+import re
 import sqlite3
 import uuid
 from datetime import datetime
 
+from amounts import parse_amount
+from text_search import TRIGRAM_MIN_SIMILARITY, trigrams
+from search_controller import SearchController
+from tree_sync import ChoiceList, ColumnSorter, VirtualTreeList, keyset_page, placeholders, sort_order
+
+
+# SQL sort expression of each list column, for click-to-sort
+STAFF_SORT_COLUMNS = [
+    "s.staff_code", "s.full_name", "d.dept_name", "COALESCE(s.position, '')",
+    "COALESCE(s.phone, '')", "COALESCE(s.email, '')",
+    "COALESCE(s.basic_salary, 0)", "COALESCE(s.status, '')"
+]
+
+
+def staff_rows(db, search_term="", dept_filter="Tất cả", where="1", params=(), sort=None,
+               after=None, before=None, limit=None, cancelled=None):
+    """Yield (id, *values) staff list rows; usable without a UI.
+
+    A search term is matched against the trigram index of the unaccented
+    name, so "nguyen van an" finds "Nguyễn Văn An" and small typos still
+    match; rows are ranked by the share of the term's trigrams they contain.
+    Staff codes starting with the term rank first. sort is a ColumnSorter
+    order, by rank or code when None. after, before and limit select one
+    keyset page (see keyset_page).
+    """
+    columns = "s.id, s.staff_code, s.full_name, d.dept_name, s.position, s.phone, s.email, s.basic_salary, s.status"
+    source = "staff s JOIN departments d ON s.department_id = d.id"
+    grams = sorted(trigrams(search_term))
+    if grams:
+        code_prefix = re.sub(r"[\[\]*?]", "", search_term.strip().upper())
+        source = "m JOIN staff s ON s.id = m.staff_id JOIN departments d ON s.department_id = d.id"
+        query = f"""
+            WITH m AS (
+                SELECT staff_id, MAX(hits) AS hits FROM (
+                    SELECT staff_id, COUNT(*) AS hits FROM staff_trigrams
+                    WHERE trigram IN ({placeholders(grams)})
+                    GROUP BY staff_id
+                    UNION ALL
+                    SELECT id, ? FROM staff WHERE staff_code GLOB ?
+                )
+                GROUP BY staff_id
+            )
+            SELECT {columns}
+            FROM {source}
+            WHERE m.hits >= ? AND {where}
+        """
+        params = [*grams, len(grams) + 1, code_prefix + '*',
+                  math.ceil(len(grams) * TRIGRAM_MIN_SIMILARITY), *params]
+    else:
+        query = f"""
+            SELECT {columns}
+            FROM {source}
+            WHERE {where}
+        """
+        params = list(params)
+
+    if grams and sort is None:
+        order, descending = ["-m.hits", "LENGTH(s.name_normalized)", "s.staff_code"], False
+    else:
+        order, descending = sort_order(sort or (0, False), STAFF_SORT_COLUMNS, "s.staff_code")
+
+    if dept_filter != "Tất cả":
+        query += " AND d.dept_name = ?"
+        params.append(dept_filter)
+
+    page, page_params, order_by = keyset_page(
+        order, f"SELECT {', '.join(order)} FROM {source} WHERE s.id = ?",
+        descending, after=after, before=before, limit=limit)
+    return db.iter_query(f"{query} AND {page} {order_by}", params + page_params,
+                         cancelled=cancelled)
+
 
 class StaffManager:
-    def __init__(self, parent_frame, db_manager, update_callback=None):
+    def __init__(self, parent_frame, db_manager):
         self.parent_frame = parent_frame
         self.db = db_manager
-        self.update_callback = update_callback
         self.staff_vars = {}
 
         self.positions = ["Giám đốc", "Phó giám đốc", "Trưởng phòng", "Phó trưởng phòng",
@@ -19,6 +91,7 @@ class StaffManager:
                                  "Đại học", "Cao đẳng", "Trung cấp", "THPT"]
 
         self.create_widgets()
+        self.db.subscribe(self.on_data_changed, ['staff', 'departments'])
 
     def create_widgets(self):
         """Create staff management interface"""
@@ -134,32 +207,39 @@ class StaffManager:
 
         v_scroll = ttk.Scrollbar(
             right_panel, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=v_scroll.set)
+        self.view = VirtualTreeList(self.tree, v_scroll, self.list_rows)
 
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         v_scroll.pack(side=tk.RIGHT, fill=tk.Y)
 
         self.tree.bind('<<TreeviewSelect>>', self.on_select)
 
+        self.search = SearchController(
+            self.tree, lambda cancelled: self.list_rows(
+                limit=self.view.page_size, cancelled=cancelled), self.view.show)
+        self.sorter = ColumnSorter(self.tree, self.search.search_now)
+
         self.refresh_list()
-        self.update_department_comboboxes()
+
+        self.dept_choices = ChoiceList(
+            self.db, 'departments',
+            "SELECT id, dept_name, dept_name FROM departments WHERE status = 'active' AND {where}")
+        self.dept_choices.attach(self.dept_combobox)
+        self.dept_choices.attach(self.dept_filter_combo, prefix=["Tất cả"])
 
     def add_staff(self):
         """Add new staff member"""
         if not self.validate_input():
             return
 
-        dept_name = self.staff_vars['department_id'].get()
-        dept_id_result = self.db.execute_query(
-            "SELECT id FROM departments WHERE dept_name = ?", [dept_name]
-        )
-
-        if not dept_id_result:
+        dept_id = self.db.lookup_id(
+            'departments', 'dept_name', self.staff_vars['department_id'].get())
+        if dept_id is None:
             messagebox.showerror("Lỗi", "Phòng ban không tồn tại!")
             return
 
         staff_data = {
-            'id': str(uuid.uuid4()),
+            'uuid': str(uuid.uuid4()),
             'staff_code': self.staff_vars['staff_code'].get(),
             'full_name': self.staff_vars['full_name'].get(),
             'birth_date': self.staff_vars['birth_date'].get(),
@@ -168,10 +248,10 @@ class StaffManager:
             'phone': self.staff_vars['phone'].get(),
             'email': self.staff_vars['email'].get(),
             'address': self.address_text.get("1.0", tk.END).strip(),
-            'department_id': dept_id_result[0][0],
+            'department_id': dept_id,
             'position': self.staff_vars['position'].get(),
             'education': self.staff_vars['education'].get(),
-            'basic_salary': self.staff_vars['basic_salary'].get(),
+            'basic_salary': parse_amount(self.staff_vars['basic_salary'].get()),
             'start_date': self.staff_vars['start_date'].get(),
             'status': self.staff_vars['status'].get(),
             'created_date': datetime.now().isoformat()
@@ -179,9 +259,6 @@ class StaffManager:
 
         try:
             self.db.insert_data('staff', staff_data)
-            self.refresh_list()
-            if self.update_callback:
-                self.update_callback()
             self.clear_form()
             messagebox.showinfo("Thành công", "Đã thêm cán bộ thành công!")
         except sqlite3.IntegrityError:
@@ -202,12 +279,9 @@ class StaffManager:
 
         staff_code = self.tree.item(selected[0])['values'][0]
 
-        dept_name = self.staff_vars['department_id'].get()
-        dept_id_result = self.db.execute_query(
-            "SELECT id FROM departments WHERE dept_name = ?", [dept_name]
-        )
-
-        if not dept_id_result:
+        dept_id = self.db.lookup_id(
+            'departments', 'dept_name', self.staff_vars['department_id'].get())
+        if dept_id is None:
             messagebox.showerror("Lỗi", "Phòng ban không tồn tại!")
             return
 
@@ -220,10 +294,10 @@ class StaffManager:
             'phone': self.staff_vars['phone'].get(),
             'email': self.staff_vars['email'].get(),
             'address': self.address_text.get("1.0", tk.END).strip(),
-            'department_id': dept_id_result[0][0],
+            'department_id': dept_id,
             'position': self.staff_vars['position'].get(),
             'education': self.staff_vars['education'].get(),
-            'basic_salary': self.staff_vars['basic_salary'].get(),
+            'basic_salary': parse_amount(self.staff_vars['basic_salary'].get()),
             'start_date': self.staff_vars['start_date'].get(),
             'status': self.staff_vars['status'].get()
         }
@@ -231,9 +305,6 @@ class StaffManager:
         try:
             self.db.update_data('staff', staff_data, {
                                 'column': 'staff_code', 'value': staff_code})
-            self.refresh_list()
-            if self.update_callback:
-                self.update_callback()
             self.clear_form()
             messagebox.showinfo("Thành công", "Đã cập nhật cán bộ thành công!")
         except Exception as e:
@@ -250,20 +321,9 @@ class StaffManager:
 
         if messagebox.askyesno("Xác nhận", "Bạn có chắc chắn muốn xóa cán bộ này?"):
             try:
-
-                staff_id = self.db.execute_query(
-                    "SELECT id FROM staff WHERE staff_code = ?", [staff_code]
-                )[0][0]
-
-                self.db.delete_data('kpi_assignments', {
-                                    'column': 'staff_id', 'value': staff_id})
-
+                # KPI assignments cascade from the staff row
                 self.db.delete_data(
                     'staff', {'column': 'staff_code', 'value': staff_code})
-
-                self.refresh_list()
-                if self.update_callback:
-                    self.update_callback()
                 self.clear_form()
                 messagebox.showinfo("Thành công", "Đã xóa cán bộ thành công!")
             except Exception as e:
@@ -277,6 +337,11 @@ class StaffManager:
             if not self.staff_vars[field].get().strip():
                 messagebox.showerror("Lỗi", f"Vui lòng nhập {field}!")
                 return False
+        try:
+            parse_amount(self.staff_vars['basic_salary'].get())
+        except ValueError:
+            messagebox.showerror("Lỗi", "Lương cơ bản phải là số tiền nguyên, không âm (VD: 15000000 hoặc 15.000.000)!")
+            return False
         return True
 
     def clear_form(self):
@@ -295,8 +360,11 @@ class StaffManager:
         if selected:
             staff_code = self.tree.item(selected[0])['values'][0]
             staff_data = self.db.execute_query("""
-                SELECT s.*, d.dept_name FROM staff s 
-                JOIN departments d ON s.department_id = d.id 
+                SELECT s.id, s.staff_code, s.full_name, s.birth_date, s.gender, s.id_number,
+                       s.phone, s.email, s.address, s.department_id, s.position, s.education,
+                       s.basic_salary, s.start_date, s.status, d.dept_name
+                FROM staff s
+                JOIN departments d ON s.department_id = d.id
                 WHERE s.staff_code = ?
             """, [staff_code])
 
@@ -311,7 +379,7 @@ class StaffManager:
                 self.staff_vars['email'].set(staff[7] or "")
                 self.address_text.delete("1.0", tk.END)
                 self.address_text.insert("1.0", staff[8] or "")
-                self.staff_vars['department_id'].set(staff[17])
+                self.staff_vars['department_id'].set(staff[15])
                 self.staff_vars['position'].set(staff[10] or "")
                 self.staff_vars['education'].set(staff[11] or "")
                 self.staff_vars['basic_salary'].set(staff[12] or "")
@@ -319,62 +387,45 @@ class StaffManager:
                 self.staff_vars['status'].set(staff[14] or "active")
 
     def search_staff(self, event):
-        """Search staff"""
-        self.filter_staff()
+        """Search staff once typing pauses"""
+        self.search.schedule()
 
     def filter_staff(self, event=None):
         """Filter staff list"""
-        search_term = self.search_var.get().lower()
-        dept_filter = self.dept_filter_var.get()
-
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        query = """
-            SELECT s.staff_code, s.full_name, d.dept_name, s.position, s.phone, s.email, s.basic_salary, s.status
-            FROM staff s
-            JOIN departments d ON s.department_id = d.id
-            WHERE (LOWER(s.full_name) LIKE ? OR LOWER(s.staff_code) LIKE ?)
-        """
-        params = [f"%{search_term}%", f"%{search_term}%"]
-
-        if dept_filter != "Tất cả":
-            query += " AND d.dept_name = ?"
-            params.append(dept_filter)
-
-        query += " ORDER BY s.staff_code"
-
-        results = self.db.execute_query(query, params)
+        self.search.search_now()
 
-        for row in results:
-            self.tree.insert("", "end", values=row)
+    def list_rows(self, where="1", params=(), **page):
+        """Yield (id, *values) list rows matching the filters and where"""
+        return staff_rows(self.db, self.search_var.get(),
+                          self.dept_filter_var.get(), where, params, self.sorter.order, **page)
 
     def refresh_list(self):
         """Refresh staff list"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        query = """
-            SELECT s.staff_code, s.full_name, d.dept_name, s.position, s.phone, s.email, s.basic_salary, s.status
-            FROM staff s
-            JOIN departments d ON s.department_id = d.id
-            ORDER BY s.staff_code
-        """
-
-        results = self.db.execute_query(query)
-
-        for row in results:
-            self.tree.insert("", "end", values=row)
-
-    def update_department_comboboxes(self):
-        """Update department comboboxes with current data"""
-        dept_names = [row[0] for row in self.db.execute_query(
-            "SELECT dept_name FROM departments WHERE status = 'active' ORDER BY dept_name")]
+        self.search.cancel()
+        self.view.refresh()
 
-        self.dept_combobox['values'] = dept_names
+    def on_data_changed(self, event):
+        """Patch the rows a committed write touched"""
+        if self.search.rerun_if_busy():
+            return
+        if event.keys is None or self.sorter.order is not None:
+            # Rows can move anywhere in a user-chosen order
+            self.refresh_list()
+            return
 
-        self.dept_filter_combo['values'] = ["Tất cả"] + dept_names
+        keys = list(event.keys)
+        if event.table == 'departments':
+            if event.operation != 'update' or not keys:
+                return
+            # A renamed department changes the department column of its staff
+            keys = [row[0] for row in self.db.execute_query(
+                f"SELECT id FROM staff WHERE department_id IN ({placeholders(keys)})", keys)]
+        if keys:
+            # Ranked search results keep their order; new matches go on top
+            sort_column = None if self.search_var.get().strip() else 0
+            self.view.patch(keys, self.list_rows(
+                f"s.id IN ({placeholders(keys)})", keys), sort_column=sort_column)
 
     def get_staff_displays(self):
         """Get list of staff displays for comboboxes"""
-        return [f"{row[0]} - {row[1]}" for row in self.db.execute_query("SELECT staff_code, full_name FROM staff WHERE status = 'active' ORDER BY staff_code")]
+        return [f"{row[0]} - {row[1]}" for row in self.db.cached_query("SELECT staff_code, full_name FROM staff WHERE status = 'active' ORDER BY staff_code")]
@@ -0,0 +1,12 @@
+import pytest
+
+from database_manager import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    """DatabaseManager on a fresh file holding the sample data"""
+    db = DatabaseManager(str(tmp_path / 'test.db'))
+    db.load_sample_data()
+    yield db
+    db.close()
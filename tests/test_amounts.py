@@ -0,0 +1,33 @@
+import pytest
+
+from amounts import format_amount, parse_amount
+
+
+@pytest.mark.parametrize('text, amount', [
+    ("15000000", 15000000),
+    ("15.000.000", 15000000),
+    ("15,000,000", 15000000),
+    ("15 000 000", 15000000),
+    ("1.500", 1500),
+    ("2.000.000 VNĐ", 2000000),
+    ("500000đ", 500000),
+    ("1e6", 1000000),
+    (15000000.0, 15000000),
+    (7, 7),
+    ("", None),
+    ("  ", None),
+    (None, None),
+])
+def test_parse_amount(text, amount):
+    assert parse_amount(text) == amount
+
+
+@pytest.mark.parametrize('text', ["abc", "1.5", "-5", "1.50.000", "15.000,000", -1.0])
+def test_parse_amount_rejects(text):
+    with pytest.raises(ValueError):
+        parse_amount(text)
+
+
+def test_formatted_amounts_parse_back():
+    for amount in (0, 999, 1000, 15000000, 1234567890):
+        assert parse_amount(format_amount(amount)) == amount
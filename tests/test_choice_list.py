@@ -0,0 +1,15 @@
+from tree_sync import ChoiceList
+
+
+DEPARTMENTS = "SELECT id, dept_name, dept_name FROM departments WHERE status = 'active' AND {where}"
+
+
+def test_choice_lists_share_cached_reads_and_follow_writes(db):
+    first = ChoiceList(db, 'departments', DEPARTMENTS)
+    second = ChoiceList(db, 'departments', DEPARTMENTS)
+    assert db.get_cache_stats()['hits'] == 1
+
+    dept_id = db.execute_query("SELECT id FROM departments ORDER BY id LIMIT 1")[0][0]
+    db.update_data('departments', {'dept_name': 'Phòng Mới'}, {'column': 'id', 'value': dept_id})
+    assert 'Phòng Mới' in first.values()
+    assert first.values() == second.values()
@@ -0,0 +1,13 @@
+from data_generator import generate_database
+from database_manager import DatabaseManager
+
+
+def test_generated_achievements_match_their_targets(tmp_path):
+    path = str(tmp_path / 'test.db')
+    generate_database(path, '10k')
+    db = DatabaseManager(path)
+    try:
+        assert db.recompute_achievements().changed == 0
+        assert db.check_kpi_rollups() == []
+    finally:
+        db.close()
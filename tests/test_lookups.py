@@ -0,0 +1,49 @@
+import uuid
+
+
+def add_staff(db, code, dept_name):
+    dept_id = db.lookup_id('departments', 'dept_name', dept_name)
+    db.insert_data('staff', {'uuid': str(uuid.uuid4()), 'staff_code': code,
+                             'full_name': code, 'department_id': dept_id})
+
+
+def assign_kpi(db, kpi_code, staff_code):
+    db.insert_data('kpi_assignments', {
+        'uuid': str(uuid.uuid4()),
+        'kpi_id': db.lookup_id('kpi', 'kpi_code', kpi_code),
+        'staff_id': db.lookup_id('staff', 'staff_code', staff_code)})
+
+
+def test_maps_load_once_across_form_writes(db):
+    dept_name, kpi_code = db.execute_query(
+        "SELECT d.dept_name, k.kpi_code FROM departments d, kpi k LIMIT 1")[0]
+    for number in range(3):
+        add_staff(db, f"NV{number}", dept_name)
+        assign_kpi(db, kpi_code, f"NV{number}")
+    # departments, kpi and staff, each read once; the staff_count trigger
+    # writes and the new staff codes patch the maps instead
+    assert db.lookups.loads == 3
+    assert db.execute_query("SELECT COUNT(*) FROM kpi_assignments k JOIN staff s "
+                            "ON s.id = k.staff_id WHERE s.staff_code LIKE 'NV_'") == [(3,)]
+
+
+def test_maps_follow_renames_and_deletes(db):
+    dept_id, dept_name = db.execute_query("SELECT id, dept_name FROM departments LIMIT 1")[0]
+    assert db.lookup_id('departments', 'dept_name', dept_name) == dept_id
+
+    db.update_data('departments', {'dept_name': 'Phòng Mới'}, {'column': 'id', 'value': dept_id})
+    assert db.lookup_id('departments', 'dept_name', dept_name) is None
+    assert db.lookup_id('departments', 'dept_name', 'Phòng Mới') == dept_id
+
+    db.delete_data('departments', {'column': 'id', 'value': dept_id})
+    assert db.lookup_id('departments', 'dept_name', 'Phòng Mới') is None
+    assert db.lookups.loads == 1
+
+
+def test_lookup_sees_uncommitted_rows_of_its_transaction(db):
+    dept_name = db.execute_query("SELECT dept_name FROM departments LIMIT 1")[0][0]
+    db.lookup_id('staff', 'staff_code', 'NV0')
+    with db.transaction():
+        add_staff(db, 'NV0', dept_name)
+        assert db.lookup_id('staff', 'staff_code', 'NV0') is not None
+    assert db.lookup_id('staff', 'staff_code', 'NV0') is not None
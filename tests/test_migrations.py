@@ -0,0 +1,47 @@
+import sqlite3
+
+import pytest
+
+from database_manager import BASE_SCHEMA, DatabaseManager
+
+
+def test_opens_tables_stored_with_quoted_names(tmp_path):
+    path = str(tmp_path / 'test.db')
+    conn = sqlite3.connect(path)
+    for table, columns in BASE_SCHEMA.items():
+        conn.execute(f"CREATE TABLE {table} ({columns})")
+    # Renaming a rebuilt table into place stores its name quoted
+    conn.execute("ALTER TABLE staff RENAME TO staff__old")
+    conn.execute("ALTER TABLE staff__old RENAME TO staff")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(path)
+    try:
+        assert db.get_schema_version() == DatabaseManager.MIGRATIONS[-1][0]
+        assert ('department_id', 'CASCADE') in [
+            (fk[3], fk[6]) for fk in db.execute_query("PRAGMA foreign_key_list(staff)")]
+    finally:
+        db.close()
+
+
+class OrphaningDatabaseManager(DatabaseManager):
+    MIGRATIONS = DatabaseManager.MIGRATIONS + [(99, "Orphan a staff row", '_migrate_orphan')]
+
+    def _migrate_orphan(self, conn):
+        conn.execute("INSERT INTO staff (uuid, staff_code, full_name, department_id) VALUES ('x', 'X', 'X', 12345)")
+
+
+def test_migration_leaving_orphans_rolls_back(tmp_path):
+    path = str(tmp_path / 'test.db')
+    DatabaseManager(path).close()
+
+    with pytest.raises(sqlite3.IntegrityError, match="staff -> departments"):
+        OrphaningDatabaseManager(path)
+
+    db = DatabaseManager(path)
+    try:
+        assert db.get_schema_version() == DatabaseManager.MIGRATIONS[-1][0]
+        assert db.execute_query("SELECT COUNT(*) FROM staff") == [(0,)]
+    finally:
+        db.close()
@@ -0,0 +1,57 @@
+from datetime import date
+
+import pytest
+
+from periods import (GRANULARITY_MONTHS, Period, month_ordinal, parse_period,
+                     period_containing, period_text, recent_months)
+
+
+@pytest.mark.parametrize('text, canonical', [
+    ("2024-01", "2024-01"),
+    ("01/2024", "2024-01"),
+    ("Tháng 1/2024", "2024-01"),
+    ("thang 12 2024", "2024-12"),
+    ("2024-Q1", "2024-Q1"),
+    ("Q2/2024", "2024-Q2"),
+    ("Quý 4 2024", "2024-Q4"),
+    ("2024-H2", "2024-H2"),
+    ("2024", "2024"),
+    ("Năm 2024", "2024"),
+])
+def test_parse_period(text, canonical):
+    assert period_text(parse_period(text)) == canonical
+
+
+@pytest.mark.parametrize('text', ["", "Q1", "2024-13", "2024-00", "2024-Q5", "2024-H3",
+                                  "2023-2024", "2024-W01"])
+def test_parse_period_rejects(text):
+    with pytest.raises(ValueError):
+        parse_period(text)
+
+
+def test_periods_span_their_months():
+    assert month_ordinal(2024, 1) == 24288
+    assert parse_period("2024-Q2") == \
+        Period('quarter', month_ordinal(2024, 4), month_ordinal(2024, 6))
+    assert parse_period("2024") == \
+        Period('year', month_ordinal(2024, 1), month_ordinal(2024, 12))
+
+
+def test_period_containing():
+    may = month_ordinal(2024, 5)
+    assert period_containing(may, 'month') == parse_period("2024-05")
+    assert period_containing(may, 'quarter') == parse_period("2024-Q2")
+    assert period_containing(may, 'half') == parse_period("2024-H1")
+    assert period_containing(may, 'year') == parse_period("2024")
+
+    # Every month of a period is contained in that same period
+    for granularity in GRANULARITY_MONTHS:
+        for ordinal in range(month_ordinal(2023, 1), month_ordinal(2025, 1)):
+            period = period_containing(ordinal, granularity)
+            assert period.start <= ordinal <= period.end
+            assert parse_period(period_text(period)) == period
+
+
+def test_recent_months_end_this_month():
+    assert recent_months(3, date(2024, 2, 15)) == \
+        Period('month', month_ordinal(2023, 12), month_ordinal(2024, 2))
@@ -0,0 +1,90 @@
+import math
+import re
+import uuid
+
+import pytest
+
+from periods import period_containing, period_text, recent_months
+from report_builder import DEPT_ROLLUPS, ReportBuilder
+
+
+@pytest.fixture(autouse=True)
+def fan_out(db):
+    """Assign a KPI with results to every staff member, so averaging
+    through kpi_assignments would count its results many times, and save
+    a result for this quarter"""
+    kpi_id = db.execute_query(
+        "SELECT kpi_id FROM kpi_results GROUP BY kpi_id ORDER BY COUNT(*) DESC LIMIT 1")[0][0]
+    db.insert_many('kpi_assignments', [
+        {'uuid': str(uuid.uuid4()), 'kpi_id': kpi_id, 'staff_id': staff_id, 'role': 'Phối hợp'}
+        for (staff_id,) in db.execute_query(
+            "SELECT id FROM staff WHERE id NOT IN "
+            "(SELECT staff_id FROM kpi_assignments WHERE kpi_id = ?)", [kpi_id])])
+    db.upsert_data('kpi_results', {
+        'uuid': str(uuid.uuid4()), 'kpi_id': kpi_id, 'period': period_text(recent_months(1)),
+        'actual_value': 1.0, 'achievement_percentage': 42.0, 'recorded_date': '2030-01-01'
+    }, ('kpi_id', 'period'))
+
+
+def averages(db, query, params=()):
+    return {name: f"{avg or 0:.1f}" for name, avg in db.execute_query(query, params)}
+
+
+def report_averages(report, heading, average_line):
+    return dict(re.findall(rf"{heading}(.+)\n(?:.*\n)*?.*{average_line}: (\S+)%", report))
+
+
+def test_dept_rollups_match_results(db):
+    quarter = period_containing(recent_months(1).start, 'quarter')
+    expected = {row[0]: row[1:] for row in db.execute_query("""
+        SELECT k.department_id, COUNT(kr.id), AVG(kr.achievement_percentage),
+               AVG(CASE WHEN kr.period_start BETWEEN ? AND ? AND kr.period_end <= ?
+                        THEN kr.achievement_percentage END)
+        FROM kpi_results kr
+        JOIN kpi k ON k.id = kr.kpi_id
+        GROUP BY k.department_id
+    """, [quarter.start, quarter.end, quarter.end])}
+    actual = {dept_id: (count, total / n, quarter_sum / quarter_count if quarter_count else None)
+              for dept_id, count, n, total, quarter_count, quarter_sum
+              in db.execute_query(DEPT_ROLLUPS, [quarter.start])}
+    assert actual.keys() == expected.keys()
+    for dept_id, (count, average, quarter_average) in actual.items():
+        assert count == expected[dept_id][0]
+        assert math.isclose(average, expected[dept_id][1])
+        assert quarter_average == pytest.approx(expected[dept_id][2])
+
+
+def test_report_averages_count_each_result_once(db):
+    builder = ReportBuilder(db)
+
+    assert report_averages(builder.dept_kpi_report(), "PHÒNG BAN: ", "Tỷ lệ đạt KPI trung bình") == \
+        averages(db, """
+            SELECT d.dept_name, AVG(kr.achievement_percentage)
+            FROM departments d
+            LEFT JOIN kpi k ON k.department_id = d.id
+            LEFT JOIN kpi_results kr ON kr.kpi_id = k.id
+            WHERE d.status = 'active'
+            GROUP BY d.id
+        """)
+
+    assert report_averages(builder.detailed_kpi_report(), "KPI: ", "Tỷ lệ đạt trung bình") == \
+        averages(db, """
+            SELECT k.kpi_code || ' - ' || k.kpi_name, AVG(kr.achievement_percentage)
+            FROM kpi k
+            LEFT JOIN kpi_results kr ON kr.kpi_id = k.id
+            WHERE k.status = 'active'
+            GROUP BY k.id
+        """)
+
+    assert report_averages(builder.staff_performance_report(), "👤 ", "Tỷ lệ đạt KPI trung bình") == \
+        averages(db, """
+            SELECT s.full_name || ' (' || s.staff_code || ')',
+                   (SELECT AVG(kr.achievement_percentage) FROM kpi_results kr
+                    WHERE kr.kpi_id IN (SELECT kpi_id FROM kpi_assignments WHERE staff_id = s.id))
+            FROM staff s
+            JOIN departments d ON d.id = s.department_id
+            WHERE s.status = 'active' AND s.id IN (SELECT staff_id FROM kpi_assignments)
+        """)
+
+    overall = db.execute_query("SELECT AVG(achievement_percentage) FROM kpi_results")[0][0]
+    assert f"Tỷ lệ đạt KPI trung bình: {overall:.1f}%" in builder.overview_report()
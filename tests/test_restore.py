@@ -0,0 +1,30 @@
+import io
+import json
+
+from report_builder import ReportBuilder
+
+
+def test_restore_merges_duplicate_periods_of_old_backups(db):
+    builder = ReportBuilder(db)
+    backup = io.StringIO()
+    builder.write_backup(backup)
+    data = json.loads(backup.getvalue())
+
+    # Before results were unique: no history, rows without the period
+    # columns, and the same period saved twice in two spellings
+    del data['kpi_result_history']
+    results = [row[:9] for row in data['kpi_results']]
+    first = results[0]
+    kpi_id, period = first[2], first[3]
+    next_id = max(row[0] for row in results) + 1
+    results.append([next_id, 'older', kpi_id, period.replace('-0', '-'),
+                    1.0, 1.0, 'older', 'System', '2000-01-01T00:00:00'])
+    data['kpi_results'] = results
+    builder.restore_backup(data)
+
+    assert db.execute_query(
+        "SELECT id, note FROM kpi_results WHERE kpi_id = ? AND period = ?",
+        [kpi_id, period]) == [(first[0], first[6])]
+    assert db.execute_query(
+        "SELECT result_id, note FROM kpi_result_history") == [(first[0], 'older')]
+    assert db.check_kpi_rollups() == []
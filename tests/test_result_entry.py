@@ -0,0 +1,64 @@
+import tkinter as tk
+
+import pytest
+
+from result_entry import ResultBatchEntry, batch_rows, grid_entry, prepare_results
+
+
+PERIOD = '2024-03'
+
+
+@pytest.fixture(autouse=True)
+def saved_period(db):
+    """Save a result for PERIOD for every active KPI"""
+    rows, invalid = prepare_results(
+        [(kpi_id, target, '100', 'saved', None, None)
+         for kpi_id, _, _, _, target, _, _ in batch_rows(db, PERIOD)], PERIOD)
+    assert not invalid
+    with db.transaction():
+        db.upsert_many('kpi_results', rows, ('kpi_id', 'period'))
+
+
+def saved_results(db):
+    return db.execute_query(
+        "SELECT kpi_id, actual_value, note FROM kpi_results WHERE period = ? ORDER BY kpi_id",
+        [PERIOD])
+
+
+def test_saving_loaded_period_with_values(db):
+    before = saved_results(db)
+    rows = list(batch_rows(db, PERIOD))
+    # Tk hands back the saved REAL actual values as floats
+    entries = [grid_entry(kpi_id, (target, actual, note), actual, note)
+               for kpi_id, _, _, _, target, actual, note in rows]
+    assert prepare_results(entries, PERIOD) == ([], [])
+
+    kpi_id, target = rows[0][0], rows[0][4]
+    entries[0] = grid_entry(kpi_id, (target, 100.0, 'saved'), '120', 'corrected')
+    changed, invalid = prepare_results(entries, PERIOD)
+    assert not invalid
+    assert [(row['kpi_id'], row['actual_value'], row['note']) for row in changed] == \
+        [(kpi_id, 120.0, 'corrected')]
+    with db.transaction():
+        db.upsert_many('kpi_results', changed, ('kpi_id', 'period'))
+
+    after = saved_results(db)
+    assert len(after) == len(before)
+    assert after[0] == (kpi_id, 120.0, 'corrected')
+    assert after[1:] == before[1:]
+
+
+def test_grid_saves_loaded_period(db):
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display")
+    try:
+        grid = ResultBatchEntry(root, db, PERIOD)
+        first = grid.tree.get_children()[0]
+        grid.tree.set(first, "Thực Tế", "120")
+        grid.save_all()
+        assert grid.status_var.get() == f"Đã lưu 1 kết quả cho kỳ {PERIOD}"
+        assert saved_results(db)[0][1] == 120.0
+    finally:
+        root.destroy()
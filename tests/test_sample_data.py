@@ -0,0 +1,38 @@
+import uuid
+
+from database_manager import DatabaseManager
+
+
+def table_counts(db):
+    return {table: db.execute_query(f"SELECT COUNT(*) FROM {table}")[0][0]
+            for table in DatabaseManager.SAMPLE_TABLES}
+
+
+def test_sample_data_skips_databases_with_rows(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'test.db'))
+    try:
+        db.insert_data('kpi_categories', {'uuid': str(uuid.uuid4()), 'category_name': 'Riêng'})
+        db.load_sample_data()
+        assert table_counts(db) == dict.fromkeys(DatabaseManager.SAMPLE_TABLES, 0) | {'kpi_categories': 1}
+    finally:
+        db.close()
+
+
+def test_failed_sample_load_leaves_nothing_behind(tmp_path, monkeypatch):
+    db = DatabaseManager(str(tmp_path / 'test.db'))
+    insert_many = db.insert_many
+
+    def failing_insert_many(table, rows, *args, **kwargs):
+        if table == 'kpi':
+            raise RuntimeError("disk full")
+        return insert_many(table, rows, *args, **kwargs)
+
+    monkeypatch.setattr(db, 'insert_many', failing_insert_many)
+    try:
+        db.load_sample_data()
+        assert table_counts(db) == dict.fromkeys(DatabaseManager.SAMPLE_TABLES, 0)
+        monkeypatch.undo()
+        db.load_sample_data()
+        assert all(table_counts(db).values())
+    finally:
+        db.close()
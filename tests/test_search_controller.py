@@ -0,0 +1,94 @@
+import threading
+import time
+
+from search_controller import SearchController
+
+
+ENDLESS = ("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+           "SELECT COUNT(*) FROM n")
+
+
+class FakeWidget:
+    """Stands in for a Tk widget: after() callbacks run when the test says"""
+
+    def __init__(self):
+        self.pending = {}
+        self.timers = 0
+
+    def after(self, ms, callback):
+        self.timers += 1
+        self.pending[self.timers] = callback
+        return self.timers
+
+    def after_cancel(self, timer):
+        self.pending.pop(timer, None)
+
+    def run_pending(self):
+        callbacks = list(self.pending.values())
+        self.pending.clear()
+        for callback in callbacks:
+            callback()
+
+
+def settle(widget, controller, timeout=5):
+    """Poll like the Tk main loop until every search has finished"""
+    deadline = time.monotonic() + timeout
+    while controller._in_flight or widget.pending:
+        assert time.monotonic() < deadline, "search did not finish"
+        time.sleep(0.01)
+        widget.run_pending()
+
+
+def test_typing_runs_one_search():
+    widget, searches, shown = FakeWidget(), [], []
+    controller = SearchController(widget, lambda cancelled: searches.append(1) or [len(searches)],
+                                  shown.append)
+    for _ in range(3):
+        controller.schedule()
+    assert len(widget.pending) == 1 and controller.busy
+
+    settle(widget, controller)
+    assert searches == [1] and shown == [[1]]
+    assert not controller.busy
+
+
+def test_superseded_search_is_cancelled_and_dropped():
+    widget, shown, release, checks = FakeWidget(), [], threading.Event(), []
+
+    def slow(cancelled):
+        release.wait(5)
+        checks.append(cancelled())
+        yield 'stale'
+
+    fetches = iter([slow, lambda cancelled: iter(['fresh'])])
+    controller = SearchController(widget, lambda cancelled: next(fetches)(cancelled), shown.append)
+    controller.search_now()
+    controller.search_now()
+    release.set()
+
+    settle(widget, controller)
+    assert checks == [True]
+    assert shown == [['fresh']]
+
+
+def test_superseded_query_is_interrupted(db):
+    widget, shown = FakeWidget(), []
+    queries = iter([ENDLESS, "SELECT COUNT(*) FROM staff"])
+    controller = SearchController(
+        widget, lambda cancelled: db.iter_query(next(queries), cancelled=cancelled), shown.append)
+    controller.search_now()
+    time.sleep(0.05)
+    controller.search_now()
+
+    settle(widget, controller)
+    assert shown == [db.execute_query("SELECT COUNT(*) FROM staff")]
+
+
+def test_cancel_drops_running_search():
+    widget, shown = FakeWidget(), []
+    controller = SearchController(widget, lambda cancelled: iter(['rows']), shown.append)
+    controller.search_now()
+    controller.cancel()
+
+    settle(widget, controller)
+    assert shown == []
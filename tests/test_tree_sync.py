@@ -0,0 +1,71 @@
+import random
+import sqlite3
+from itertools import combinations
+
+import pytest
+
+from tree_sync import increasing_run, keyset_page
+
+
+ORDER = ['score', 'id']
+ANCHOR = "SELECT score, id FROM rows WHERE id = ?"
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE rows (id INTEGER PRIMARY KEY, score INTEGER)")
+    # Scores repeat, so pages must fall back on id to break ties
+    conn.executemany("INSERT INTO rows VALUES (?, ?)", [(i, i * 7 % 5) for i in range(1, 24)])
+    yield conn
+    conn.close()
+
+
+def page(conn, descending=False, after=None, before=None, limit=5):
+    condition, params, order_by = keyset_page(ORDER, ANCHOR, descending, after, before, limit)
+    return [row[0] for row in conn.execute(
+        f"SELECT id FROM rows WHERE {condition} {order_by}", params)]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_keyset_pages_follow_full_order(conn, descending):
+    direction = 'DESC' if descending else 'ASC'
+    expected = [row[0] for row in conn.execute(
+        f"SELECT id FROM rows ORDER BY score {direction}, id {direction}")]
+
+    pages = [page(conn, descending)]
+    while len(pages[-1]) == 5:
+        pages.append(page(conn, descending, after=pages[-1][-1]))
+    assert sum(pages, []) == expected
+
+    # Paging back from each page's first row gives the page before it,
+    # nearest row first
+    for previous, current in zip(pages, pages[1:]):
+        assert page(conn, descending, before=current[0]) == previous[::-1]
+
+
+def test_keyset_page_without_anchor_or_limit():
+    assert keyset_page(ORDER, ANCHOR) == ("1", [], "ORDER BY score ASC, id ASC")
+    assert keyset_page(ORDER, ANCHOR, descending=True, after=3, limit=10) == \
+        (f"(score, id) < ({ANCHOR})", [3], "ORDER BY score DESC, id DESC LIMIT 10")
+
+
+def longest_increasing(values):
+    for size in range(len(values), 0, -1):
+        for positions in combinations(range(len(values)), size):
+            if all(values[a] < values[b] for a, b in zip(positions, positions[1:])):
+                return size
+    return 0
+
+
+def test_increasing_run():
+    assert increasing_run([]) == set()
+    assert increasing_run([3, 3, 3]) in ({0}, {1}, {2})
+    assert increasing_run([1, 2, 5, 3, 4]) == {0, 1, 3, 4}
+
+    rng = random.Random(0)
+    for _ in range(200):
+        values = [rng.randrange(6) for _ in range(rng.randrange(9))]
+        run = sorted(increasing_run(values))
+        assert all(values[a] < values[b] for a, b in zip(run, run[1:]))
+        assert len(run) == longest_increasing(values)
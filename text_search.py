@@ -0,0 +1,55 @@
+import re
+import unicodedata
+
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Column weights for bm25(); a code hit outranks a name hit, which
+# outranks a description hit
+KPI_FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def fts5_available(conn):
+    """Whether this SQLite build has the FTS5 extension"""
+    options = {row[0] for row in conn.execute("PRAGMA compile_options")}
+    return 'ENABLE_FTS5' in options
+
+
+def fts_prefix_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix.
+
+    Words are quoted, so FTS5 operators and punctuation typed into the
+    search box are treated as plain text. Returns None if text has no words.
+    """
+    tokens = TOKEN_PATTERN.findall(text)
+    if not tokens:
+        return None
+    return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+# Share of the query's trigrams a name must contain to count as a match
+TRIGRAM_MIN_SIMILARITY = 0.5
+
+
+def normalize_text(text):
+    """Lowercase text, strip diacritics and collapse it to space-separated words.
+
+    Vietnamese đ has no combining-mark decomposition, so it is mapped to d
+    explicitly: "Nguyễn Văn Đức" becomes "nguyen van duc".
+    """
+    decomposed = unicodedata.normalize('NFD', text or '').replace('đ', 'd').replace('Đ', 'D')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return ' '.join(TOKEN_PATTERN.findall(stripped.lower()))
+
+
+def trigrams(text):
+    """Return the set of padded three-letter windows over each normalized word.
+
+    Words are padded with two leading spaces and one trailing space, so word
+    starts weigh more and one- or two-letter words still produce trigrams.
+    """
+    grams = set()
+    for word in normalize_text(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
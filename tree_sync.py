@@ -0,0 +1,357 @@
+from bisect import bisect_left, insort
+
+
+def placeholders(values):
+    """Return '?, ?, ...' for an IN list over values"""
+    return ', '.join('?' * len(values))
+
+
+def keyset_page(order, anchor, descending=False, after=None, before=None, limit=None):
+    """Return (condition, params, order_by) for one keyset-paginated page.
+
+    order lists the sort expressions, ending in a unique one; anchor is a
+    query selecting the same expressions for the row whose id is its only
+    parameter. The page holds the rows following the row id after or, when
+    before is given, the rows preceding before, nearest first. Unlike
+    OFFSET, each page is an index range scan from the anchor row.
+    """
+    key = f"({', '.join(order)})"
+    condition, params = "1", []
+    if after is not None:
+        condition, params = f"{key} {'<' if descending else '>'} ({anchor})", [after]
+    elif before is not None:
+        condition, params = f"{key} {'>' if descending else '<'} ({anchor})", [before]
+    direction = 'DESC' if descending != (before is not None) else 'ASC'
+    order_by = "ORDER BY " + ", ".join(f"{expression} {direction}" for expression in order)
+    if limit is not None:
+        order_by += f" LIMIT {int(limit)}"
+    return condition, params, order_by
+
+
+def sort_order(sort, columns, tiebreak):
+    """Return (order, descending) for keyset_page from a ColumnSorter order.
+
+    columns holds the SQL sort expression of each display column and
+    tiebreak a unique one, which keeps equal values in a stable order.
+    """
+    column, descending = sort
+    expression = columns[column]
+    return ([expression] if expression == tiebreak else [expression, tiebreak]), descending
+
+
+def increasing_run(values):
+    """Return the positions of one longest strictly increasing subsequence"""
+    tails, tail_positions, previous = [], [], [None] * len(values)
+    for position, value in enumerate(values):
+        i = bisect_left(tails, value)
+        if i == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[i] = value
+            tail_positions[i] = position
+        previous[position] = tail_positions[i - 1] if i else None
+    run = set()
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        run.add(position)
+        position = previous[position]
+    return run
+
+
+def upsert_row(tree, iid, values, sort_column=None, index=0):
+    """Insert or update one Treeview row.
+
+    With sort_column, rows are kept ascending by that value; without it new
+    rows go to index, the top by default for lists ordered newest first.
+    """
+    if tree.exists(iid):
+        old_values = tree.item(iid, 'values')
+        tree.item(iid, values=values)
+        if sort_column is None or str(old_values[sort_column]) == str(values[sort_column]):
+            return
+        tree.detach(iid)
+    if sort_column is not None:
+        # Binary search reads O(log n) rows instead of the whole list
+        children = tree.get_children()
+        key = str(values[sort_column])
+        low, high = 0, len(children)
+        while low < high:
+            mid = (low + high) // 2
+            if str(tree.set(children[mid], tree['columns'][sort_column])) < key:
+                low = mid + 1
+            else:
+                high = mid
+        index = low
+    if tree.exists(iid):
+        tree.move(iid, '', index)
+    else:
+        tree.insert('', index, iid=iid, values=values)
+
+
+def patch_rows(tree, keys, rows, sort_column=None):
+    """Apply re-queried (id, *values) rows for keys to a Treeview.
+
+    Keys without a row were deleted or no longer match the list's filters.
+    """
+    found = set()
+    added = 0
+    for row in rows:
+        found.add(row[0])
+        if not tree.exists(row[0]):
+            added += 1
+        # Unsorted new rows keep the query's order at the top of the list
+        upsert_row(tree, row[0], row[1:], sort_column, index=max(added - 1, 0))
+    for key in keys:
+        if key not in found and tree.exists(key):
+            tree.delete(key)
+
+
+class ChoiceList:
+    """Sorted combobox choices kept in sync with one table.
+
+    query selects id, sort key and display text and contains a {where}
+    placeholder; change events re-run it only for the rows they name.
+    Reads go through the result cache, so lists built from the same query,
+    such as the department choices of several tabs, read the table once.
+    """
+
+    def __init__(self, db, table, query):
+        self.db = db
+        self.query = query
+        self._widgets = []
+        self._entries = {}
+        self._sorted = []
+        self.reload()
+        db.subscribe(self.on_change, [table])
+
+    def attach(self, widget, prefix=()):
+        """Fill widget's values, prefix entries first, and keep them current"""
+        self._widgets.append((widget, list(prefix)))
+        widget['values'] = list(prefix) + self.values()
+
+    def values(self):
+        """Display strings in sort order"""
+        return [entry[1] for entry in self._sorted]
+
+    def reload(self):
+        """Re-read every choice"""
+        rows = self.db.cached_query(self.query.format(where='1'))
+        self._entries = {row[0]: (row[1] or '', row[2]) for row in rows}
+        self._sorted = sorted(self._entries.values())
+        self._push()
+
+    def on_change(self, event):
+        """Patch the choices named by a change event"""
+        if event.keys is None:
+            self.reload()
+            return
+        keys = list(event.keys)
+        for key in keys:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                del self._sorted[bisect_left(self._sorted, entry)]
+        if event.operation != 'delete' and keys:
+            rows = self.db.cached_query(
+                self.query.format(where=f"id IN ({placeholders(keys)})"), keys)
+            for row in rows:
+                entry = self._entries[row[0]] = (row[1] or '', row[2])
+                insort(self._sorted, entry)
+        self._push()
+
+    def _push(self):
+        values = self.values()
+        for widget, prefix in self._widgets:
+            widget['values'] = prefix + values
+
+
+class ColumnSorter:
+    """Click-to-sort Treeview headings.
+
+    order is None for the list's default order, otherwise (column index,
+    descending); clicking a heading sorts by it, clicking it again flips the
+    direction. on_change() is called after every click to reload the list.
+    """
+
+    ARROWS = (" ▲", " ▼")
+
+    def __init__(self, tree, on_change):
+        self.tree = tree
+        self.on_change = on_change
+        self.order = None
+        self._titles = [tree.heading(column, 'text') for column in tree['columns']]
+        for index, column in enumerate(tree['columns']):
+            tree.heading(column, command=lambda index=index: self.sort_by(index))
+
+    def sort_by(self, index):
+        """Sort by column index, flipping the direction if it already is"""
+        descending = self.order is not None and self.order == (index, False)
+        self.order = (index, descending)
+        for i, column in enumerate(self.tree['columns']):
+            arrow = self.ARROWS[descending] if i == index else ""
+            self.tree.heading(column, text=self._titles[i] + arrow)
+        self.on_change()
+
+
+class VirtualTreeList:
+    """Treeview showing an ordered query a few pages at a time.
+
+    fetch(after=None, before=None, limit=None) returns (id, *values) rows
+    in list order following the row id after or, nearest first, preceding
+    the row id before (see keyset_page). Only the first page is read on
+    show; scrolling near either end loads the next page there and drops
+    rows beyond max_pages from the other end, so refresh time and memory
+    do not grow with the table.
+
+    New contents are applied as a diff against the rows on screen, so
+    unchanged rows keep their selection and the view keeps its position.
+    The values last written to each row are kept here, because reading
+    them back from Tk turns numeric-looking text such as "0912" into ints.
+    Rows are keyed by their id as text, the form Tk returns iids in.
+    """
+
+    def __init__(self, tree, scrollbar, fetch, page_size=100, max_pages=5, margin=0.1):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.fetch = fetch
+        self.page_size = page_size
+        self.max_rows = page_size * max_pages
+        self.margin = margin
+        self.at_start = self.at_end = True
+        self._above = None
+        self._shown = {}
+        self._pending = None
+        tree.configure(yscrollcommand=self._on_scroll)
+
+    def show(self, rows):
+        """Make a first page of at most page_size rows the contents"""
+        self._sync(rows)
+        self.at_start, self._above = True, None
+        self.at_end = len(rows) < self.page_size
+
+    def reload(self):
+        """Show the first page again"""
+        self.show(list(self.fetch(limit=self.page_size)))
+
+    def refresh(self):
+        """Re-read the loaded window and apply only what changed"""
+        count = max(len(self._shown), self.page_size)
+        rows = []
+        if not self.at_start:
+            rows = list(self.fetch(after=self._above, limit=count))
+        if not rows:
+            # Also reached when the row above the window has been deleted
+            rows = list(self.fetch(limit=count))
+            self.at_start, self._above = True, None
+        self._sync(rows)
+        self.at_end = len(rows) < count
+
+    def patch(self, keys, rows, sort_column=None):
+        """patch_rows() limited to the loaded window.
+
+        Rows that sort outside the loaded pages are left out, or removed if
+        shown, and appear when scrolling reaches them.
+        """
+        rows = [row for row in rows if self._in_window(row, sort_column)]
+        patch_rows(self.tree, keys, rows, sort_column)
+        for row in rows:
+            self._shown[str(row[0])] = self._display(row)
+        for key in keys:
+            if not self.tree.exists(key):
+                self._shown.pop(str(key), None)
+
+    def _display(self, row):
+        return tuple(str(value) for value in row[1:])
+
+    def _sync(self, rows):
+        """Turn the shown rows into rows with as few Tk calls as possible.
+
+        Rows kept in place are those of a longest run already in the new
+        order; only the others are moved, so a single edit costs O(1)
+        inserts, updates and moves however long the list is.
+        """
+        wanted = {str(row[0]): i for i, row in enumerate(rows)}
+        stale = [iid for iid in self.tree.get_children() if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                self._shown.pop(iid, None)
+        current = self.tree.get_children()
+        kept = {current[i] for i in increasing_run([wanted[iid] for iid in current])}
+        moved = [iid for iid in current if iid not in kept]
+        if moved:
+            self.tree.detach(*moved)
+        for index, row in enumerate(rows):
+            iid, display = str(row[0]), self._display(row)
+            if iid not in self._shown:
+                self.tree.insert("", index, iid=iid, values=row[1:])
+            else:
+                if self._shown[iid] != display:
+                    self.tree.item(iid, values=row[1:])
+                if iid not in kept:
+                    self.tree.move(iid, "", index)
+            self._shown[iid] = display
+
+    def _in_window(self, row, sort_column):
+        if sort_column is None:
+            # Unsorted lists put new rows on top, which is only loaded at the start
+            return self.at_start or self.tree.exists(row[0])
+        children = self.tree.get_children()
+        if not children:
+            return self.at_start and self.at_end
+        value = str(row[sort_column + 1])
+        return ((self.at_start or value >= self._shown[children[0]][sort_column]) and
+                (self.at_end or value <= self._shown[children[-1]][sort_column]))
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        near_end = float(last) >= 1 - self.margin and not self.at_end
+        near_start = float(first) <= self.margin and not self.at_start
+        if (near_end or near_start) and self._pending is None:
+            self._pending = self.tree.after_idle(self._load_more)
+
+    def _drop(self, iids):
+        self.tree.delete(*iids)
+        for iid in iids:
+            del self._shown[iid]
+
+    def _load_more(self):
+        """Load a page at whichever end of the window the view is near"""
+        self._pending = None
+        children = self.tree.get_children()
+        if not children:
+            return
+        first, last = (float(f) for f in self.tree.yview())
+        top = children[min(int(first * len(children)), len(children) - 1)]
+        if last >= 1 - self.margin and not self.at_end:
+            rows = list(self.fetch(after=children[-1], limit=self.page_size))
+            for row in rows:
+                if str(row[0]) not in self._shown:
+                    self.tree.insert("", "end", iid=row[0], values=row[1:])
+                    self._shown[str(row[0])] = self._display(row)
+            self.at_end = len(rows) < self.page_size
+            children = self.tree.get_children()
+            if len(children) > self.max_rows:
+                dropped = children[:len(children) - self.max_rows]
+                self._drop(dropped)
+                self.at_start, self._above = False, dropped[-1]
+        elif first <= self.margin and not self.at_start:
+            # One extra row tells whether the start was reached and, if not,
+            # which row is just above the window
+            rows = list(self.fetch(before=children[0], limit=self.page_size + 1))
+            self.at_start = len(rows) <= self.page_size
+            self._above = None if self.at_start else rows.pop()[0]
+            for row in rows:
+                if str(row[0]) not in self._shown:
+                    self.tree.insert("", 0, iid=row[0], values=row[1:])
+                    self._shown[str(row[0])] = self._display(row)
+            children = self.tree.get_children()
+            if len(children) > self.max_rows:
+                self._drop(children[self.max_rows:])
+                self.at_end = False
+        else:
+            return
+        # Keep the row that was at the top of the view in place
+        if self.tree.exists(top):
+            children = self.tree.get_children()
+            self.tree.yview_moveto(self.tree.index(top) / len(children))